@@ -0,0 +1,190 @@
+"""Run the bot as several worker processes, each owning a contiguous range of shards.
+
+    python cluster.py            start the cluster (CLUSTER_PROCESSES workers)
+    python cluster.py stats      ask every running worker for its stats
+    python cluster.py reload     make every worker re-read the config now
+    python cluster.py flush      make every worker write pending config changes
+
+Workers share the SQLite config backend; each one only writes the guilds of its own
+shards. The launcher restarts workers that exit and relays commands over a local
+JSON-lines socket (127.0.0.1:CLUSTER_IPC_PORT). Every line carries CLUSTER_IPC_TOKEN,
+which must be set in the environment of both the launcher and the CLI.
+"""
+import asyncio
+import hmac
+import itertools
+import json
+import logging
+import os
+import socket
+import sys
+
+import requests
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+CLUSTER_PROCESSES = int(os.getenv("CLUSTER_PROCESSES", "2"))
+CLUSTER_IPC_PORT = int(os.getenv("CLUSTER_IPC_PORT", "47650"))
+CLUSTER_IPC_TOKEN = os.getenv("CLUSTER_IPC_TOKEN", "")
+# How long a command waits for the workers' answers.
+CLUSTER_COMMAND_TIMEOUT_SECONDS = 10.0
+# Delay before restarting a worker that exited (doubles on quick crashes, up to 5 minutes).
+CLUSTER_RESTART_DELAY_SECONDS = 5.0
+
+DISCORD_API_BASE = "https://discord.com/api/v10"
+
+_workers: dict[str, asyncio.StreamWriter] = {}
+_pending: dict[int, dict] = {}  # request id -> {"future", "replies", "expected"}
+_request_ids = itertools.count(1)
+
+
+def _recommended_shard_count(token: str) -> int:
+    """Discord's recommended shard count, or one shard per process if it can't be fetched."""
+    try:
+        r = requests.get(f"{DISCORD_API_BASE}/gateway/bot", headers={"Authorization": f"Bot {token}"}, timeout=10)
+        r.raise_for_status()
+        return int(r.json()["shards"])
+    except Exception as e:
+        logger.error(f"Could not fetch recommended shard count: {e}")
+        return CLUSTER_PROCESSES
+
+
+def _shard_ranges(shard_count: int, processes: int) -> list[list[int]]:
+    """Split 0..shard_count-1 into `processes` contiguous, near-equal ranges."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def _broadcast(op: str) -> list:
+    """Send `op` to every connected worker and collect their answers."""
+    request_id = next(_request_ids)
+    pending = {"future": asyncio.get_running_loop().create_future(), "replies": [], "expected": len(_workers)}
+    _pending[request_id] = pending
+    line = json.dumps({"id": request_id, "op": op, "token": CLUSTER_IPC_TOKEN}).encode() + b"\n"
+    for writer in list(_workers.values()):
+        try:
+            writer.write(line)
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Cluster command send error: {e}")
+            pending["expected"] -= 1
+    try:
+        if len(pending["replies"]) < pending["expected"]:
+            await asyncio.wait_for(pending["future"], CLUSTER_COMMAND_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Cluster command {op}: {len(pending['replies'])}/{pending['expected']} workers answered")
+    finally:
+        _pending.pop(request_id, None)
+    return pending["replies"]
+
+
+async def _handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """A worker registers with {"op": "hello"}; anything else is a command from the CLI."""
+    cluster_id = None
+    try:
+        first = await reader.readline()
+        if not first:
+            return
+        message = json.loads(first)
+        if not hmac.compare_digest(str(message.get("token", "")), CLUSTER_IPC_TOKEN):
+            logger.warning("Cluster IPC: rejected a connection with a wrong token")
+            return
+        if message.get("op") != "hello":
+            replies = await _broadcast(str(message.get("op")))
+            writer.write(json.dumps(sorted(replies, key=lambda r: str(r.get("cluster")))).encode() + b"\n")
+            await writer.drain()
+            return
+
+        cluster_id = str(message.get("cluster"))
+        _workers[cluster_id] = writer
+        logger.info(f"Cluster {cluster_id} connected")
+        while line := await reader.readline():
+            reply = json.loads(line)
+            pending = _pending.get(reply.get("id"))
+            if pending is None:
+                continue
+            pending["replies"].append(reply)
+            if len(pending["replies"]) >= pending["expected"] and not pending["future"].done():
+                pending["future"].set_result(None)
+    except Exception as e:
+        logger.error(f"Cluster IPC connection error: {e}")
+    finally:
+        if cluster_id is not None and _workers.get(cluster_id) is writer:
+            del _workers[cluster_id]
+            logger.info(f"Cluster {cluster_id} disconnected")
+        writer.close()
+
+
+async def _run_worker(cluster_id: int, shard_ids: list[int], shard_count: int):
+    """Keep one worker process running, restarting it when it exits."""
+    env = dict(os.environ)
+    env.update(
+        {
+            "CLUSTER_ID": str(cluster_id),
+            "CLUSTER_IPC_PORT": str(CLUSTER_IPC_PORT),
+            "SHARD_COUNT": str(shard_count),
+            "SHARD_IDS": ",".join(str(s) for s in shard_ids),
+            "CONFIG_BACKEND": "sqlite",
+            "CLUSTER_IPC_TOKEN": CLUSTER_IPC_TOKEN,
+        }
+    )
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "start_bot.py")
+    delay = CLUSTER_RESTART_DELAY_SECONDS
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        logger.info(f"Starting cluster {cluster_id} (shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count})")
+        proc = await asyncio.create_subprocess_exec(sys.executable, script, env=env)
+        code = await proc.wait()
+        # A worker that ran for a while gets a fresh backoff.
+        delay = CLUSTER_RESTART_DELAY_SECONDS if loop.time() - started > 300 else min(delay * 2, 300.0)
+        logger.error(f"Cluster {cluster_id} exited with code {code}; restarting in {delay:.0f}s")
+        await asyncio.sleep(delay)
+
+
+async def run_cluster():
+    token = os.getenv("DISCORD_BOT_TOKEN")
+    if not token:
+        raise RuntimeError("DISCORD_BOT_TOKEN is not set")
+    if not CLUSTER_IPC_TOKEN:
+        raise RuntimeError("CLUSTER_IPC_TOKEN is not set (any long random string, also needed by the CLI)")
+    if os.getenv("CONFIG_BACKEND", "sqlite").strip().lower() != "sqlite":
+        logger.warning("Cluster mode always uses CONFIG_BACKEND=sqlite for its workers")
+
+    shard_count = int(os.getenv("SHARD_COUNT") or 0) or _recommended_shard_count(token)
+    ranges = _shard_ranges(shard_count, CLUSTER_PROCESSES)
+
+    server = await asyncio.start_server(_handle_connection, "127.0.0.1", CLUSTER_IPC_PORT)
+    logger.info(f"Cluster: {shard_count} shards over {len(ranges)} processes, IPC on port {CLUSTER_IPC_PORT}")
+    async with server:
+        await asyncio.gather(*(_run_worker(i, shard_ids, shard_count) for i, shard_ids in enumerate(ranges)))
+
+
+def send_command(op: str) -> list:
+    """Send a command to a running cluster launcher and return the workers' answers."""
+    with socket.create_connection(("127.0.0.1", CLUSTER_IPC_PORT), timeout=CLUSTER_COMMAND_TIMEOUT_SECONDS + 5) as sock:
+        sock.sendall(json.dumps({"op": op, "token": CLUSTER_IPC_TOKEN}).encode() + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data) if data else []
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(json.dumps(send_command(sys.argv[1]), indent=2, ensure_ascii=False))
+    else:
+        asyncio.run(run_cluster())
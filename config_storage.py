@@ -0,0 +1,592 @@
+"""Crash-safe storage for poem_config.json.
+
+Shared by the bot (main.py) and the Flask dashboards so every writer goes through
+the same file lock and the same atomic temp-file + fsync + rename sequence.
+"""
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Number of rotated snapshots kept next to the config (poem_config.json.1 is newest).
+CONFIG_SNAPSHOT_COUNT = int(os.getenv("CONFIG_SNAPSHOT_COUNT", "5"))
+# Minimum age of the newest snapshot before a new one is taken, so bursts of writes
+# (ticket counters, giveaways) don't rotate every good copy out within seconds.
+CONFIG_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("CONFIG_SNAPSHOT_INTERVAL_SECONDS", "300"))
+# How long a writer waits for another process to release the lock.
+CONFIG_LOCK_TIMEOUT_SECONDS = 10.0
+
+# flock/msvcrt locks are per process; this serializes threads inside one process.
+_thread_lock = threading.RLock()
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_path(path: str) -> str:
+    return f"{path}.lock"
+
+
+def snapshot_path(path: str, index: int) -> str:
+    return f"{path}.{index}"
+
+
+@contextmanager
+def config_lock(path: str, timeout: float = CONFIG_LOCK_TIMEOUT_SECONDS):
+    """Hold an exclusive lock on `path` across threads and processes."""
+    with _thread_lock:
+        fd = os.open(_lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    else:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for lock on {path}")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+def _fsync_dir(path: str):
+    if os.name != "posix":
+        return
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _rotate_snapshots(path: str):
+    """Shift path.1..path.N-1 up by one and capture the current file as path.1."""
+    if CONFIG_SNAPSHOT_COUNT <= 0 or not os.path.exists(path):
+        return
+    newest = snapshot_path(path, 1)
+    try:
+        if time.time() - os.path.getmtime(newest) < CONFIG_SNAPSHOT_INTERVAL_SECONDS:
+            return
+    except OSError:
+        pass
+
+    for i in range(CONFIG_SNAPSHOT_COUNT - 1, 0, -1):
+        src = snapshot_path(path, i)
+        if os.path.exists(src):
+            os.replace(src, snapshot_path(path, i + 1))
+
+    # A hard link keeps the old inode alive after the rename below - no copy needed.
+    try:
+        os.link(path, newest)
+    except OSError:
+        shutil.copy2(path, newest)
+
+
+def write_config_text(path: str, text: str, *, locked: bool = False):
+    """Atomically replace `path` with `text` (temp file + fsync + rename).
+
+    Pass locked=True when the caller already holds config_lock(path).
+    """
+    if not locked:
+        with config_lock(path):
+            write_config_text(path, text, locked=True)
+        return
+
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            _rotate_snapshots(path)
+        except OSError as e:
+            logger.warning(f"Config snapshot rotation failed: {e}")
+        os.replace(tmp_path, path)
+        _fsync_dir(path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def write_config(path: str, config: dict):
+    write_config_text(path, json.dumps(config, indent=4, ensure_ascii=False))
+
+
+def read_config(path: str) -> dict | None:
+    """Parse `path`, falling back to the newest readable snapshot if it is corrupt.
+
+    Returns None when neither the file nor any snapshot exists.
+    """
+    candidates = [path] + [snapshot_path(path, i) for i in range(1, CONFIG_SNAPSHOT_COUNT + 1)]
+    for candidate in candidates:
+        if not os.path.exists(candidate):
+            continue
+        try:
+            with open(candidate, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+            if not isinstance(cfg, dict):
+                raise ValueError("config root is not an object")
+            if candidate != path:
+                logger.error(f"Config file {path} is unreadable; recovered from snapshot {candidate}")
+            return cfg
+        except Exception as e:
+            logger.error(f"Error loading config from {candidate}: {e}")
+    return None
+
+
+
+def modify_config(path: str, change, default: dict | None = None) -> dict:
+    """Read `path`, apply `change(cfg)` in place and write it back under one config_lock.
+
+    Holding the lock across the whole read-modify-write means a change another process
+    saved between a caller's earlier read and this save is not overwritten.
+    """
+    with config_lock(path):
+        cfg = read_config(path)
+        if cfg is None:
+            cfg = copy.deepcopy(default) if default is not None else {}
+        change(cfg)
+        write_config_text(path, json.dumps(cfg, indent=4, ensure_ascii=False), locked=True)
+    return cfg
+
+# ---------------- SQLite backend ----------------
+# Optional: CONFIG_BACKEND=sqlite stores one row per guild so a change rewrites only
+# that guild instead of the whole JSON file. The first start migrates poem_config.json.
+
+CONFIG_BACKEND = os.getenv("CONFIG_BACKEND", "json").strip().lower()
+CONFIG_DB_FILE = os.getenv("CONFIG_DB_FILE", "poem_config.db")
+
+
+def _sqlite_connect(db_path: str):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path, timeout=CONFIG_LOCK_TIMEOUT_SECONDS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS guilds ("
+        "guild_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS guilds_updated_at ON guilds (updated_at)")
+    # Top-level keys other than "servers" (old single-server format, flags).
+    conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def sqlite_mtime(db_path: str) -> float | None:
+    """Latest modification time of the database, including its WAL file."""
+    times = []
+    for p in (db_path, f"{db_path}-wal"):
+        try:
+            times.append(os.stat(p).st_mtime)
+        except OSError:
+            pass
+    return max(times) if times else None
+
+
+def _dumps_compact(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _read_sqlite_rows(conn) -> tuple[dict[str, str], dict[str, str], bool]:
+    """Raw (settings, guild rows, migrated flag) as stored."""
+    settings = dict(conn.execute("SELECT key, data FROM settings").fetchall())
+    guilds = dict(conn.execute("SELECT guild_id, data FROM guilds").fetchall())
+    migrated = conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None
+    return settings, guilds, migrated
+
+
+def _config_from_rows(settings: dict[str, str], guilds: dict[str, str], migrated: bool) -> dict | None:
+    cfg = {key: json.loads(data) for key, data in settings.items()}
+    if guilds or "servers" in cfg:
+        cfg["servers"] = {gid: json.loads(data) for gid, data in guilds.items()}
+    if not cfg and not migrated:
+        return None
+    return cfg
+
+
+def _config_to_rows(config: dict) -> tuple[dict[str, str], dict[str, str]]:
+    """Split a config into (settings rows, guild rows) of compact JSON."""
+    servers = config.get("servers") if isinstance(config.get("servers"), dict) else {}
+    settings = {k: _dumps_compact(v) for k, v in config.items() if k != "servers"}
+    if "servers" in config:
+        # Marker so an empty multi-server config doesn't read back as the old format.
+        settings["servers"] = "{}"
+    return settings, {str(g): _dumps_compact(v) for g, v in servers.items()}
+
+
+def read_sqlite_config(db_path: str) -> dict | None:
+    """Load the whole config from SQLite in the same shape as poem_config.json."""
+    conn = _sqlite_connect(db_path)
+    try:
+        rows = _read_sqlite_rows(conn)
+    finally:
+        conn.close()
+    return _config_from_rows(*rows)
+
+
+def read_sqlite_guilds_since(db_path: str, since: float) -> list[tuple[str, str, float]]:
+    """Guild rows (guild_id, data, updated_at) written after `since`, oldest first."""
+    conn = _sqlite_connect(db_path)
+    try:
+        return conn.execute(
+            "SELECT guild_id, data, updated_at FROM guilds WHERE updated_at > ? ORDER BY updated_at", (since,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def write_sqlite_guilds(db_path: str, guilds: dict[str, str | None], settings: dict[str, str] | None = None):
+    """Upsert changed guild rows (None deletes the row) in one transaction.
+
+    When `settings` is given, the guild table and the settings table are replaced
+    wholesale: guilds not in `guilds` and settings not in `settings` are removed.
+    """
+    now = time.time()
+    conn = _sqlite_connect(db_path)
+    try:
+        with conn:
+            if settings is not None:
+                conn.execute("DELETE FROM settings")
+                conn.executemany("INSERT INTO settings (key, data) VALUES (?, ?)", list(settings.items()))
+                keep = [gid for gid, data in guilds.items() if data is not None]
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_guilds (guild_id TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM keep_guilds")
+                conn.executemany("INSERT OR IGNORE INTO keep_guilds (guild_id) VALUES (?)", [(g,) for g in keep])
+                conn.execute("DELETE FROM guilds WHERE guild_id NOT IN (SELECT guild_id FROM keep_guilds)")
+            conn.executemany(
+                "INSERT INTO guilds (guild_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(gid, data, now) for gid, data in guilds.items() if data is not None],
+            )
+            conn.executemany(
+                "DELETE FROM guilds WHERE guild_id = ?",
+                [(gid,) for gid, data in guilds.items() if data is None],
+            )
+    finally:
+        conn.close()
+
+
+def write_sqlite_config(db_path: str, config: dict):
+    """Replace the whole SQLite config with `config` (migration / bot full save)."""
+    settings, guilds = _config_to_rows(config)
+    write_sqlite_guilds(db_path, guilds, settings)
+
+
+def modify_sqlite_config(db_path: str, change, default: dict | None = None) -> dict:
+    """Read the config, apply `change(cfg)` and write back only what it changed.
+
+    Everything happens in one BEGIN IMMEDIATE transaction, so rows other writers commit
+    meanwhile wait for us instead of being lost. Only rows whose JSON changed are upserted
+    and only rows that were read and then removed by `change` are deleted.
+    """
+    conn = _sqlite_connect(db_path)
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old_settings, old_guilds, migrated = _read_sqlite_rows(conn)
+            cfg = _config_from_rows(old_settings, old_guilds, migrated)
+            if cfg is None:
+                cfg = copy.deepcopy(default) if default is not None else {}
+            change(cfg)
+            settings, guilds = _config_to_rows(cfg)
+
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO settings (key, data) VALUES (?, ?)",
+                [(k, v) for k, v in settings.items() if old_settings.get(k) != v],
+            )
+            conn.executemany(
+                "DELETE FROM settings WHERE key = ?", [(k,) for k in old_settings if k not in settings]
+            )
+            conn.executemany(
+                "INSERT INTO guilds (guild_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(gid, data, now) for gid, data in guilds.items() if old_guilds.get(gid) != data],
+            )
+            conn.executemany(
+                "DELETE FROM guilds WHERE guild_id = ?", [(gid,) for gid in old_guilds if gid not in guilds]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return cfg
+
+
+def migrate_json_to_sqlite(json_path: str, db_path: str) -> int:
+    """One-shot import of poem_config.json into SQLite. Returns the number of guilds imported.
+
+    Does nothing if the database already holds data or was migrated before.
+    """
+    conn = _sqlite_connect(db_path)
+    try:
+        has_rows = conn.execute("SELECT 1 FROM guilds LIMIT 1").fetchone() or conn.execute(
+            "SELECT 1 FROM settings LIMIT 1"
+        ).fetchone()
+        migrated = conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone()
+    finally:
+        conn.close()
+    if has_rows or migrated:
+        return 0
+
+    cfg = read_config(json_path)
+    if cfg is None:
+        return 0
+
+    write_sqlite_config(db_path, cfg)
+    conn = _sqlite_connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                (f"{os.path.abspath(json_path)} @ {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}",),
+            )
+    finally:
+        conn.close()
+    count = len(cfg.get("servers") or {}) if isinstance(cfg.get("servers"), dict) else 0
+    logger.info(f"Migrated {json_path} to {db_path} ({count} guilds)")
+    return count
+
+
+def load_full_config(json_path: str) -> dict | None:
+    """Read the config from the configured backend."""
+    if CONFIG_BACKEND == "sqlite":
+        migrate_json_to_sqlite(json_path, CONFIG_DB_FILE)
+        return read_sqlite_config(CONFIG_DB_FILE)
+    return read_config(json_path)
+
+
+def modify_full_config(json_path: str, change, default: dict | None = None) -> dict:
+    """Apply `change(cfg)` to the latest saved config of the configured backend and save it."""
+    if CONFIG_BACKEND == "sqlite":
+        migrate_json_to_sqlite(json_path, CONFIG_DB_FILE)
+        return modify_sqlite_config(CONFIG_DB_FILE, change, default)
+    return modify_config(json_path, change, default)
+
+
+def save_full_config(json_path: str, config: dict):
+    """Write the whole config to the configured backend."""
+    if CONFIG_BACKEND == "sqlite":
+        write_sqlite_config(CONFIG_DB_FILE, config)
+    else:
+        write_config(json_path, config)
+
+
+# ---------------- Ticket store ----------------
+# Ticket numbers and the open-ticket index live in their own small SQLite database (used
+# with either config backend). Opening or closing a ticket is a single row change instead
+# of a config rewrite, and two processes can never hand out the same number.
+
+TICKET_DB_FILE = os.getenv("TICKET_DB_FILE", "tickets.db")
+
+
+def _ticket_connect(db_path: str):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path, timeout=CONFIG_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute("CREATE TABLE IF NOT EXISTS ticket_sequences (guild_id TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS open_tickets ("
+        "channel_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, owner_id INTEGER NOT NULL, "
+        "category_id INTEGER, name TEXT NOT NULL, opened_at REAL NOT NULL)"
+    )
+    # Guilds whose open tickets were imported from channel topics once.
+    conn.execute("CREATE TABLE IF NOT EXISTS open_tickets_indexed (guild_id INTEGER PRIMARY KEY)")
+    return conn
+
+
+def next_ticket_number(db_path: str, guild_id: str, floor: int = 0) -> int:
+    """Atomically allocate the next ticket number for a guild.
+
+    `floor` is the last number already handed out elsewhere (the old config counter);
+    the sequence never goes below it.
+    """
+    conn = _ticket_connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO ticket_sequences (guild_id, value) VALUES (?, ?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET value = MAX(value, excluded.value - 1) + 1",
+                (guild_id, int(floor) + 1),
+            )
+            (value,) = conn.execute("SELECT value FROM ticket_sequences WHERE guild_id = ?", (guild_id,)).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return int(value)
+    finally:
+        conn.close()
+
+
+def load_open_tickets(db_path: str) -> tuple[list[tuple], set[int]]:
+    """All open-ticket rows (channel_id, guild_id, owner_id, category_id, name, opened_at)
+    and the ids of guilds already imported from topics."""
+    conn = _ticket_connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT channel_id, guild_id, owner_id, category_id, name, opened_at FROM open_tickets"
+        ).fetchall()
+        indexed = {gid for (gid,) in conn.execute("SELECT guild_id FROM open_tickets_indexed")}
+    finally:
+        conn.close()
+    return rows, indexed
+
+
+def save_open_ticket(db_path: str, row: tuple):
+    """Insert or update one open ticket (same column order as load_open_tickets)."""
+    conn = _ticket_connect(db_path)
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO open_tickets (channel_id, guild_id, owner_id, category_id, name, opened_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            row,
+        )
+    finally:
+        conn.close()
+
+
+def delete_open_tickets(db_path: str, channel_ids: list[int]):
+    conn = _ticket_connect(db_path)
+    try:
+        conn.executemany("DELETE FROM open_tickets WHERE channel_id = ?", [(c,) for c in channel_ids])
+    finally:
+        conn.close()
+
+
+def replace_open_tickets(db_path: str, guild_id: int, rows: list[tuple]):
+    """Replace a guild's open tickets (rebuild from topics) and mark it as imported."""
+    conn = _ticket_connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM open_tickets WHERE guild_id = ?", (guild_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO open_tickets (channel_id, guild_id, owner_id, category_id, name, opened_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("INSERT OR IGNORE INTO open_tickets_indexed (guild_id) VALUES (?)", (guild_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+# ---------------- Giveaway entrants ----------------
+# One row per (giveaway message, member) so a reaction changes a single row instead of
+# re-serializing the guild's config with every entrant list in it.
+
+GIVEAWAY_DB_FILE = os.getenv("GIVEAWAY_DB_FILE", "giveaways.db")
+
+
+def _giveaway_connect(db_path: str):
+    import sqlite3
+
+    conn = sqlite3.connect(db_path, timeout=CONFIG_LOCK_TIMEOUT_SECONDS, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS giveaway_entrants ("
+        "message_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (message_id, user_id)) WITHOUT ROWID"
+    )
+    return conn
+
+
+def load_giveaway_entrants(db_path: str, message_ids: list[int]) -> dict[int, set[int]]:
+    """Stored entrants of the given giveaways (every id gets a set, possibly empty)."""
+    result: dict[int, set[int]] = {int(m): set() for m in message_ids}
+    if not result:
+        return result
+    conn = _giveaway_connect(db_path)
+    try:
+        for message_id in result:
+            for (user_id,) in conn.execute(
+                "SELECT user_id FROM giveaway_entrants WHERE message_id = ?", (message_id,)
+            ):
+                result[message_id].add(int(user_id))
+    finally:
+        conn.close()
+    return result
+
+
+def apply_giveaway_entrant_changes(db_path: str, changes: dict[int, dict[int, bool]]):
+    """Add (True) or remove (False) entrants: {message_id: {user_id: entered}}, one transaction."""
+    conn = _giveaway_connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for message_id, users in changes.items():
+                conn.executemany(
+                    "INSERT OR IGNORE INTO giveaway_entrants (message_id, user_id) VALUES (?, ?)",
+                    [(message_id, u) for u, entered in users.items() if entered],
+                )
+                conn.executemany(
+                    "DELETE FROM giveaway_entrants WHERE message_id = ? AND user_id = ?",
+                    [(message_id, u) for u, entered in users.items() if not entered],
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def replace_giveaway_entrants(db_path: str, message_id: int, user_ids):
+    """Replace one giveaway's entrants (after a reconciliation); empty removes them all."""
+    conn = _giveaway_connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM giveaway_entrants WHERE message_id = ?", (message_id,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO giveaway_entrants (message_id, user_id) VALUES (?, ?)",
+                [(message_id, int(u)) for u in user_ids],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
@@ -1,37 +1,35 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
-import json
-import os
 from threading import Thread
 import asyncio
 
+from config_storage import load_full_config, modify_full_config
+
 app = Flask(__name__)
 app.secret_key = 'depex_dashboard_secret_key_2026'
 
 CONFIG_FILE = "poem_config.json"
 
+DEFAULT_CONFIG = {
+    "poem_channel": None,
+    "embed_color": "0x9B59B6",
+    "show_image": True,
+    "image_url": "",
+    "auto_react": False,
+    "react_emojis": ["❤️", "🔥"]
+}
+
 def load_config():
     """Load configuration from JSON file"""
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading config: {e}")
+    cfg = load_full_config(CONFIG_FILE)
+    if cfg is not None:
+        return cfg
     
-    return {
-        "poem_channel": None,
-        "embed_color": "0x9B59B6",
-        "show_image": True,
-        "image_url": "",
-        "auto_react": False,
-        "react_emojis": ["❤️", "🔥"]
-    }
-
-def save_config(config):
-    """Save configuration to JSON file"""
+    return dict(DEFAULT_CONFIG)
+
+def modify_config(change):
+    """Apply change(config) to the latest saved config and save it (bot flushes in between are kept)"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        modify_full_config(CONFIG_FILE, change, DEFAULT_CONFIG)
         return True
     except Exception as e:
         print(f"Error saving config: {e}")
@@ -62,13 +60,13 @@ def update_config():
     """Update configuration"""
     try:
         data = request.json
-        config = load_config()
         
-        # Update config with new data
-        for key, value in data.items():
-            config[key] = value
+        def change(config):
+            # Update config with new data
+            for key, value in data.items():
+                config[key] = value
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Configuration updated successfully!"})
         else:
             return jsonify({"success": False, "message": "Failed to save configuration"}), 500
@@ -82,10 +80,10 @@ def set_poem_channel():
         data = request.json
         channel_id = data.get('channel_id')
         
-        config = load_config()
-        config['poem_channel'] = int(channel_id) if channel_id else None
+        def change(config):
+            config['poem_channel'] = int(channel_id) if channel_id else None
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Poem channel updated!"})
         return jsonify({"success": False, "message": "Failed to save"}), 500
     except Exception as e:
@@ -98,10 +96,10 @@ def set_color():
         data = request.json
         color = data.get('color')
         
-        config = load_config()
-        config['embed_color'] = color
+        def change(config):
+            config['embed_color'] = color
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Color updated!"})
         return jsonify({"success": False, "message": "Failed to save"}), 500
     except Exception as e:
@@ -113,11 +111,11 @@ def set_image():
     try:
         data = request.json
         
-        config = load_config()
-        config['show_image'] = data.get('show_image', config.get('show_image', True))
-        config['image_url'] = data.get('image_url', config.get('image_url', ''))
+        def change(config):
+            config['show_image'] = data.get('show_image', config.get('show_image', True))
+            config['image_url'] = data.get('image_url', config.get('image_url', ''))
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Image settings updated!"})
         return jsonify({"success": False, "message": "Failed to save"}), 500
     except Exception as e:
@@ -129,11 +127,11 @@ def set_reactions():
     try:
         data = request.json
         
-        config = load_config()
-        config['auto_react'] = data.get('auto_react', False)
-        config['react_emojis'] = data.get('react_emojis', ["❤️", "🔥"])
+        def change(config):
+            config['auto_react'] = data.get('auto_react', False)
+            config['react_emojis'] = data.get('react_emojis', ["❤️", "🔥"])
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Reactions updated!"})
         return jsonify({"success": False, "message": "Failed to save"}), 500
     except Exception as e:
@@ -145,22 +143,22 @@ def set_ticket():
     try:
         data = request.json
         
-        config = load_config()
-        if 'tickets' not in config:
-            config['tickets'] = {}
-        
-        # Update ticket settings
-        for key, value in data.items():
-            if key == 'category_id':
-                config['tickets']['category_id'] = int(value) if value else None
-            elif key == 'log_channel_id':
-                config['tickets']['log_channel_id'] = int(value) if value else None
-            elif key == 'admin_role_id':
-                config['tickets']['admin_role_id'] = int(value) if value else None
-            else:
-                config['tickets'][key] = value
+        def change(config):
+            if 'tickets' not in config:
+                config['tickets'] = {}
+            
+            # Update ticket settings
+            for key, value in data.items():
+                if key == 'category_id':
+                    config['tickets']['category_id'] = int(value) if value else None
+                elif key == 'log_channel_id':
+                    config['tickets']['log_channel_id'] = int(value) if value else None
+                elif key == 'admin_role_id':
+                    config['tickets']['admin_role_id'] = int(value) if value else None
+                else:
+                    config['tickets'][key] = value
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Ticket settings updated!"})
         return jsonify({"success": False, "message": "Failed to save"}), 500
     except Exception as e:
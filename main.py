@@ -5,11 +5,46 @@ import json
 import os
 import logging
 import asyncio
+import copy
+import gzip
+import hashlib
+import heapq
+import hmac
+import html
+import math
 import random
 import re
+import sys
+import threading
+import time
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from config_storage import (
+    CONFIG_BACKEND,
+    CONFIG_DB_FILE,
+    GIVEAWAY_DB_FILE,
+    TICKET_DB_FILE,
+    apply_giveaway_entrant_changes,
+    config_lock,
+    delete_open_tickets,
+    load_full_config,
+    load_giveaway_entrants,
+    load_open_tickets,
+    next_ticket_number,
+    read_config,
+    read_sqlite_guilds_since,
+    replace_giveaway_entrants,
+    replace_open_tickets,
+    save_open_ticket,
+    sqlite_mtime,
+    write_config_text,
+    write_sqlite_guilds,
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -26,7 +61,49 @@ intents.message_content = True
 intents.messages = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Member cache policy. The privileged members intent is off unless MEMBERS_INTENT=1; even
+# then guilds are never chunked at startup - a guild is chunked only once it needs many
+# member lookups (MEMBER_CHUNK_AFTER_FETCHES). Other lookups go through a small LRU of
+# fetched members (MEMBER_LRU_SIZE entries, MEMBER_LRU_TTL_SECONDS each).
+intents.members = os.getenv("MEMBERS_INTENT", "") == "1"
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "1000"))
+MEMBER_LRU_SIZE = int(os.getenv("MEMBER_LRU_SIZE", "5000"))
+MEMBER_LRU_TTL_SECONDS = float(os.getenv("MEMBER_LRU_TTL_SECONDS", "300"))
+MEMBER_CHUNK_AFTER_FETCHES = int(os.getenv("MEMBER_CHUNK_AFTER_FETCHES", "50"))
+
+# Sharding: by default Discord's recommended shard count is used. SHARD_COUNT fixes the
+# total, and SHARD_IDS (comma-separated) limits this process to some of them.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT", "").strip() else None
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip()] or None
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise RuntimeError("SHARD_IDS requires SHARD_COUNT")
+
+bot = commands.AutoShardedBot(
+    command_prefix="!",
+    intents=intents,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+    chunk_guilds_at_startup=False,
+    member_cache_flags=discord.MemberCacheFlags.from_intents(intents),
+    max_messages=MESSAGE_CACHE_SIZE or None,
+)
+
+# Cluster mode (cluster.py): several processes share one SQLite config and each owns the
+# guilds of its SHARD_IDS. A process never writes a guild that belongs to another one.
+CLUSTER_ID = os.getenv("CLUSTER_ID")
+CLUSTER_IPC_PORT = int(os.getenv("CLUSTER_IPC_PORT") or 0)
+# Shared secret on every IPC line, so other local processes can't drive the workers.
+CLUSTER_IPC_TOKEN = os.getenv("CLUSTER_IPC_TOKEN", "")
+_PARTIAL_SHARDS = SHARD_IDS is not None and len(set(SHARD_IDS)) < SHARD_COUNT
+if _PARTIAL_SHARDS and CONFIG_BACKEND != "sqlite":
+    raise RuntimeError("SHARD_IDS with only some shards requires CONFIG_BACKEND=sqlite")
+
+
+def _owns_guild(guild_id) -> bool:
+    """True when one of this process's shards holds `guild_id` (always true unclustered)."""
+    if not _PARTIAL_SHARDS:
+        return True
+    return (int(guild_id) >> 22) % SHARD_COUNT in SHARD_IDS
 
 # Presence rotation
 PRESENCE_ROTATE_SECONDS = 10
@@ -41,54 +118,41 @@ PRESENCE_TRANSITION_SECONDS = 0.7
 # Config file
 CONFIG_FILE = "poem_config.json"
 
-def load_config():
-    """Load configuration from JSON file - supports both old and new multi-server format"""
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                cfg = json.load(f)
-                # Check if it's the new multi-server format
-                if "servers" in cfg:
-                    # Return the entire multi-server config
-                    return cfg
-                # Old format - add new button defaults if they don't exist
-                if "tickets" in cfg:
-                    if "buttons" not in cfg["tickets"]:
-                        cfg["tickets"]["buttons"] = {}
-                    # Ping admin button
-                    if "ping_admin" not in cfg["tickets"]["buttons"]:
-                        cfg["tickets"]["buttons"]["ping_admin"] = "استدعاء الإدارة"
-                    if "ping_admin_emoji" not in cfg["tickets"]["buttons"]:
-                        cfg["tickets"]["buttons"]["ping_admin_emoji"] = "📢"
-                    if "ping_admin_style" not in cfg["tickets"]["buttons"]:
-                        cfg["tickets"]["buttons"]["ping_admin_style"] = "secondary"
-                    # Mention member button (admin only)
-                    if "mention_member" not in cfg["tickets"]["buttons"]:
-                        cfg["tickets"]["buttons"]["mention_member"] = "منشن العضو"
-                    if "mention_member_emoji" not in cfg["tickets"]["buttons"]:
-                        cfg["tickets"]["buttons"]["mention_member_emoji"] = "👤"
-                    if "mention_member_style" not in cfg["tickets"]["buttons"]:
-                        cfg["tickets"]["buttons"]["mention_member_style"] = "secondary"
-                    # Messages
-                    if "messages" not in cfg["tickets"]:
-                        cfg["tickets"]["messages"] = {}
-                    if "ping_admin_message" not in cfg["tickets"]["messages"]:
-                        cfg["tickets"]["messages"]["ping_admin_message"] = "تم استدعاء الإدارة @ADMIN"
-                    if "mention_member_message" not in cfg["tickets"]["messages"]:
-                        cfg["tickets"]["messages"]["mention_member_message"] = "@MEMBER تفضل"
-                    if "ticket_created_success" not in cfg["tickets"]["messages"]:
-                        cfg["tickets"]["messages"]["ticket_created_success"] = "✅ تم فتح التكيت"
-                    if "by_emoji" not in cfg["tickets"]["messages"]:
-                        cfg["tickets"]["messages"]["by_emoji"] = "👤"
-                    # Force update reason_label and modal_placeholder to Arabic
-                    cfg["tickets"]["messages"]["reason_label"] = "السبب"
-                    cfg["tickets"]["messages"]["modal_placeholder"] = "اذكر سبب فتح للتذكره :"
-                    # Force clear footer_text to show only time
-                    cfg["tickets"]["messages"]["footer_text"] = ""
-                return cfg
-    except Exception as e:
-        logger.error(f"Error loading config: {e}")
-    
+# The config is loaded once and served from memory. Changes are written back by a
+# debounced writer: a flush happens CONFIG_FLUSH_DELAY_SECONDS after the last change,
+# but never later than CONFIG_FLUSH_MAX_DELAY_SECONDS after the first pending change.
+CONFIG_FLUSH_DELAY_SECONDS = float(os.getenv("CONFIG_FLUSH_DELAY_SECONDS", "2.0"))
+CONFIG_FLUSH_MAX_DELAY_SECONDS = float(os.getenv("CONFIG_FLUSH_MAX_DELAY_SECONDS", "10.0"))
+# How often (at most) to stat the file to pick up edits made by the web dashboard.
+CONFIG_RELOAD_CHECK_SECONDS = 5.0
+
+_config_cache: dict | None = None
+_config_mtime: float | None = None
+_config_last_stat_at: float = 0.0
+_config_dirty_guilds: set[str] = set()
+_config_dirty_all: bool = False
+_config_first_dirty_at: float | None = None
+_config_flush_handle: asyncio.TimerHandle | None = None
+# Cached JSON text per guild, so a flush only re-serializes the guilds that changed.
+_config_fragments: dict[str, str] = {}
+_config_write_lock = threading.Lock()
+# One writer thread keeps flushes in order (a stale payload never lands after a newer one).
+_config_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config-writer")
+# Changes taken by a flush but not yet on disk (guild id -> pending payloads). A reload in
+# that window keeps these guilds from memory, like unflushed ones.
+_config_inflight_guilds: dict[str, int] = {}
+_config_inflight_all = 0
+_config_inflight_lock = threading.Lock()
+# Partial-shard mode: newest guild row updated_at already applied from the database.
+_config_rows_seen_at: float = 0.0
+# Disk version produced by our own last write (an earlier queued payload isn't an external edit).
+# Writer side only (read and set under _config_write_lock); the loop's view is _config_mtime.
+_config_own_mtime: float | None = None
+# An external-change read is queued on the writer thread; its result is applied on the loop.
+_config_reload_pending = False
+
+
+def _default_config() -> dict:
     return {
         "poem_channel": None,
         "embed_color": "0x9B59B6",
@@ -98,14 +162,495 @@ def load_config():
         "react_emojis": ["❤️", "🔥"]
     }
 
-def save_config(config):
-    """Save configuration to JSON file"""
+
+def _read_config_file() -> dict | None:
+    """Read configuration from disk - supports both old and new multi-server format"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-            logger.info("Config saved successfully")
+        cfg = load_full_config(CONFIG_FILE)
+        if cfg is not None:
+            # Check if it's the new multi-server format
+            if "servers" in cfg:
+                # Return the entire multi-server config
+                return cfg
+            # Old format - add new button defaults if they don't exist
+            if "tickets" in cfg:
+                if "buttons" not in cfg["tickets"]:
+                    cfg["tickets"]["buttons"] = {}
+                # Ping admin button
+                if "ping_admin" not in cfg["tickets"]["buttons"]:
+                    cfg["tickets"]["buttons"]["ping_admin"] = "استدعاء الإدارة"
+                if "ping_admin_emoji" not in cfg["tickets"]["buttons"]:
+                    cfg["tickets"]["buttons"]["ping_admin_emoji"] = "📢"
+                if "ping_admin_style" not in cfg["tickets"]["buttons"]:
+                    cfg["tickets"]["buttons"]["ping_admin_style"] = "secondary"
+                # Mention member button (admin only)
+                if "mention_member" not in cfg["tickets"]["buttons"]:
+                    cfg["tickets"]["buttons"]["mention_member"] = "منشن العضو"
+                if "mention_member_emoji" not in cfg["tickets"]["buttons"]:
+                    cfg["tickets"]["buttons"]["mention_member_emoji"] = "👤"
+                if "mention_member_style" not in cfg["tickets"]["buttons"]:
+                    cfg["tickets"]["buttons"]["mention_member_style"] = "secondary"
+                # Messages
+                if "messages" not in cfg["tickets"]:
+                    cfg["tickets"]["messages"] = {}
+                if "ping_admin_message" not in cfg["tickets"]["messages"]:
+                    cfg["tickets"]["messages"]["ping_admin_message"] = "تم استدعاء الإدارة @ADMIN"
+                if "mention_member_message" not in cfg["tickets"]["messages"]:
+                    cfg["tickets"]["messages"]["mention_member_message"] = "@MEMBER تفضل"
+                if "ticket_created_success" not in cfg["tickets"]["messages"]:
+                    cfg["tickets"]["messages"]["ticket_created_success"] = "✅ تم فتح التكيت"
+                if "by_emoji" not in cfg["tickets"]["messages"]:
+                    cfg["tickets"]["messages"]["by_emoji"] = "👤"
+                # Force update reason_label and modal_placeholder to Arabic
+                cfg["tickets"]["messages"]["reason_label"] = "السبب"
+                cfg["tickets"]["messages"]["modal_placeholder"] = "اذكر سبب فتح للتذكره :"
+                # Force clear footer_text to show only time
+                cfg["tickets"]["messages"]["footer_text"] = ""
+            return cfg
     except Exception as e:
-        logger.error(f"Error saving config: {e}")
+        logger.error(f"Error loading config: {e}")
+
+    return None
+
+
+def _config_file_mtime() -> float | None:
+    if CONFIG_BACKEND == "sqlite":
+        return sqlite_mtime(CONFIG_DB_FILE)
+    try:
+        return os.stat(CONFIG_FILE).st_mtime
+    except OSError:
+        return None
+
+
+def _config_maybe_reload():
+    """Pick up external edits (web dashboard) without re-parsing on every read.
+
+    The file is read and parsed on the config writer thread (after any queued writes);
+    the result is merged into memory back on the event loop.
+    """
+    global _config_last_stat_at, _config_reload_pending
+    now = time.monotonic()
+    if now - _config_last_stat_at < CONFIG_RELOAD_CHECK_SECONDS or _config_reload_pending:
+        return
+    _config_last_stat_at = now
+
+    mtime = _config_file_mtime()
+    if mtime is None or mtime == _config_mtime:
+        return
+
+    # Other workers write constantly; in partial-shard mode only the changed rows are read.
+    since = _config_rows_seen_at - 1.0 if _PARTIAL_SHARDS else None  # rows with an equal timestamp
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _config_apply_reload(*_config_read_changes(since))
+        return
+    _config_reload_pending = True
+    future = loop.run_in_executor(_config_executor, _config_read_changes, since)
+    future.add_done_callback(_config_reload_done)
+
+
+def _config_read_changes(since: float | None) -> tuple[float | None, object]:
+    """Writer thread: (disk mtime, changed rows or the whole parsed config)."""
+    mtime = _config_file_mtime()
+    if since is not None:
+        try:
+            return mtime, read_sqlite_guilds_since(CONFIG_DB_FILE, since)
+        except Exception as e:
+            logger.error(f"Error reading changed config rows: {e}")
+            return None, []
+    return mtime, _read_config_file()
+
+
+def _config_reload_done(future: asyncio.Future):
+    global _config_reload_pending
+    _config_reload_pending = False
+    try:
+        _config_apply_reload(*future.result())
+    except Exception as e:
+        logger.error(f"Config reload error: {e}")
+
+
+def _config_apply_reload(mtime: float | None, data):
+    """Loop thread: merge what _config_read_changes() read into the in-memory config."""
+    global _config_mtime
+    if mtime is None or mtime == _config_mtime:
+        return  # our own write landed meanwhile, or the read failed
+    _config_mtime = mtime
+    if _PARTIAL_SHARDS:
+        _config_apply_changed_rows(data)
+        return
+
+    fresh = data
+    if fresh is None:
+        return
+
+    # Keep local changes that haven't reached the disk yet (pending or being written).
+    with _config_inflight_lock:
+        local_all = _config_dirty_all or _config_inflight_all > 0
+        local_guilds = _config_dirty_guilds | set(_config_inflight_guilds)
+    if local_all:
+        return
+    if isinstance(fresh.get("servers"), dict) and isinstance(_config_cache.get("servers"), dict):
+        for gid in local_guilds:
+            if gid in _config_cache["servers"]:
+                fresh["servers"][gid] = _config_cache["servers"][gid]
+            else:
+                fresh["servers"].pop(gid, None)
+
+    # Replace in place so module-level references keep pointing at the live config.
+    _config_cache.clear()
+    _config_cache.update(fresh)
+    _config_fragments.clear()
+    _invalidate_guild_indexes()
+    logger.info("Config reloaded from disk (external change)")
+
+
+def _config_apply_changed_rows(rows: list[tuple[str, str, float]]):
+    """Apply guild rows (guild_id, data, updated_at) written by others (partial-shard mode).
+
+    This worker is the only bot-side writer of its own guilds, so an owned row is taken
+    from disk only when it has no local change pending and differs from memory (an edit
+    made in the dashboard); our own writes never revert it.
+    """
+    global _config_rows_seen_at
+    servers = _config_cache.get("servers")
+    if not isinstance(servers, dict):
+        servers = _config_cache["servers"] = {}
+    with _config_inflight_lock:
+        local_all = _config_dirty_all or _config_inflight_all > 0
+        local_guilds = _config_dirty_guilds | set(_config_inflight_guilds)
+
+    changed = 0
+    for gid, data, updated_at in rows:
+        _config_rows_seen_at = max(_config_rows_seen_at, updated_at)
+        if _owns_guild(gid) and (local_all or gid in local_guilds):
+            continue
+        if gid in servers and json.dumps(servers[gid], ensure_ascii=False, separators=(",", ":")) == data:
+            continue
+        servers[gid] = json.loads(data)
+        _config_fragments.pop(gid, None)
+        _invalidate_guild_indexes(gid)
+        changed += 1
+    if changed:
+        logger.info(f"Config: applied {changed} changed guild rows from disk")
+
+
+def _config_force_reload():
+    """Re-read the config now instead of waiting for the next mtime check."""
+    global _config_mtime, _config_last_stat_at
+    if _PARTIAL_SHARDS and _config_cache is not None:
+        try:
+            _config_apply_changed_rows(read_sqlite_guilds_since(CONFIG_DB_FILE, 0.0))
+        except Exception as e:
+            logger.error(f"Error reading changed config rows: {e}")
+        return
+    _config_mtime = None
+    _config_last_stat_at = 0.0
+    load_config()
+
+
+def load_config():
+    """Return the in-memory configuration, loading it from disk on first use."""
+    global _config_cache, _config_mtime, _config_last_stat_at, _config_rows_seen_at
+    if _config_cache is None:
+        _config_mtime = _config_file_mtime()
+        _config_last_stat_at = time.monotonic()
+        _config_rows_seen_at = time.time()
+        _config_cache = _read_config_file() or _default_config()
+    else:
+        _config_maybe_reload()
+    return _config_cache
+
+
+def _indent_json(text: str, spaces: int) -> str:
+    return text.replace("\n", "\n" + " " * spaces)
+
+
+def _take_config_changes() -> tuple[bool, set[str]]:
+    """Return (whole config dirty, dirty guild ids) and reset the dirty markers."""
+    global _config_dirty_all
+    changes = (_config_dirty_all, set(_config_dirty_guilds))
+    _config_dirty_guilds.clear()
+    _config_dirty_all = False
+    return changes
+
+
+def _serialize_config(dirty_all: bool, dirty_guilds: set[str]) -> str:
+    """Build the config file text, reusing cached JSON for guilds that didn't change."""
+    cfg = _config_cache if _config_cache is not None else {}
+    servers = cfg.get("servers")
+
+    if dirty_all or not isinstance(servers, dict):
+        _config_fragments.clear()
+    else:
+        for gid in dirty_guilds:
+            _config_fragments.pop(gid, None)
+
+    parts: list[str] = []
+    for key, value in cfg.items():
+        if key == "servers" and isinstance(value, dict):
+            for gid in [g for g in _config_fragments if g not in value]:
+                _config_fragments.pop(gid, None)
+            entries: list[str] = []
+            for gid, guild_cfg in value.items():
+                fragment = _config_fragments.get(gid)
+                if fragment is None:
+                    fragment = json.dumps(guild_cfg, indent=4, ensure_ascii=False)
+                    _config_fragments[gid] = fragment
+                entries.append(f"        {json.dumps(gid)}: {_indent_json(fragment, 8)}")
+            servers_text = "{\n" + ",\n".join(entries) + "\n    }" if entries else "{}"
+            parts.append(f"    {json.dumps(key)}: {servers_text}")
+        else:
+            parts.append(f"    {json.dumps(key, ensure_ascii=False)}: {_indent_json(json.dumps(value, indent=4, ensure_ascii=False), 4)}")
+    return "{\n" + ",\n".join(parts) + "\n}" if parts else "{}"
+
+
+def _sqlite_config_rows(dirty_all: bool, dirty_guilds: set[str]) -> tuple[dict[str, str | None], dict[str, str] | None]:
+    """Serialize only the changed guild rows (or everything after a full save)."""
+    cfg = _config_cache if _config_cache is not None else {}
+    servers = cfg.get("servers") if isinstance(cfg.get("servers"), dict) else {}
+
+    def _dump(value) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+    if dirty_all and _PARTIAL_SHARDS:
+        # Other processes own the remaining rows: upsert ours, never replace the tables.
+        return {gid: _dump(v) for gid, v in servers.items() if _owns_guild(gid)}, None
+    if dirty_all:
+        settings = {k: _dump(v) for k, v in cfg.items() if k != "servers"}
+        if "servers" in cfg:
+            settings["servers"] = "{}"
+        return {gid: _dump(v) for gid, v in servers.items()}, settings
+    return {gid: (_dump(servers[gid]) if gid in servers else None) for gid in dirty_guilds}, None
+
+
+def _build_config_payload() -> dict:
+    global _config_inflight_all
+    dirty_all, dirty_guilds = _take_config_changes()
+    with _config_inflight_lock:
+        for gid in dirty_guilds:
+            _config_inflight_guilds[gid] = _config_inflight_guilds.get(gid, 0) + 1
+        if dirty_all:
+            _config_inflight_all += 1
+    # base_mtime: the disk version this payload was built against.
+    payload = {"all": dirty_all, "guild_ids": dirty_guilds, "base_mtime": _config_mtime}
+    if CONFIG_BACKEND == "sqlite":
+        payload["kind"], payload["data"] = "sqlite", _sqlite_config_rows(dirty_all, dirty_guilds)
+    else:
+        payload["kind"], payload["data"] = "json", _serialize_config(dirty_all, dirty_guilds)
+        # The changed guilds on their own, to merge into the file if it changed under us.
+        servers = _config_cache.get("servers") if isinstance(_config_cache.get("servers"), dict) else {}
+        payload["guilds"] = {gid: copy.deepcopy(servers[gid]) if gid in servers else None for gid in dirty_guilds}
+    return payload
+
+
+def _release_config_payload(payload: dict):
+    global _config_inflight_all
+    with _config_inflight_lock:
+        for gid in payload["guild_ids"]:
+            left = _config_inflight_guilds.get(gid, 0) - 1
+            if left > 0:
+                _config_inflight_guilds[gid] = left
+            else:
+                _config_inflight_guilds.pop(gid, None)
+        if payload["all"]:
+            _config_inflight_all -= 1
+
+
+def _write_json_payload(payload: dict) -> bool:
+    """Write the JSON file; returns False if it had an external edit that memory lacks."""
+    with config_lock(CONFIG_FILE):
+        text = payload["data"]
+        disk_mtime = _config_file_mtime()
+        external = disk_mtime is not None and disk_mtime not in (payload["base_mtime"], _config_own_mtime)
+        if external and not payload["all"]:
+            # The dashboard saved since we last read: apply our guilds on top of its file.
+            fresh = read_config(CONFIG_FILE)
+            if isinstance(fresh, dict) and isinstance(fresh.get("servers"), dict):
+                for gid, guild_cfg in payload["guilds"].items():
+                    if guild_cfg is None:
+                        fresh["servers"].pop(gid, None)
+                    else:
+                        fresh["servers"][gid] = guild_cfg
+                text = json.dumps(fresh, indent=4, ensure_ascii=False)
+            else:
+                external = False
+        elif external:
+            logger.warning("Config file changed on disk; replacing it with a full save")
+            external = False
+        write_config_text(CONFIG_FILE, text, locked=True)
+    return not external
+
+
+def _write_config_payload(payload: dict) -> float | None:
+    """Persist a payload from _build_config_payload (safe to call from a worker thread).
+
+    Returns the new disk mtime if memory and disk are in sync afterwards, else None.
+    """
+    global _config_own_mtime
+    with _config_write_lock:
+        try:
+            if payload["kind"] == "sqlite":
+                rows, settings = payload["data"]
+                before = _config_file_mtime()
+                write_sqlite_guilds(CONFIG_DB_FILE, rows, settings)
+                in_sync = before in (payload["base_mtime"], _config_own_mtime)
+            else:
+                in_sync = _write_json_payload(payload)
+            _config_own_mtime = _config_file_mtime()
+            logger.info("Config saved successfully")
+            return _config_own_mtime if in_sync else None
+        except Exception as e:
+            logger.error(f"Error saving config: {e}")
+            return None
+
+
+def _config_write_done(payload: dict, mtime: float | None):
+    """Loop side of a finished write: record the disk version and release the payload."""
+    global _config_mtime
+    # After an external change, leave _config_mtime stale so the next check reloads it.
+    if mtime is not None:
+        _config_mtime = mtime
+    _release_config_payload(payload)
+
+
+def flush_config():
+    """Write pending config changes to disk immediately."""
+    global _config_flush_handle, _config_first_dirty_at
+    if _config_flush_handle is not None:
+        _config_flush_handle.cancel()
+        _config_flush_handle = None
+    if _config_cache is None or (not _config_dirty_all and not _config_dirty_guilds):
+        return
+    _config_first_dirty_at = None
+    payload = _build_config_payload()
+    try:
+        mtime = _write_config_payload(payload)
+    except BaseException:
+        _release_config_payload(payload)
+        raise
+    _config_write_done(payload, mtime)
+
+
+def _config_flush_from_loop():
+    global _config_flush_handle, _config_first_dirty_at
+    _config_flush_handle = None
+    if _config_cache is None or (not _config_dirty_all and not _config_dirty_guilds):
+        return
+    _config_first_dirty_at = None
+    # Serialize on the loop thread (the config is only mutated there), write off-thread.
+    payload = _build_config_payload()
+    future = asyncio.get_running_loop().run_in_executor(_config_executor, _write_config_payload, payload)
+
+    def _done(f: asyncio.Future):
+        _config_write_done(payload, None if f.cancelled() or f.exception() else f.result())
+
+    future.add_done_callback(_done)
+
+
+def _config_mark_dirty(guild_id=None):
+    """Record a change and schedule a debounced flush."""
+    global _config_dirty_all, _config_flush_handle, _config_first_dirty_at
+    if guild_id is None:
+        _config_dirty_all = True
+    elif not _owns_guild(guild_id):
+        logger.warning(f"Config change for guild {guild_id} not saved: owned by another cluster")
+        return
+    else:
+        _config_dirty_guilds.add(str(guild_id))
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None:
+        # No event loop yet (startup / scripts): write through.
+        flush_config()
+        return
+
+    now = loop.time()
+    if _config_first_dirty_at is None:
+        _config_first_dirty_at = now
+    delay = min(CONFIG_FLUSH_DELAY_SECONDS, max(0.0, _config_first_dirty_at + CONFIG_FLUSH_MAX_DELAY_SECONDS - now))
+    if _config_flush_handle is not None:
+        _config_flush_handle.cancel()
+    _config_flush_handle = loop.call_later(delay, _config_flush_from_loop)
+
+
+atexit.register(flush_config)
+
+
+def save_config(config):
+    """Replace the in-memory configuration and schedule a write to disk"""
+    cfg = load_config()
+    if config is not cfg:
+        cfg.clear()
+        cfg.update(config)
+    _invalidate_guild_indexes()
+    _config_mark_dirty()
+
+
+# Layered defaults: stored guild configs only need what was explicitly changed. Accessors
+# fill missing keys in memory on read and never write back; a section is persisted when a
+# user change calls update_guild_config().
+_GUILD_DEFAULTS = {
+    "poem_channel": None,
+    "embed_color": "#9B59B6",
+    "show_image": True,
+    "image_url": "",
+    "auto_react": False,
+    "react_emojis": ["❤️", "🔥"],
+    "tickets": {
+        "category_id": None,
+        "log_channel_id": None,
+        "admin_role_id": None
+    },
+    "giveaway": {
+        "channel_id": None,
+        "duration": "1h",
+        "winners": 1,
+        "emoji": "🎉",
+        "color": "#5865F2",
+        "image_url": ""
+    },
+    "competition": {
+        "channel_id": None,
+        "message_id": None,
+        "role_id": None,
+        "reaction_emoji": "🎯",
+        "embed_color": "#5865F2",
+        "title": "🏆 Competition | مسابقة",
+        "description": "React with {emoji} to get the role | تفاعل بـ {emoji} للحصول على الرتبة",
+        "image_url": "",
+        "footer_text": "",
+    },
+    "voice_247": {
+        "enabled": False,
+        "channel_id": None,
+        "self_mute": True,
+        "self_deaf": True,
+    },
+}
+
+
+def _apply_defaults(target: dict, defaults: dict) -> dict:
+    """Fill keys missing from `target` with copies of `defaults` (in memory only)."""
+    for key, value in defaults.items():
+        if key not in target:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+def _config_section(guild_cfg: dict, name: str, factory=dict):
+    """Return guild_cfg[name], attaching a fresh value if it's missing or the wrong type."""
+    value = guild_cfg.get(name)
+    expected = type(factory())
+    if not isinstance(value, expected):
+        value = factory()
+        guild_cfg[name] = value
+    return value
+
 
 def get_guild_config(guild_id):
     """Get configuration for a specific guild (server) - supports multi-server format"""
@@ -114,256 +659,130 @@ def get_guild_config(guild_id):
     # If it's multi-server format from dashboard
     if "servers" in config:
         guild_id_str = str(guild_id)
-        if guild_id_str in config["servers"]:
-            guild_cfg = config["servers"][guild_id_str]
-            if "giveaway" not in guild_cfg:
-                guild_cfg["giveaway"] = {
-                    "channel_id": None,
-                    "duration": "1h",
-                    "winners": 1,
-                    "emoji": "🎉",
-                    "color": "#5865F2",
-                    "image_url": ""
-                }
-                save_config(config)
-            if "competition" not in guild_cfg:
-                guild_cfg["competition"] = {
-                    "channel_id": None,
-                    "message_id": None,
-                    "role_id": None,
-                    "reaction_emoji": "🎯",
-                    "embed_color": "#5865F2",
-                    "title": "🏆 Competition | مسابقة",
-                    "description": "React with {emoji} to get the role | تفاعل بـ {emoji} للحصول على الرتبة",
-                    "image_url": "",
-                    "footer_text": "",
-                }
-                save_config(config)
-            return guild_cfg
-        else:
-            # Create default config for this server
-            default = {
-                "poem_channel": None,
-                "embed_color": "#9B59B6",
-                "show_image": True,
-                "image_url": "",
-                "auto_react": False,
-                "react_emojis": ["❤️", "🔥"],
-                "tickets": {
-                    "category_id": None,
-                    "log_channel_id": None,
-                    "admin_role_id": None
-                },
-                "giveaway": {
-                    "channel_id": None,
-                    "duration": "1h",
-                    "winners": 1,
-                    "emoji": "🎉",
-                    "color": "#5865F2",
-                    "image_url": ""
-                },
-                "competition": {
-                    "channel_id": None,
-                    "message_id": None,
-                    "role_id": None,
-                    "reaction_emoji": "🎯",
-                    "embed_color": "#5865F2",
-                    "title": "🏆 Competition | مسابقة",
-                    "description": "React with {emoji} to get the role | تفاعل بـ {emoji} للحصول على الرتبة",
-                    "image_url": "",
-                    "footer_text": "",
-                },
-                "voice_247": {
-                    "enabled": False,
-                    "channel_id": None,
-                    "self_mute": True,
-                    "self_deaf": True,
-                },
-            }
-            config["servers"][guild_id_str] = default
-            save_config(config)
-            return default
+        guild_cfg = config["servers"].get(guild_id_str)
+        if not isinstance(guild_cfg, dict):
+            # New server: defaults live in memory until something is changed.
+            guild_cfg = {}
+            config["servers"][guild_id_str] = guild_cfg
+        return _apply_defaults(guild_cfg, _GUILD_DEFAULTS)
     
     # Old single-server format - return as is for backward compatibility
     return config
 
 def update_guild_config(guild_id, updates):
     """Update configuration for a specific guild"""
+    if not _owns_guild(guild_id):
+        # Another cluster process owns this guild; a change here would never be saved.
+        logger.warning(f"Config change for guild {guild_id} rejected: owned by another cluster")
+        return
     full_config = load_config()
     
     # Convert to multi-server format if needed
     if "servers" not in full_config:
-        full_config = {"servers": {}}
+        full_config.clear()
+        full_config["servers"] = {}
+        _config_mark_dirty()
     
     guild_id_str = str(guild_id)
     
     # Get existing config or create new
     if guild_id_str not in full_config["servers"]:
-        full_config["servers"][guild_id_str] = {
-            "poem_channel": None,
-            "embed_color": "#9B59B6",
-            "show_image": True,
-            "image_url": "",
-            "auto_react": False,
-            "react_emojis": ["❤️", "🔥"],
-            "tickets": {
-                "category_id": None,
-                "log_channel_id": None,
-                "admin_role_id": None
-            },
-            "giveaway": {
-                "channel_id": None,
-                "duration": "1h",
-                "winners": 1,
-                "emoji": "🎉",
-                "color": "#5865F2",
-                "image_url": ""
-            },
-            "competition": {
-                "channel_id": None,
-                "message_id": None,
-                "role_id": None,
-                "reaction_emoji": "🎯",
-                "embed_color": "#5865F2",
-                "title": "🏆 Competition | مسابقة",
-                "description": "React with {emoji} to get the role | تفاعل بـ {emoji} للحصول على الرتبة",
-                "image_url": "",
-                "footer_text": "",
-            },
-            "voice_247": {
-                "enabled": False,
-                "channel_id": None,
-                "self_mute": True,
-                "self_deaf": True,
-            },
-        }
+        full_config["servers"][guild_id_str] = copy.deepcopy(_GUILD_DEFAULTS)
     
     # Update with new values
     full_config["servers"][guild_id_str].update(updates)
-    save_config(full_config)
+    _invalidate_guild_indexes(guild_id_str, updates)
+    _config_mark_dirty(guild_id_str)
+
+
+_TICKET_DEFAULTS = {
+    "category_id": None,
+    "log_channel_id": None,
+    "admin_role_id": None,
+    "embed_color": "#9B59B6",
+    "panel_embed_color": "#9B59B6",
+    "ticket_embed_color": "#9B59B6",
+    "panel_title": "🎫 Tickets | التكيت",
+    "panel_description": "اختر نوع التكيت من القائمة أدناه | Choose a ticket type below",
+    "dropdown_placeholder": "إضغط لفتح التكيت",
+    "menu_placeholder": "تعديل التكيت",
+    "panel_image": "",
+    "panel_author_icon": "",
+    "panel_author_name": "Ticket System",
+    "ticket_image": "",
+    "reason_image": "",
+    "ticket_counter": 0,
+    "max_open_per_user": 0,  # 0 = unlimited
+    "overflow_category_ids": [],  # used in order once category_id is full
+    "auto_create_categories": True,
+    "support_roles": [],
+    "ping_roles": [],
+}
 
+_TICKET_DEFAULT_OPTIONS = [
+    {"label": "Support | دعم", "description": "الدعم الفني والمساعدة", "emoji": "🎫"},
+    {"label": "Report | بلاغ", "description": "الإبلاغ عن مشكلة أو عضو", "emoji": "🚨"},
+]
 
-def get_ticket_config(guild_id: int):
-    """Get ticket config for a guild and ensure required defaults exist."""
-    guild_cfg = get_guild_config(guild_id)
+_TICKET_BUTTON_DEFAULTS = {
+    "close": "CLOSE",
+    "close_emoji": "🔒",
+    "close_style": "danger",
+    "claim": "CLAIM",
+    "claim_emoji": "👥",
+    "claim_style": "primary",
+    "ping_admin": "استدعاء الإدارة",
+    "ping_admin_emoji": "📢",
+    "ping_admin_style": "secondary",
+    "mention_member": "منشن العضو",
+    "mention_member_emoji": "👤",
+    "mention_member_style": "secondary",
+}
 
-    changed = False
-    if "tickets" not in guild_cfg or not isinstance(guild_cfg.get("tickets"), dict):
-        guild_cfg["tickets"] = {}
-        changed = True
-
-    tcfg = guild_cfg["tickets"]
-
-    def _set_default(key, value):
-        nonlocal changed
-        if key not in tcfg:
-            tcfg[key] = value
-            changed = True
-
-    _set_default("category_id", None)
-    _set_default("log_channel_id", None)
-    _set_default("admin_role_id", None)
-    _set_default("embed_color", "#9B59B6")
-    _set_default("panel_embed_color", "#9B59B6")
-    _set_default("ticket_embed_color", "#9B59B6")
-    _set_default("panel_title", "🎫 Tickets | التكيت")
-    _set_default("panel_description", "اختر نوع التكيت من القائمة أدناه | Choose a ticket type below")
-    _set_default("dropdown_placeholder", "إضغط لفتح التكيت")
-    _set_default("menu_placeholder", "تعديل التكيت")
-    _set_default("panel_image", "")
-    _set_default("panel_author_icon", "")
-    _set_default("panel_author_name", "Ticket System")
-    _set_default("ticket_image", "")
-    _set_default("reason_image", "")
-    _set_default("ticket_counter", 0)
-    _set_default("support_roles", [])
-    _set_default("ping_roles", [])
-
-    if "ticket_options" not in tcfg or not isinstance(tcfg.get("ticket_options"), list) or not tcfg.get("ticket_options"):
-        tcfg["ticket_options"] = [
-            {"label": "Support | دعم", "description": "الدعم الفني والمساعدة", "emoji": "🎫"},
-            {"label": "Report | بلاغ", "description": "الإبلاغ عن مشكلة أو عضو", "emoji": "🚨"},
-        ]
-        changed = True
-
-    if "buttons" not in tcfg or not isinstance(tcfg.get("buttons"), dict):
-        tcfg["buttons"] = {}
-        changed = True
-    if "messages" not in tcfg or not isinstance(tcfg.get("messages"), dict):
-        tcfg["messages"] = {}
-        changed = True
-    if "menu_options" not in tcfg or not isinstance(tcfg.get("menu_options"), dict):
-        tcfg["menu_options"] = {}
-        changed = True
-
-    # Buttons defaults
-    btn = tcfg["buttons"]
-    btn_defaults = {
-        "close": "CLOSE",
-        "close_emoji": "🔒",
-        "close_style": "danger",
-        "claim": "CLAIM",
-        "claim_emoji": "👥",
-        "claim_style": "primary",
-        "ping_admin": "استدعاء الإدارة",
-        "ping_admin_emoji": "📢",
-        "ping_admin_style": "secondary",
-        "mention_member": "منشن العضو",
-        "mention_member_emoji": "👤",
-        "mention_member_style": "secondary",
-    }
-    for k, v in btn_defaults.items():
-        if k not in btn:
-            btn[k] = v
-            changed = True
-
-    # Messages defaults
-    msg = tcfg["messages"]
-    msg_defaults = {
-        "modal_title": "فتح تذكرة",
-        "reason_label": "السبب",
-        "modal_placeholder": "اذكر سبب فتح للتذكره :",
-        "ticket_created_title": "فتح تذكرة",
-        "ticket_created_desc": "✅ تم فتح التكيت بنجاح",
-        "ticket_created_success": "✅ تم فتح التكيت",
-        "ticket_by_label": "بواسطة",
-        "by_emoji": "👤",
-        "reason_field_name": "السبب:",
-        "footer_text": "",
-        "ping_admin_message": "تم استدعاء الإدارة @ADMIN",
-        "mention_member_message": "@MEMBER تفضل",
-        "claim_message": "@USER استدعى الإدارة",
-        "claim_emoji": "👥",
-        "log_ticket_opened": "📬 Ticket Opened",
-        "log_opened_by": "Opened By",
-        "log_channel": "Channel",
-        "log_reason": "Reason",
-        "log_ticket_closed": "🔒 Ticket Closed",
-        "log_closed_by": "Closed By",
-        "log_ticket_claimed": "👥 Ticket Claimed",
-        "log_claimed_by": "Claimed By",
-    }
-    for k, v in msg_defaults.items():
-        if k not in msg:
-            msg[k] = v
-            changed = True
-
-    # Menu option defaults
-    menu = tcfg["menu_options"]
-    menu_defaults = {
-        "rename": {"label": "Rename", "emoji": "✏️", "description": "تغيير اسم التكيت"},
-        "add_user": {"label": "Add User", "emoji": "👤", "description": "اضافة عضو للتكيت"},
-        "remove_user": {"label": "Remove User", "emoji": "🚫", "description": "إزالة عضو من التكيت"},
-        "reset": {"label": "Reset Menu", "emoji": "🔄", "description": "إعادة تعيين القائمة"},
-    }
-    for k, v in menu_defaults.items():
-        if k not in menu:
-            menu[k] = v
-            changed = True
+_TICKET_MESSAGE_DEFAULTS = {
+    "modal_title": "فتح تذكرة",
+    "reason_label": "السبب",
+    "modal_placeholder": "اذكر سبب فتح للتذكره :",
+    "ticket_created_title": "فتح تذكرة",
+    "ticket_created_desc": "✅ تم فتح التكيت بنجاح",
+    "ticket_created_success": "✅ تم فتح التكيت",
+    "ticket_by_label": "بواسطة",
+    "by_emoji": "👤",
+    "reason_field_name": "السبب:",
+    "footer_text": "",
+    "ping_admin_message": "تم استدعاء الإدارة @ADMIN",
+    "mention_member_message": "@MEMBER تفضل",
+    "claim_message": "@USER استدعى الإدارة",
+    "claim_emoji": "👥",
+    "log_ticket_opened": "📬 Ticket Opened",
+    "log_opened_by": "Opened By",
+    "log_channel": "Channel",
+    "log_reason": "Reason",
+    "log_ticket_closed": "🔒 Ticket Closed",
+    "log_closed_by": "Closed By",
+    "log_ticket_claimed": "👥 Ticket Claimed",
+    "log_claimed_by": "Claimed By",
+}
 
-    if changed:
-        update_guild_config(guild_id, guild_cfg)
+_TICKET_MENU_DEFAULTS = {
+    "rename": {"label": "Rename", "emoji": "✏️", "description": "تغيير اسم التكيت"},
+    "add_user": {"label": "Add User", "emoji": "👤", "description": "اضافة عضو للتكيت"},
+    "remove_user": {"label": "Remove User", "emoji": "🚫", "description": "إزالة عضو من التكيت"},
+    "reset": {"label": "Reset Menu", "emoji": "🔄", "description": "إعادة تعيين القائمة"},
+}
+
+
+def get_ticket_config(guild_id: int):
+    """Get ticket config for a guild with defaults filled in memory (read-only fast path)."""
+    tcfg = _config_section(get_guild_config(guild_id), "tickets")
+    _apply_defaults(tcfg, _TICKET_DEFAULTS)
 
+    if not isinstance(tcfg.get("ticket_options"), list) or not tcfg.get("ticket_options"):
+        tcfg["ticket_options"] = copy.deepcopy(_TICKET_DEFAULT_OPTIONS)
+
+    _apply_defaults(_config_section(tcfg, "buttons"), _TICKET_BUTTON_DEFAULTS)
+    _apply_defaults(_config_section(tcfg, "messages"), _TICKET_MESSAGE_DEFAULTS)
+    _apply_defaults(_config_section(tcfg, "menu_options"), _TICKET_MENU_DEFAULTS)
     return tcfg
 
 
@@ -378,6 +797,123 @@ def _get_ticket_owner_id_from_channel(channel: discord.abc.GuildChannel) -> int
         pass
     return None
 
+
+# Open-ticket index: channel id -> row and (guild, owner) -> channel ids, mirrored in the
+# ticket store. The channel topic stays as a fallback; each guild is imported from topics
+# once, after which lookups never scan channels.
+_open_tickets: dict[int, dict] = {}
+_open_tickets_by_owner: dict[tuple[int, int], set[int]] = {}
+_open_tickets_indexed: set[int] = set()
+_open_tickets_loaded = False
+
+
+def _ticket_index_put(channel_id: int, guild_id: int, owner_id: int, category_id: int | None, name: str, opened_at: float):
+    _ticket_index_drop(channel_id)
+    _open_tickets[channel_id] = {
+        "guild_id": guild_id, "owner_id": owner_id, "category_id": category_id, "name": name, "opened_at": opened_at,
+    }
+    _open_tickets_by_owner.setdefault((guild_id, owner_id), set()).add(channel_id)
+
+
+def _ticket_index_drop(channel_id: int) -> dict | None:
+    row = _open_tickets.pop(channel_id, None)
+    if row is not None:
+        key = (row["guild_id"], row["owner_id"])
+        channels = _open_tickets_by_owner.get(key)
+        if channels is not None:
+            channels.discard(channel_id)
+            if not channels:
+                del _open_tickets_by_owner[key]
+    return row
+
+
+def _ticket_index_ensure_loaded():
+    global _open_tickets_loaded
+    if _open_tickets_loaded:
+        return
+    _open_tickets_loaded = True
+    try:
+        rows, indexed = load_open_tickets(TICKET_DB_FILE)
+    except Exception as e:
+        logger.error(f"Error loading open tickets: {e}")
+        return
+    for row in rows:
+        _ticket_index_put(*row)
+    _open_tickets_indexed.update(indexed)
+
+
+def _ticket_store_write(func, *args):
+    """Persist an index change on the (ordered) config writer thread."""
+    def _run():
+        try:
+            func(TICKET_DB_FILE, *args)
+        except Exception as e:
+            logger.error(f"Error saving open tickets: {e}")
+    _config_executor.submit(_run)
+
+
+def _ticket_index_add(channel: discord.TextChannel, owner_id: int, opened_at: float | None = None):
+    _ticket_index_ensure_loaded()
+    row = (channel.id, channel.guild.id, int(owner_id), channel.category_id, channel.name, opened_at or time.time())
+    _ticket_index_put(*row)
+    _ticket_store_write(save_open_ticket, row)
+
+
+def _ticket_index_remove(channel_id: int):
+    _ticket_index_ensure_loaded()
+    if _ticket_index_drop(channel_id) is not None:
+        _ticket_store_write(delete_open_tickets, [channel_id])
+
+
+def _ticket_index_update(channel: discord.abc.GuildChannel):
+    """Follow renames and category moves of an indexed ticket channel."""
+    _ticket_index_ensure_loaded()
+    row = _open_tickets.get(channel.id)
+    if row is None or (row["name"] == channel.name and row["category_id"] == channel.category_id):
+        return
+    _ticket_index_add(channel, row["owner_id"], row["opened_at"])
+
+
+def _ticket_index_sync_guild(guild: discord.Guild, *, rebuild: bool = False) -> int:
+    """Import a guild's tickets from channel topics (first time or on request), otherwise
+    drop entries whose channel disappeared while offline. Returns the open ticket count."""
+    _ticket_index_ensure_loaded()
+    if rebuild or guild.id not in _open_tickets_indexed:
+        rows = []
+        for channel in guild.text_channels:
+            owner_id = _get_ticket_owner_id_from_channel(channel)
+            if owner_id:
+                opened_at = channel.created_at.timestamp()
+                rows.append((channel.id, guild.id, owner_id, channel.category_id, channel.name, opened_at))
+        for channel_id in [c for c, r in _open_tickets.items() if r["guild_id"] == guild.id]:
+            _ticket_index_drop(channel_id)
+        for row in rows:
+            _ticket_index_put(*row)
+        _open_tickets_indexed.add(guild.id)
+        _ticket_store_write(replace_open_tickets, guild.id, rows)
+        return len(rows)
+
+    stale = [c for c, r in _open_tickets.items() if r["guild_id"] == guild.id and guild.get_channel(c) is None]
+    for channel_id in stale:
+        _ticket_index_drop(channel_id)
+    if stale:
+        _ticket_store_write(delete_open_tickets, stale)
+    return sum(1 for r in _open_tickets.values() if r["guild_id"] == guild.id)
+
+
+def _ticket_owner_id(channel: discord.abc.GuildChannel) -> int | None:
+    """Ticket owner from the index, falling back to the channel topic."""
+    _ticket_index_ensure_loaded()
+    row = _open_tickets.get(channel.id)
+    return row["owner_id"] if row is not None else _get_ticket_owner_id_from_channel(channel)
+
+
+def _ticket_open_channels(guild_id: int, owner_id: int) -> set[int]:
+    """Channel ids of the open tickets a member owns (O(1))."""
+    _ticket_index_ensure_loaded()
+    return _open_tickets_by_owner.get((int(guild_id), int(owner_id)), set())
+
+
 config = load_config()
 
 # Helper function to convert color name to hex
@@ -534,44 +1070,11 @@ def _parse_bool_text(value: str | None, default: bool = False) -> bool:
 
 
 def get_auto_replies_config(guild_id: int) -> list[dict]:
-    guild_cfg = get_guild_config(guild_id)
-    changed = False
-    if "auto_replies" not in guild_cfg or not isinstance(guild_cfg.get("auto_replies"), list):
-        guild_cfg["auto_replies"] = []
-        changed = True
-    if changed:
-        update_guild_config(guild_id, guild_cfg)
-    return guild_cfg["auto_replies"]
+    return _config_section(get_guild_config(guild_id), "auto_replies", list)
 
 
 def get_channel_auto_config(guild_id: int) -> list[dict]:
-    guild_cfg = get_guild_config(guild_id)
-    changed = False
-    if "channel_auto" not in guild_cfg or not isinstance(guild_cfg.get("channel_auto"), list):
-        guild_cfg["channel_auto"] = []
-        changed = True
-    if changed:
-        update_guild_config(guild_id, guild_cfg)
-    return guild_cfg["channel_auto"]
-
-
-def _matches_trigger(message_content: str, trigger: str, *, match_type: str, case_sensitive: bool) -> bool:
-    message_content = (message_content or "").strip()
-    trigger = (trigger or "").strip()
-
-    if not case_sensitive:
-        message_content = message_content.lower()
-        trigger = trigger.lower()
-
-    match_type = (match_type or "contains").strip().lower()
-    if match_type == "exact":
-        return message_content == trigger
-    if match_type == "startswith":
-        return message_content.startswith(trigger)
-    if match_type == "endswith":
-        return message_content.endswith(trigger)
-    # default: contains
-    return trigger in message_content
+    return _config_section(get_guild_config(guild_id), "channel_auto", list)
 
 
 def _normalize_match_type(value: str | None) -> str:
@@ -588,6 +1091,251 @@ def _normalize_reply_mode(value: str | None) -> str:
     return "send"
 
 
+class _TriggerAutomaton:
+    """Trie of trigger strings with Aho-Corasick failure links.
+
+    search() reports every trigger occurring anywhere in the text in one pass;
+    walk() follows the plain trie from the start of the text (prefix matches) and
+    is only meaningful on an automaton that was never build()-ed.
+    """
+
+    def __init__(self):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[list[int]] = [[]]
+
+    def add(self, word: str, value: int):
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append(value)
+
+    def build(self):
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, nxt in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0) if node else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def search(self, text: str) -> set[int]:
+        found: set[int] = set()
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    def walk(self, text) -> set[int]:
+        found: set[int] = set()
+        node = 0
+        for ch in text:
+            node = self.goto[node].get(ch)
+            if node is None:
+                break
+            found.update(self.out[node])
+        return found
+
+
+class _TriggerSet:
+    """Exact / prefix / suffix / contains triggers for one case-sensitivity mode."""
+
+    def __init__(self):
+        self.exact: dict[str, list[int]] = {}
+        self.prefix = _TriggerAutomaton()
+        self.suffix = _TriggerAutomaton()  # built from reversed triggers
+        self.contains = _TriggerAutomaton()
+        self.size = 0
+
+    def add(self, trigger: str, match_type: str, value: int):
+        self.size += 1
+        if match_type == "exact":
+            self.exact.setdefault(trigger, []).append(value)
+        elif match_type == "startswith":
+            self.prefix.add(trigger, value)
+        elif match_type == "endswith":
+            self.suffix.add(trigger[::-1], value)
+        else:
+            self.contains.add(trigger, value)
+
+    def build(self):
+        self.contains.build()
+
+    def match(self, text: str) -> set[int]:
+        found = set(self.exact.get(text, ()))
+        found |= self.prefix.walk(text)
+        found |= self.suffix.walk(reversed(text))
+        found |= self.contains.search(text)
+        return found
+
+
+class _AutoReplyMatcher:
+    """Compiled auto-reply rules for one guild (see _get_auto_reply_matcher)."""
+
+    def __init__(self, rules: list[dict]):
+        self.source = rules
+        self.rules: list[dict] = []
+        self._sets = {True: _TriggerSet(), False: _TriggerSet()}
+
+        for idx, rule in enumerate(rules, start=1):
+            if not rule or not rule.get("enabled", True):
+                continue
+            trigger = str(rule.get("trigger", "")).strip()
+            reply = str(rule.get("reply", "")).strip()
+            if not trigger or not reply:
+                continue
+            case_sensitive = bool(rule.get("case_sensitive", False))
+            allowed_roles = rule.get("allowed_role_ids")
+            compiled = {
+                "index": idx,
+                "rule": rule,
+                "trigger": trigger,
+                "reply": reply,
+                "mention": bool(rule.get("mention", False)),
+                "mode": _normalize_reply_mode(rule.get("mode")),
+                "allowed_role_ids": allowed_roles if isinstance(allowed_roles, list) else [],
+            }
+            self._sets[case_sensitive].add(
+                trigger if case_sensitive else trigger.lower(),
+                _normalize_match_type(rule.get("match")),
+                len(self.rules),
+            )
+            self.rules.append(compiled)
+
+        for trigger_set in self._sets.values():
+            trigger_set.build()
+
+    def matches(self, content: str) -> list[dict]:
+        """Compiled rules matching `content`, in configured order."""
+        if not self.rules:
+            return []
+        text = (content or "").strip()
+        found: set[int] = set()
+        if self._sets[True].size:
+            found |= self._sets[True].match(text)
+        if self._sets[False].size:
+            found |= self._sets[False].match(text.lower())
+        return [self.rules[i] for i in sorted(found)]
+
+
+# guild_id (str) -> compiled matcher. Dropped by _invalidate_guild_indexes() and rebuilt
+# on the next message; also rebuilt if the rules list object itself is replaced.
+_auto_reply_matchers: dict[str, _AutoReplyMatcher] = {}
+
+
+def _get_auto_reply_matcher(guild_id, rules: list[dict]) -> _AutoReplyMatcher:
+    key = str(guild_id)
+    matcher = _auto_reply_matchers.get(key)
+    if matcher is None or matcher.source is not rules:
+        matcher = _AutoReplyMatcher(rules)
+        _auto_reply_matchers[key] = matcher
+    return matcher
+
+
+# guild_id (str) -> what on_message needs to know before touching the config:
+#   "channels": channel IDs with poem / channel_auto rules
+#   "all_channels": True when a guild-wide feature (auto replies, giveaway shortcut word,
+#                   moderation shortcuts) can react to a message in any channel
+_message_indexes: dict[str, dict] = {}
+
+
+def _invalidate_guild_indexes(guild_id_str: str | None = None, updates: dict | None = None):
+    """Drop compiled per-guild lookups after a config change (all guilds if no id)."""
+    global _reaction_role_index_stale, _voice247_enabled_stale
+    if guild_id_str is None:
+        _auto_reply_matchers.clear()
+        _message_indexes.clear()
+        _reaction_role_index_stale = True
+        _voice247_enabled_stale = True
+        _voice247_wake()
+        return
+    if updates is None or "auto_replies" in updates:
+        _auto_reply_matchers.pop(guild_id_str, None)
+    if updates is None or "competition" in updates:
+        _reaction_role_update_guild(guild_id_str)
+    if updates is None or "voice_247" in updates:
+        _voice247_enabled_stale = True
+        _voice247_wake()
+    if updates is not None and set(updates) <= {"giveaway"}:
+        # Giveaway updates (entries, start/end) only matter here if the shortcut word changed.
+        index = _message_indexes.get(guild_id_str)
+        word = str((updates.get("giveaway") or {}).get("shortcut_word") or "").strip().lower()
+        if index is None or index["shortcut_word"] == word:
+            return
+    _message_indexes.pop(guild_id_str, None)
+
+
+def _build_message_index(guild_id) -> dict:
+    guild_cfg = get_guild_config(guild_id)
+
+    poem_channel_id = None
+    try:
+        if guild_cfg.get("poem_channel"):
+            poem_channel_id = int(guild_cfg.get("poem_channel"))
+    except (TypeError, ValueError):
+        pass
+
+    channel_auto: dict[int, list[dict]] = {}
+    for rule in (guild_cfg.get("channel_auto") or []):
+        if not rule or not rule.get("enabled", True):
+            continue
+        try:
+            channel_id = int(rule.get("channel_id", 0) or 0)
+        except (TypeError, ValueError):
+            continue
+        if not channel_id:
+            continue
+        channel_auto.setdefault(channel_id, []).append(
+            {
+                "reply": str(rule.get("reply", "")).strip(),
+                "mention": bool(rule.get("mention", False)),
+                "reactions": [str(e).strip() for e in (rule.get("reactions") or [])],
+            }
+        )
+
+    shortcut_word = str(get_giveaway_config(guild_id).get("shortcut_word") or "").strip()
+    mod_shortcuts = bool(get_mod_config(guild_id).get("shortcuts"))
+    has_auto_replies = any(r and r.get("enabled", True) for r in (guild_cfg.get("auto_replies") or []))
+
+    channels = set(channel_auto)
+    if poem_channel_id:
+        channels.add(poem_channel_id)
+
+    return {
+        "poem_channel": poem_channel_id,
+        "channel_auto": channel_auto,
+        "shortcut_word": shortcut_word.lower(),
+        "mod_shortcuts": mod_shortcuts,
+        "auto_replies": has_auto_replies,
+        "channels": channels,
+        "all_channels": has_auto_replies or bool(shortcut_word) or mod_shortcuts,
+    }
+
+
+def _get_message_index(guild_id) -> dict:
+    load_config()  # throttled check for external edits; a reload clears the indexes
+    key = str(guild_id)
+    index = _message_indexes.get(key)
+    if index is None:
+        index = _build_message_index(guild_id)
+        _message_indexes[key] = index
+    return index
+
+
 def _parse_role_ids_from_text(text: str | None) -> list[int]:
     """Parse role IDs from a string.
 
@@ -623,6 +1371,64 @@ def _parse_role_ids_from_text(text: str | None) -> list[int]:
     return out
 
 
+_member_lru: OrderedDict[tuple[int, int], tuple[float, discord.Member]] = OrderedDict()
+_member_fetch_counts: dict[int, int] = {}
+_member_chunk_tasks: dict[int, asyncio.Task] = {}
+
+
+def _member_lru_forget(guild_id: int, member_id: int):
+    """Drop a cached member after changing it (its roles would be stale)."""
+    _member_lru.pop((guild_id, member_id), None)
+
+
+async def _get_member(guild: discord.Guild, member_id: int) -> discord.Member | None:
+    """Member from the gateway cache, the fetched-member LRU or the API (in that order)."""
+    member = guild.get_member(member_id)
+    if member is not None:
+        return member
+
+    key = (guild.id, member_id)
+    cached = _member_lru.get(key)
+    if cached is not None:
+        if time.monotonic() - cached[0] < MEMBER_LRU_TTL_SECONDS:
+            _member_lru.move_to_end(key)
+            return cached[1]
+        del _member_lru[key]
+
+    try:
+        member = await guild.fetch_member(member_id)
+    except discord.NotFound:
+        return None
+
+    if MEMBER_LRU_SIZE > 0:
+        _member_lru[key] = (time.monotonic(), member)
+        while len(_member_lru) > MEMBER_LRU_SIZE:
+            _member_lru.popitem(last=False)
+
+    # A guild that keeps needing members is cheaper to chunk once (members intent only).
+    count = _member_fetch_counts.get(guild.id, 0) + 1
+    _member_fetch_counts[guild.id] = count
+    if (
+        intents.members
+        and MEMBER_CHUNK_AFTER_FETCHES > 0
+        and count >= MEMBER_CHUNK_AFTER_FETCHES
+        and not guild.chunked
+        and guild.id not in _member_chunk_tasks
+    ):
+        _member_chunk_tasks[guild.id] = asyncio.create_task(_chunk_guild(guild))
+    return member
+
+
+async def _chunk_guild(guild: discord.Guild):
+    try:
+        started = time.monotonic()
+        await guild.chunk(cache=True)
+        logger.info(f"Chunked guild {guild.id} on demand: {guild.member_count} members in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Chunking guild {guild.id} failed: {e}")
+        _member_chunk_tasks.pop(guild.id, None)
+
+
 def _member_has_any_role(member: discord.Member, role_ids: list[int]) -> bool:
     if not role_ids:
         return True
@@ -877,36 +1683,23 @@ class AutoReplyTestModal(discord.ui.Modal):
             items = get_auto_replies_config(interaction.guild_id)
             content = self.text.value
 
-            for idx, rule in enumerate(items, start=1):
-                if not rule or not rule.get("enabled", True):
-                    continue
-
-                allowed_roles = rule.get("allowed_role_ids")
-                if isinstance(allowed_roles, list) and allowed_roles:
-                    if not _member_has_any_role(interaction.user, allowed_roles):
-                        continue
-                trigger = str(rule.get("trigger", "")).strip()
-                reply = str(rule.get("reply", "")).strip()
-                if not trigger or not reply:
+            for compiled in _get_auto_reply_matcher(interaction.guild_id, items).matches(content):
+                allowed_roles = compiled["allowed_role_ids"]
+                if allowed_roles and not _member_has_any_role(interaction.user, allowed_roles):
                     continue
 
-                if _matches_trigger(
-                    content,
-                    trigger,
-                    match_type=_normalize_match_type(rule.get("match")),
-                    case_sensitive=bool(rule.get("case_sensitive", False)),
-                ):
-                    mention = bool(rule.get("mention", False))
-                    mode = _normalize_reply_mode(rule.get("mode"))
-                    preview = f"{interaction.user.mention} {reply}" if mention else reply
-                    embed = discord.Embed(
-                        title="✅ Match Found | تم العثور",
-                        description=f"Rule | رقم: `{idx}`\nOptions | خيارات: `{rule.get('match','contains')}` / `{mode}` / mention={mention}",
-                        color=discord.Color.green(),
-                    )
-                    embed.add_field(name="Trigger | كلمة", value=trigger[:1024], inline=False)
-                    embed.add_field(name="Bot would send | سيرسل", value=preview[:1024], inline=False)
-                    return await interaction.response.send_message(embed=embed, ephemeral=True)
+                idx, rule, reply = compiled["index"], compiled["rule"], compiled["reply"]
+                mention = compiled["mention"]
+                mode = compiled["mode"]
+                preview = f"{interaction.user.mention} {reply}" if mention else reply
+                embed = discord.Embed(
+                    title="✅ Match Found | تم العثور",
+                    description=f"Rule | رقم: `{idx}`\nOptions | خيارات: `{rule.get('match','contains')}` / `{mode}` / mention={mention}",
+                    color=discord.Color.green(),
+                )
+                embed.add_field(name="Trigger | كلمة", value=compiled["trigger"][:1024], inline=False)
+                embed.add_field(name="Bot would send | سيرسل", value=preview[:1024], inline=False)
+                return await interaction.response.send_message(embed=embed, ephemeral=True)
 
             await interaction.response.send_message("❌ No match | لا يوجد تطابق", ephemeral=True)
         except Exception as e:
@@ -1263,6 +2056,37 @@ class ChannelAutoPanelView(discord.ui.View):
 # Giveaway helpers
 GIVEAWAY_DURATION_REGEX = re.compile(r"^(\d+)(s|m|h|d|w)$", re.IGNORECASE)
 _giveaway_watcher_task: asyncio.Task | None = None
+# (end_ts, guild_id, message_id) for every active giveaway; the watcher sleeps until heap[0].
+_giveaway_heap: list[tuple[int, int, int]] = []
+_giveaway_wakeup: asyncio.Event | None = None
+# Giveaways ending at the same time run as separate tasks: at most this many at once,
+# one at a time per guild, each cut off after the timeout.
+GIVEAWAY_END_CONCURRENCY = int(os.getenv("GIVEAWAY_END_CONCURRENCY", "4"))
+GIVEAWAY_END_TIMEOUT_SECONDS = float(os.getenv("GIVEAWAY_END_TIMEOUT_SECONDS", "300"))
+_giveaway_end_semaphore: asyncio.Semaphore | None = None
+_giveaway_guild_locks: dict[int, asyncio.Lock] = {}
+_giveaway_end_tasks: set[asyncio.Task] = set()
+_giveaway_end_stats = {"ended": 0, "errors": 0, "timeouts": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+# A failed end is retried with a backoff (60s, 120s, 240s...); after the last attempt the
+# giveaway is removed from the active list so it can't end twice after a restart.
+GIVEAWAY_END_MAX_ATTEMPTS = 4
+GIVEAWAY_END_RETRY_SECONDS = 60
+_giveaway_end_attempts: dict[int, int] = {}  # message_id -> failed attempts
+# Entrants are tracked live from raw reaction events (see _giveaway_entrants).
+# message_id -> guild_id / reaction emoji of active giveaways (O(1) checks in the reaction
+# handlers, without building the guild's giveaway config).
+_giveaway_by_message: dict[int, int] = {}
+_giveaway_emoji: dict[int, str] = {}
+# Giveaways whose stored entrants are known complete (started or reconciled in this process).
+_giveaway_reconciled: set[int] = set()
+# message_id -> [(user_id, added)] seen while a reconciliation is paging the REST list.
+_giveaway_reconcile_events: dict[int, list[tuple[int, bool]]] = {}
+# message_id -> entrant ids. Entrants are stored row by row in GIVEAWAY_DB_FILE, not in the
+# guild config, so a reaction costs O(1) and writes one row however many people entered.
+_giveaway_entrants: dict[int, set[int]] = {}
+# Entrant rows not written yet (message_id -> {user_id: entered}), flushed after a short delay.
+_giveaway_entrant_changes: dict[int, dict[int, bool]] = {}
+_giveaway_entrant_flush_handle: asyncio.TimerHandle | None = None
 
 
 def _parse_giveaway_duration_seconds(duration_str: str | None) -> int | None:
@@ -1281,12 +2105,9 @@ def _parse_giveaway_duration_seconds(duration_str: str | None) -> int | None:
 
 
 def get_giveaway_config(guild_id: int) -> dict:
-    guild_cfg = get_guild_config(guild_id)
-    gw = guild_cfg.get("giveaway")
-    if not isinstance(gw, dict):
-        gw = {}
+    """Giveaway settings with defaults filled in memory; persist changes via update_guild_config."""
+    gw = _config_section(get_guild_config(guild_id), "giveaway")
 
-    changed = False
     defaults = {
         "channel_id": None,
         "host_role_ids": [],
@@ -1309,18 +2130,13 @@ def get_giveaway_config(guild_id: int) -> dict:
         "active": [],
     }
 
-    for k, v in defaults.items():
-        if k not in gw:
-            gw[k] = v
-            changed = True
+    _apply_defaults(gw, defaults)
 
     # Back-compat keys
     if "emoji" in gw and "reaction_emoji" not in gw:
         gw["reaction_emoji"] = gw.get("emoji")
-        changed = True
     if "color" in gw and "embed_color" not in gw and isinstance(gw.get("color"), str):
         gw["embed_color"] = gw.get("color")
-        changed = True
 
     # Migrate old shortcut toggle -> shortcut word
     if "shortcut_word" not in gw:
@@ -1328,54 +2144,37 @@ def get_giveaway_config(guild_id: int) -> dict:
             gw["shortcut_word"] = "gstart"
         else:
             gw["shortcut_word"] = ""
-        changed = True
     if "shortcut_enabled" in gw:
         # keep config clean
         try:
             gw.pop("shortcut_enabled", None)
         except Exception:
             pass
-        changed = True
 
     # Ensure types
     if not isinstance(gw.get("host_role_ids"), list):
         gw["host_role_ids"] = []
-        changed = True
     if not isinstance(gw.get("active"), list):
         gw["active"] = []
-        changed = True
-
-    if changed:
-        update_guild_config(guild_id, {"giveaway": gw})
     return gw
 
 
-def get_competition_config(guild_id: int) -> dict:
-    guild_cfg = get_guild_config(guild_id)
-    comp = guild_cfg.get("competition")
-    if not isinstance(comp, dict):
-        comp = {}
+_COMPETITION_DEFAULTS = {
+    "channel_id": None,
+    "message_id": None,
+    "role_id": None,
+    "reaction_emoji": "🎯",
+    "embed_color": "#5865F2",
+    "title": "🏆 Competition | مسابقة",
+    "description": "React with {emoji} to get the role | تفاعل بـ {emoji} للحصول على الرتبة",
+    "image_url": "",
+    "footer_text": "",
+}
 
-    changed = False
-    defaults = {
-        "channel_id": None,
-        "message_id": None,
-        "role_id": None,
-        "reaction_emoji": "🎯",
-        "embed_color": "#5865F2",
-        "title": "🏆 Competition | مسابقة",
-        "description": "React with {emoji} to get the role | تفاعل بـ {emoji} للحصول على الرتبة",
-        "image_url": "",
-        "footer_text": "",
-    }
-    for k, v in defaults.items():
-        if k not in comp:
-            comp[k] = v
-            changed = True
 
-    if changed:
-        update_guild_config(guild_id, {"competition": comp})
-    return comp
+def get_competition_config(guild_id: int) -> dict:
+    comp = _config_section(get_guild_config(guild_id), "competition")
+    return _apply_defaults(comp, _COMPETITION_DEFAULTS)
 
 
 def _safe_format(template: str, **kwargs) -> str:
@@ -1522,35 +2321,8 @@ def _build_competition_settings_embed(guild: discord.Guild, comp: dict) -> disco
     return embed
 
 
-async def _giveaway_end_one(guild_id: int, record: dict):
-    try:
-        channel_id = int(record.get("channel_id"))
-        message_id = int(record.get("message_id"))
-        end_ts = int(record.get("end_ts"))
-        prize = str(record.get("prize", ""))
-        winners_count = int(record.get("winners", 1))
-        host_id = int(record.get("host_id"))
-        reaction_emoji = str(record.get("reaction_emoji") or "🎉")
-    except Exception:
-        return
-
-    channel = bot.get_channel(channel_id)
-    if channel is None:
-        try:
-            channel = await bot.fetch_channel(channel_id)
-        except Exception:
-            return
-
-    try:
-        message = await channel.fetch_message(message_id)
-    except Exception:
-        return
-
-    guild = message.guild
-    giveaway_cfg = get_giveaway_config(guild_id)
-    giveaway_cfg["reaction_emoji"] = reaction_emoji
-
-    # Gather entries from reactions
+async def _giveaway_fetch_entrants(message: discord.Message, reaction_emoji: str) -> list[int]:
+    """Page every non-bot user who reacted with `reaction_emoji` (REST, slow for big giveaways)."""
     entries: list[int] = []
     try:
         target_reaction = None
@@ -1566,17 +2338,216 @@ async def _giveaway_end_one(guild_id: int, record: dict):
                 entries.append(int(user.id))
     except Exception:
         entries = []
+    return entries
 
-    # Dedup while preserving order
-    seen: set[int] = set()
-    entries = [x for x in entries if not (x in seen or seen.add(x))]
 
-    if not entries:
-        winners_ids: list[int] = []
+def _giveaway_find_active(guild_id: int, message_id: int) -> tuple[dict, dict | None]:
+    gw = get_giveaway_config(guild_id)
+    for record in (gw.get("active") or []):
+        if str(record.get("message_id")) == str(message_id):
+            return gw, record
+    return gw, None
+
+
+def _giveaway_entrant_set(message_id: int) -> set[int]:
+    entrants = _giveaway_entrants.get(message_id)
+    if entrants is None:
+        try:
+            entrants = load_giveaway_entrants(GIVEAWAY_DB_FILE, [message_id])[message_id]
+        except Exception as e:
+            logger.error(f"Error loading giveaway {message_id} entrants: {e}")
+            entrants = set()
+        _giveaway_entrants[message_id] = entrants
+    return entrants
+
+
+def _giveaway_store_write(func, *args):
+    """Persist entrant rows on the (ordered) config writer thread."""
+    def _run():
+        try:
+            func(GIVEAWAY_DB_FILE, *args)
+        except Exception as e:
+            logger.error(f"Error saving giveaway entrants: {e}")
+    _config_executor.submit(_run)
+
+
+def _giveaway_flush_entrants(sync: bool = False):
+    global _giveaway_entrant_flush_handle
+    if _giveaway_entrant_flush_handle is not None:
+        _giveaway_entrant_flush_handle.cancel()
+        _giveaway_entrant_flush_handle = None
+    if not _giveaway_entrant_changes:
+        return
+    changes = dict(_giveaway_entrant_changes)
+    _giveaway_entrant_changes.clear()
+    if sync:
+        try:
+            apply_giveaway_entrant_changes(GIVEAWAY_DB_FILE, changes)
+        except Exception as e:
+            logger.error(f"Error saving giveaway entrants: {e}")
     else:
-        winners_ids = random.sample(entries, k=min(max(1, winners_count), len(entries)))
+        _giveaway_store_write(apply_giveaway_entrant_changes, changes)
+
 
+atexit.register(_giveaway_flush_entrants, True)
+
+
+def _giveaway_entrant_changed(message_id: int, user_id: int, entered: bool):
+    """Queue one entrant row change; changes within CONFIG_FLUSH_DELAY_SECONDS share a write."""
+    global _giveaway_entrant_flush_handle
+    _giveaway_entrant_changes.setdefault(message_id, {})[user_id] = entered
+    if _giveaway_entrant_flush_handle is not None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _giveaway_flush_entrants(sync=True)
+        return
+    _giveaway_entrant_flush_handle = loop.call_later(CONFIG_FLUSH_DELAY_SECONDS, _giveaway_flush_entrants)
+
+
+def _giveaway_entrants_replaced(message_id: int, user_ids):
+    """Store a giveaway's full entrant list (queued row changes for it are superseded)."""
+    _giveaway_entrant_changes.pop(message_id, None)
+    _giveaway_store_write(replace_giveaway_entrants, message_id, list(user_ids))
+
+
+def _giveaway_forget(message_id: int):
+    """Drop the state of a giveaway that ended or was removed, including its entrant rows."""
+    _giveaway_by_message.pop(message_id, None)
+    _giveaway_emoji.pop(message_id, None)
+    _giveaway_reconciled.discard(message_id)
+    _giveaway_entrants.pop(message_id, None)
+    _giveaway_entrants_replaced(message_id, [])
+
+
+def _giveaway_track_reaction(payload: discord.RawReactionActionEvent, added: bool):
+    """Keep the entrant set of an active giveaway in sync with its reactions."""
+    message_id = int(payload.message_id)
+    if message_id not in _giveaway_by_message or payload.user_id == bot.user.id:
+        return
+    if added and payload.member is not None and payload.member.bot:
+        return
+    if str(payload.emoji) != _giveaway_emoji.get(message_id, "🎉"):
+        return
+
+    user_id = int(payload.user_id)
+    pending = _giveaway_reconcile_events.get(message_id)
+    if pending is not None:
+        pending.append((user_id, added))
+
+    entrants = _giveaway_entrant_set(message_id)
+    if added:
+        if user_id in entrants:
+            return
+        entrants.add(user_id)
+    else:
+        if user_id not in entrants:
+            return
+        entrants.discard(user_id)
+    _giveaway_entrant_changed(message_id, user_id, added)
+
+
+async def _giveaway_reconcile(guild_id: int, message_id: int):
+    """Rebuild a giveaway's entrants from the REST list (after downtime we may have missed events)."""
+    _, record = _giveaway_find_active(guild_id, message_id)
+    if record is None:
+        return
+    try:
+        channel = bot.get_channel(int(record.get("channel_id"))) or await bot.fetch_channel(int(record.get("channel_id")))
+        message = await channel.fetch_message(int(message_id))
+    except Exception:
+        return
+
+    _giveaway_reconcile_events[message_id] = []
+    try:
+        entries = await _giveaway_fetch_entrants(message, str(record.get("reaction_emoji") or "🎉"))
+    finally:
+        events = _giveaway_reconcile_events.pop(message_id, [])
+
+    # Replay reactions that arrived while paging; the REST snapshot may predate them.
+    current = dict.fromkeys(entries)
+    for user_id, added in events:
+        if added:
+            current[user_id] = None
+        else:
+            current.pop(user_id, None)
+
+    _, record = _giveaway_find_active(guild_id, message_id)
+    if record is None:
+        return
+    _giveaway_entrants[message_id] = set(current)
+    _giveaway_entrants_replaced(message_id, current)
+    _giveaway_reconciled.add(message_id)
+
+
+async def _giveaway_announcement_sent(channel, text: str, end_ts: int) -> bool:
+    """Whether our winners message is already in the channel (a cancelled send may have landed)."""
+    after = datetime.utcfromtimestamp(max(0, end_ts - 60))
+    async for message in channel.history(limit=100, after=after):
+        if message.author.id == bot.user.id and message.content == text:
+            return True
+    return False
+
+
+async def _giveaway_end_one(guild_id: int, record: dict):
+    """Announce a giveaway's winners. Raises on failure so the caller retries it."""
+    channel_id = int(record.get("channel_id"))
+    message_id = int(record.get("message_id"))
+    end_ts = int(record.get("end_ts"))
+    prize = str(record.get("prize", ""))
+    winners_count = int(record.get("winners", 1))
+    host_id = int(record.get("host_id"))
+    reaction_emoji = str(record.get("reaction_emoji") or "🎉")
+
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        channel = await bot.fetch_channel(channel_id)
+    message = await channel.fetch_message(message_id)
+
+    guild = message.guild
+    # Copy: the config is shared in memory and this override is only for this giveaway.
+    giveaway_cfg = dict(get_giveaway_config(guild_id))
+    giveaway_cfg["reaction_emoji"] = reaction_emoji
+
+    claim = record.get("announcement")
+    retry = claim is not None
+    if claim is None:
+        # Entries were tracked from reaction events; page the REST list only if they can't be trusted.
+        if message_id in _giveaway_reconciled:
+            entries = list(_giveaway_entrant_set(message_id))
+        else:
+            entries = await _giveaway_fetch_entrants(message, reaction_emoji)
+
+        # Dedup while preserving order
+        seen: set[int] = set()
+        entries = [x for x in entries if not (x in seen or seen.add(x))]
+
+        if not entries:
+            winners_ids: list[int] = []
+        else:
+            winners_ids = random.sample(entries, k=min(max(1, winners_count), len(entries)))
+        winner_mentions = " ".join(f"<@{uid}>" for uid in winners_ids) if winners_ids else "—"
+
+        if winners_ids:
+            template = giveaway_cfg.get(
+                "winners_announcement_template",
+                "🎉 **Winners | الفائزون:** {winner_mentions}\n**Prize | الجائزة:** {prize}",
+            )
+            text = _safe_format(template, winner_mentions=winner_mentions, prize=prize)
+        else:
+            template = giveaway_cfg.get(
+                "no_winner_announcement_template",
+                "❌ No valid entries | لا توجد مشاركات صحيحة\n**Prize | الجائزة:** {prize}",
+            )
+            text = _safe_format(template, prize=prize)
+        # Claim the result before sending: a retry reuses these winners and checks whether
+        # the message already landed instead of drawing and announcing again.
+        claim = record["announcement"] = {"winners": winners_ids, "text": text}
+        update_guild_config(guild_id, {"giveaway": get_giveaway_config(guild_id)})
+    winners_ids = [int(x) for x in claim.get("winners") or []]
     winner_mentions = " ".join(f"<@{uid}>" for uid in winners_ids) if winners_ids else "—"
+
     host_member = guild.get_member(host_id) or guild.me
     host_mention = host_member.mention if host_member else f"<@{host_id}>"
 
@@ -1596,57 +2567,173 @@ async def _giveaway_end_one(guild_id: int, record: dict):
     except Exception:
         pass
 
-    try:
-        if winners_ids:
-            template = giveaway_cfg.get(
-                "winners_announcement_template",
-                "🎉 **Winners | الفائزون:** {winner_mentions}\n**Prize | الجائزة:** {prize}",
-            )
-            msg = _safe_format(template, winner_mentions=winner_mentions, prize=prize)
-            await channel.send(msg)
-        else:
-            template = giveaway_cfg.get(
-                "no_winner_announcement_template",
-                "❌ No valid entries | لا توجد مشاركات صحيحة\n**Prize | الجائزة:** {prize}",
-            )
-            msg = _safe_format(template, prize=prize)
-            await channel.send(msg)
-    except Exception:
-        pass
+    if not (retry and await _giveaway_announcement_sent(channel, claim["text"], end_ts)):
+        await channel.send(claim["text"])
+    record["announced"] = True
+
+
+def _giveaway_schedule(guild_id: int, record: dict, due_ts: int | None = None):
+    """Add an active giveaway to the watcher's heap and wake it if this one ends sooner."""
+    try:
+        entry = (int(due_ts or record.get("end_ts") or 0), int(guild_id), int(record.get("message_id")))
+    except Exception:
+        return
+    if not entry[0]:
+        return
+    _giveaway_by_message[entry[2]] = entry[1]
+    _giveaway_emoji[entry[2]] = str(record.get("reaction_emoji") or "🎉")
+    if "entrants" in record:
+        # Older configs kept the entrant list in the record: move it to the entrant store.
+        entrants = {int(x) for x in (record.pop("entrants") or [])}
+        _giveaway_entrants[entry[2]] = entrants
+        _giveaway_entrants_replaced(entry[2], entrants)
+        _config_mark_dirty(guild_id)
+    heapq.heappush(_giveaway_heap, entry)
+    if _giveaway_wakeup is not None:
+        _giveaway_wakeup.set()
+
+
+def _giveaway_ensure_runtime():
+    global _giveaway_wakeup, _giveaway_end_semaphore
+    if _giveaway_wakeup is None:
+        _giveaway_wakeup = asyncio.Event()
+    if _giveaway_end_semaphore is None:
+        _giveaway_end_semaphore = asyncio.Semaphore(max(1, GIVEAWAY_END_CONCURRENCY))
+
+
+def _giveaway_load_guilds(guilds):
+    """Seed the heap from the stored active giveaways of `guilds` (once per shard, at startup).
+
+    Reactions made while the bot was offline were never seen, so each loaded giveaway is
+    reconciled once; until that finishes, ending it falls back to paging the REST list.
+    """
+    _giveaway_ensure_runtime()
+    loaded: list[tuple[int, int, int]] = []
+    for g in guilds:
+        try:
+            for record in list(get_giveaway_config(g.id).get("active") or []):
+                if int(record.get("message_id") or 0) in _giveaway_by_message:
+                    continue
+                _giveaway_schedule(g.id, record)
+                loaded.append((int(record.get("end_ts") or 0), int(g.id), int(record.get("message_id"))))
+        except Exception:
+            continue
+    # Stored entrants for all of them in one read, instead of one per first reaction.
+    try:
+        missing = [m for _, _, m in loaded if m not in _giveaway_entrants]
+        _giveaway_entrants.update(load_giveaway_entrants(GIVEAWAY_DB_FILE, missing))
+    except Exception as e:
+        logger.error(f"Error loading giveaway entrants: {e}")
+    for _end_ts, guild_id, message_id in sorted(loaded):
+        _giveaway_spawn(_giveaway_reconcile_limited(guild_id, message_id))
+
+
+async def _giveaway_end_due(guild_id: int, message_id: int):
+    gw = get_giveaway_config(guild_id)
+    active = list(gw.get("active") or [])
+    record = next((r for r in active if str(r.get("message_id")) == str(message_id)), None)
+    if record is None:
+        return  # already ended or removed; stale heap entry
+
+    if not record.get("announced"):
+        await _giveaway_end_one(guild_id, record)
+    gw["active"] = [r for r in (gw.get("active") or []) if r is not record]
+    update_guild_config(guild_id, {"giveaway": gw})
+    _giveaway_forget(int(message_id))
+
+
+async def _giveaway_end_task(guild_id: int, message_id: int):
+    lock = _giveaway_guild_locks.setdefault(guild_id, asyncio.Lock())
+    async with lock, _giveaway_end_semaphore:
+        started = time.monotonic()
+        outcome = "ended"
+        try:
+            await asyncio.wait_for(_giveaway_end_due(guild_id, message_id), timeout=GIVEAWAY_END_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            outcome = "timeouts"
+            logger.error(f"Giveaway {message_id} in guild {guild_id} timed out after {GIVEAWAY_END_TIMEOUT_SECONDS:.0f}s")
+        except Exception as e:
+            outcome = "errors"
+            logger.error(f"Giveaway end error: {e}")
+        elapsed = time.monotonic() - started
+        if outcome == "ended":
+            _giveaway_end_attempts.pop(message_id, None)
+        else:
+            _giveaway_end_failed(guild_id, message_id)
+
+    stats = _giveaway_end_stats
+    stats[outcome] += 1
+    stats["total_seconds"] += elapsed
+    stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+    done = stats["ended"] + stats["errors"] + stats["timeouts"]
+    logger.info(
+        f"Giveaway {message_id} (guild {guild_id}) {outcome} in {elapsed:.2f}s "
+        f"[total={done} avg={stats['total_seconds'] / done:.2f}s max={stats['max_seconds']:.2f}s "
+        f"errors={stats['errors']} timeouts={stats['timeouts']}]"
+    )
+
+
+def _giveaway_end_failed(guild_id: int, message_id: int):
+    """Retry a failed end with a backoff, or give up and drop it from the active list."""
+    _, record = _giveaway_find_active(guild_id, message_id)
+    if record is None:
+        _giveaway_end_attempts.pop(message_id, None)
+        return
+    attempts = _giveaway_end_attempts.get(message_id, 0) + 1
+    if attempts < GIVEAWAY_END_MAX_ATTEMPTS:
+        _giveaway_end_attempts[message_id] = attempts
+        delay = GIVEAWAY_END_RETRY_SECONDS * 2 ** (attempts - 1)
+        _giveaway_schedule(guild_id, record, due_ts=int(datetime.utcnow().timestamp()) + delay)
+        if record.get("announced"):
+            update_guild_config(guild_id, {"giveaway": get_giveaway_config(guild_id)})
+        logger.warning(f"Giveaway {message_id} (guild {guild_id}): attempt {attempts} failed, retrying in {delay}s")
+        return
+
+    _giveaway_end_attempts.pop(message_id, None)
+    gw = get_giveaway_config(guild_id)
+    gw["active"] = [r for r in (gw.get("active") or []) if r is not record]
+    update_guild_config(guild_id, {"giveaway": gw})
+    _giveaway_forget(int(message_id))
+    logger.error(f"Giveaway {message_id} (guild {guild_id}): removed after {attempts} failed attempts")
+
+
+def _giveaway_spawn(coro):
+    task = asyncio.create_task(coro)
+    _giveaway_end_tasks.add(task)
+    task.add_done_callback(_giveaway_end_tasks.discard)
+
+
+async def _giveaway_reconcile_limited(guild_id: int, message_id: int):
+    lock = _giveaway_guild_locks.setdefault(guild_id, asyncio.Lock())
+    async with lock, _giveaway_end_semaphore:
+        try:
+            await asyncio.wait_for(_giveaway_reconcile(guild_id, message_id), timeout=GIVEAWAY_END_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error(f"Giveaway {message_id} reconcile error: {e!r}")
 
 
 async def _giveaway_watcher_loop():
-    await bot.wait_until_ready()
+    _giveaway_ensure_runtime()
     while not bot.is_closed():
+        _giveaway_wakeup.clear()
+        if not _giveaway_heap:
+            await _giveaway_wakeup.wait()
+            continue
+
         now_ts = int(datetime.utcnow().timestamp())
-        for g in list(getattr(bot, "guilds", []) or []):
+        delay = _giveaway_heap[0][0] - now_ts
+        if delay > 0:
             try:
-                gw = get_giveaway_config(g.id)
-                active = list(gw.get("active") or [])
-                if not active:
-                    continue
-
-                remaining: list[dict] = []
-                changed = False
-                for record in active:
-                    try:
-                        end_ts = int(record.get("end_ts"))
-                    except Exception:
-                        end_ts = 0
-
-                    if end_ts and end_ts <= now_ts:
-                        await _giveaway_end_one(g.id, record)
-                        changed = True
-                    else:
-                        remaining.append(record)
-
-                if changed:
-                    gw["active"] = remaining
-                    update_guild_config(g.id, {"giveaway": gw})
-            except Exception:
-                continue
+                await asyncio.wait_for(_giveaway_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
 
-        await asyncio.sleep(15)
+        while _giveaway_heap and _giveaway_heap[0][0] <= now_ts:
+            _end_ts, guild_id, message_id = heapq.heappop(_giveaway_heap)
+            if _giveaway_by_message.get(message_id) != guild_id:
+                continue  # ended, or its guild was left
+            _giveaway_spawn(_giveaway_end_task(guild_id, message_id))
 
 
 def _giveaway_user_can_host(member: discord.Member, giveaway_cfg: dict) -> bool:
@@ -2149,6 +3236,11 @@ class GiveawayCreateModal(discord.ui.Modal, title="Giveaway | سحب"):
         )
         gw["active"] = active
         update_guild_config(interaction.guild_id, {"giveaway": gw})
+        _giveaway_schedule(interaction.guild_id, active[-1])
+        _giveaway_entrants[int(message.id)] = set()
+        # Catch reactions made before the record existed (one REST page at this point).
+        if _giveaway_end_semaphore is not None:
+            _giveaway_spawn(_giveaway_reconcile_limited(interaction.guild_id, int(message.id)))
 
         await interaction.response.send_message("✅ Giveaway started | تم بدء السحب", ephemeral=True)
 
@@ -2220,6 +3312,77 @@ def _competition_emoji_matches(stored: str, payload_emoji: discord.PartialEmoji)
         return False
 
 
+# message_id -> [(guild_id, emoji, role_id)] for every reaction-role message, so the raw
+# reaction handlers can drop unrelated reactions with one dict lookup. A competition
+# change updates only that guild's entries (see _invalidate_guild_indexes); a full
+# config reload marks the index stale and it is rebuilt lazily.
+_reaction_role_index: dict[int, list[tuple[int, str, int]]] = {}
+_reaction_role_messages: dict[int, list[int]] = {}  # guild_id -> its message ids in the index
+_reaction_role_index_stale = True
+
+
+def _reaction_role_bindings(guild_cfg: dict) -> list[tuple[int, str, int]]:
+    """(message_id, emoji, role_id) reaction-role bindings configured for one guild."""
+    bindings = []
+    comp = guild_cfg.get("competition")
+    if isinstance(comp, dict) and comp.get("message_id") and comp.get("role_id"):
+        try:
+            bindings.append((int(comp["message_id"]), str(comp.get("reaction_emoji") or "🎯"), int(comp["role_id"])))
+        except (TypeError, ValueError):
+            pass
+    return bindings
+
+
+def _reaction_role_rebuild():
+    global _reaction_role_index_stale
+    _reaction_role_index.clear()
+    _reaction_role_messages.clear()
+    servers = load_config().get("servers")
+    if isinstance(servers, dict):
+        for gid, guild_cfg in servers.items():
+            if isinstance(guild_cfg, dict):
+                _reaction_role_add_guild(int(gid), guild_cfg)
+    _reaction_role_index_stale = False
+
+
+def _reaction_role_add_guild(guild_id: int, guild_cfg: dict):
+    for message_id, emoji, role_id in _reaction_role_bindings(guild_cfg):
+        _reaction_role_index.setdefault(message_id, []).append((guild_id, emoji, role_id))
+        _reaction_role_messages.setdefault(guild_id, []).append(message_id)
+
+
+def _reaction_role_update_guild(guild_id_str: str):
+    """Replace one guild's entries in the index after its config changed."""
+    if _reaction_role_index_stale:
+        return  # the pending rebuild picks the change up
+    guild_id = int(guild_id_str)
+    for message_id in _reaction_role_messages.pop(guild_id, []):
+        bindings = [b for b in _reaction_role_index.get(message_id, []) if b[0] != guild_id]
+        if bindings:
+            _reaction_role_index[message_id] = bindings
+        else:
+            _reaction_role_index.pop(message_id, None)
+    servers = (_config_cache or {}).get("servers")
+    guild_cfg = servers.get(guild_id_str) if isinstance(servers, dict) else None
+    if isinstance(guild_cfg, dict):
+        _reaction_role_add_guild(guild_id, guild_cfg)
+
+
+def _reaction_role_lookup(guild_id: int, message_id: int, payload_emoji: discord.PartialEmoji) -> list[int]:
+    """Role IDs bound to this reaction (usually empty)."""
+    load_config()  # throttled check for external edits; a reload marks the index stale
+    if _reaction_role_index_stale:
+        _reaction_role_rebuild()
+    bindings = _reaction_role_index.get(int(message_id))
+    if not bindings:
+        return []
+    return [
+        role_id
+        for gid, emoji, role_id in bindings
+        if gid == int(guild_id) and _competition_emoji_matches(emoji, payload_emoji)
+    ]
+
+
 class CompetitionEmbedModal(discord.ui.Modal):
     def __init__(self, guild_id: int):
         super().__init__(title="Competition Embed | إيمبد المسابقة")
@@ -2501,6 +3664,21 @@ _voice247_next_attempt_at: dict[int, float] = {}
 _voice247_backoff_seconds: dict[int, float] = {}
 _voice247_suppress_until: dict[int, float] = {}
 _voice247_manual_until: dict[int, float] = {}
+# Guilds with voice_247.enabled; the supervisor only ever looks at these.
+_voice247_enabled_guilds: set[int] = set()
+_voice247_enabled_stale = True
+_voice247_wakeup: asyncio.Event | None = None
+# Safety-net sweep over enabled guilds; state changes wake the supervisor immediately.
+# The sweep only touches guilds whose voice connection is missing or wrong.
+VOICE247_CHECK_SECONDS = 30.0
+
+
+class _Voice247Client(discord.VoiceClient):
+    """VoiceClient that wakes the 24/7 supervisor as soon as the connection is torn down."""
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        _voice247_wake()
 
 
 def _voice247_lock_for(guild_id: int) -> asyncio.Lock:
@@ -2531,28 +3709,58 @@ def _voice247_set_manual_window(guild_id: int, seconds: float = 6.0):
     _voice247_manual_until[gid] = now + float(seconds)
 
 
+_VOICE247_DEFAULTS = {
+    "enabled": False,
+    "channel_id": None,
+    # "mic" in UI: mic ON => self_mute False
+    "self_mute": True,
+    "self_deaf": True,
+}
+
+
 def get_voice247_config(guild_id: int) -> dict:
-    guild_cfg = get_guild_config(guild_id)
-    v = guild_cfg.get("voice_247")
-    if not isinstance(v, dict):
-        v = {}
+    v = _config_section(get_guild_config(guild_id), "voice_247")
+    return _apply_defaults(v, _VOICE247_DEFAULTS)
+
+
+def _voice247_enabled() -> set[int]:
+    """IDs of guilds with 24/7 voice enabled (recomputed after voice_247 changes or a reload)."""
+    global _voice247_enabled_stale
+    load_config()  # throttled check for external edits; a reload marks the set stale
+    if _voice247_enabled_stale:
+        enabled = set()
+        servers = load_config().get("servers")
+        if isinstance(servers, dict):
+            for gid, guild_cfg in servers.items():
+                v = guild_cfg.get("voice_247") if isinstance(guild_cfg, dict) else None
+                if isinstance(v, dict) and v.get("enabled"):
+                    try:
+                        enabled.add(int(gid))
+                    except ValueError:
+                        pass
+        _voice247_enabled_guilds.clear()
+        _voice247_enabled_guilds.update(enabled)
+        _voice247_enabled_stale = False
+    return _voice247_enabled_guilds
 
-    changed = False
-    defaults = {
-        "enabled": False,
-        "channel_id": None,
-        # "mic" in UI: mic ON => self_mute False
-        "self_mute": True,
-        "self_deaf": True,
-    }
-    for k, dv in defaults.items():
-        if k not in v:
-            v[k] = dv
-            changed = True
 
-    if changed:
-        update_guild_config(guild_id, {"voice_247": v})
-    return v
+def _voice247_wake():
+    if _voice247_wakeup is not None:
+        _voice247_wakeup.set()
+
+
+def _voice247_healthy(guild: discord.Guild) -> bool:
+    """Connected to the configured channel with the configured mute/deafen (no API calls)."""
+    vc = guild.voice_client
+    if vc is None or not vc.is_connected() or vc.channel is None:
+        return False
+    cfg = get_voice247_config(guild.id)
+    if str(vc.channel.id) != str(cfg.get("channel_id")):
+        return False
+    state = guild.me.voice if guild.me else None
+    if state is None:
+        return True
+    return state.self_mute == bool(cfg.get("self_mute", True)) and state.self_deaf == bool(cfg.get("self_deaf", True))
 
 
 async def _voice247_ensure_connected(guild: discord.Guild, *, force: bool = False, reason: str = ""):
@@ -2567,19 +3775,10 @@ async def _voice247_ensure_connected(guild: discord.Guild, *, force: bool = Fals
     if not force and now and now < float(_voice247_manual_until.get(gid, 0.0)):
         return
 
-    cfg = get_voice247_config(guild.id)
-    if not cfg.get("enabled"):
+    if gid not in _voice247_enabled():
         _voice247_clear_retry_state(gid)
         return
 
-    channel_id = cfg.get("channel_id")
-    if not channel_id:
-        return
-
-    channel = guild.get_channel(int(channel_id))
-    if channel is None or not isinstance(channel, discord.VoiceChannel):
-        return
-
     # Respect backoff to prevent join/leave spam on handshake failures.
     if not force:
         next_at = float(_voice247_next_attempt_at.get(gid, 0.0))
@@ -2650,6 +3849,7 @@ async def _voice247_ensure_connected(guild: discord.Guild, *, force: bool = Fals
 
         try:
             await channel.connect(
+                cls=_Voice247Client,
                 self_mute=bool(cfg.get("self_mute", True)),
                 self_deaf=bool(cfg.get("self_deaf", True)),
             )
@@ -2688,16 +3888,17 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
             return
         if not member.guild:
             return
+        if int(member.guild.id) not in _voice247_enabled():
+            return
 
         cfg = get_voice247_config(member.guild.id)
-        if not cfg.get("enabled"):
-            return
 
         target_id = cfg.get("channel_id")
         if not target_id:
             return
 
-        # If kicked/disconnected OR moved to another channel, go back (but respect backoff).
+        # If kicked/disconnected OR moved to another channel, go back right away (but respect
+        # backoff). A moment's pause lets discord.py tear the old voice client down first.
         moved_or_kicked = (after.channel is None) or (int(after.channel.id) != int(target_id))
         if moved_or_kicked:
             await asyncio.sleep(1.0)
@@ -2707,17 +3908,34 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
 
 
 async def _voice247_loop():
+    """Supervise enabled guilds only; sleep until a config change, backoff expiry or the sweep."""
+    global _voice247_wakeup
     await bot.wait_until_ready()
+    _voice247_wakeup = asyncio.Event()
     while not bot.is_closed():
+        _voice247_wakeup.clear()
+        timeout = VOICE247_CHECK_SECONDS
         try:
-            for g in list(getattr(bot, "guilds", []) or []):
+            for gid in list(_voice247_enabled()):
+                g = bot.get_guild(gid)
+                if g is None or _voice247_healthy(g):
+                    continue
                 try:
                     await _voice247_ensure_connected(g)
                 except Exception:
                     continue
+
+            now = _voice247_now()
+            for gid in _voice247_enabled():
+                next_at = float(_voice247_next_attempt_at.get(gid, 0.0))
+                if next_at > now:
+                    timeout = min(timeout, next_at - now)
         except Exception:
             pass
-        await asyncio.sleep(30)
+        try:
+            await asyncio.wait_for(_voice247_wakeup.wait(), timeout=max(1.0, timeout))
+        except asyncio.TimeoutError:
+            pass
 
 
 def _voice247_panel_embed(guild: discord.Guild, cfg: dict) -> discord.Embed:
@@ -2889,34 +4107,216 @@ async def on_ready():
             bot.add_view(TicketControlPersistentView())
             bot._persistent_views_added = True
 
-        await bot.tree.sync()
+        # Reaction-role index, so the first reactions don't pay for building it.
+        _reaction_role_rebuild()
+
+        await _sync_command_tree()
         # Start rotating presence once
         if not getattr(bot, "_presence_task_started", False):
             bot._presence_task_started = True
             asyncio.create_task(_presence_rotator())
 
-        # Start giveaway watcher once
-        global _giveaway_watcher_task
-        if _giveaway_watcher_task is None or _giveaway_watcher_task.done():
-            _giveaway_watcher_task = asyncio.create_task(_giveaway_watcher_loop())
+        global _cluster_ipc_task
+        if CLUSTER_IPC_PORT and CLUSTER_IPC_TOKEN and (_cluster_ipc_task is None or _cluster_ipc_task.done()):
+            _cluster_ipc_task = asyncio.create_task(_cluster_ipc_loop())
+
+        logger.info(f"✅ Bot ready! Logged in as {bot.user} ({len(bot.shards)} shards)")
+    except Exception as e:
+        logger.error(f"Ready event error: {e}")
 
-        # Start voice 24/7 loop once
-        global _voice247_task
-        if _voice247_task is None or _voice247_task.done():
-            _voice247_task = asyncio.create_task(_voice247_loop())
 
+# Slash commands are only pushed to Discord when their definitions change. The hash of
+# the last synced tree is kept here; `python start_bot.py --sync-commands` (or
+# FORCE_COMMAND_SYNC=1) syncs regardless.
+COMMAND_SYNC_HASH_FILE = os.getenv("COMMAND_SYNC_HASH_FILE", "command_sync.hash")
+FORCE_COMMAND_SYNC = "--sync-commands" in sys.argv or os.getenv("FORCE_COMMAND_SYNC", "") == "1"
 
-        # Restart enabled auto-clear workers after reboot
-        for g in bot.guilds:
-            try:
-                if get_autoclear_config(g.id).get("enabled"):
-                    _autoclear_start_task(g.id)
-            except Exception:
-                pass
+_command_tree_synced = False
+
+
+def _command_tree_signature() -> str:
+    """Hash of the global command payload, tied to the application it was synced for."""
+    payload = sorted((cmd.to_dict() for cmd in bot.tree.get_commands()), key=lambda c: (c.get("type", 1), c["name"]))
+    text = json.dumps([bot.application_id, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def _sync_command_tree():
+    """Sync slash commands once per process, and only if they changed since the last sync."""
+    global _command_tree_synced
+    if _command_tree_synced:
+        return
+    _command_tree_synced = True
+    # In a cluster only the process holding shard 0 talks to the global command endpoint.
+    if SHARD_IDS is not None and 0 not in SHARD_IDS:
+        return
+
+    signature = _command_tree_signature()
+    try:
+        with open(COMMAND_SYNC_HASH_FILE, "r", encoding="utf-8") as f:
+            stored = f.read().strip()
+    except OSError:
+        stored = None
+    if stored == signature and not FORCE_COMMAND_SYNC:
+        logger.info("Slash commands unchanged; skipping sync")
+        return
+
+    try:
+        synced = await bot.tree.sync()
+    except Exception:
+        _command_tree_synced = False
+        raise
+    try:
+        with open(COMMAND_SYNC_HASH_FILE, "w", encoding="utf-8") as f:
+            f.write(signature)
+    except OSError as e:
+        logger.error(f"Could not store command sync hash: {e}")
+    logger.info(f"Synced {len(synced)} slash commands")
+
+
+_started_shards: set[int] = set()
 
-        logger.info(f"✅ Bot ready! Logged in as {bot.user}")
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    """Hand this shard's guilds to the background schedulers (once per shard).
+
+    The giveaway watcher, AutoClear scheduler and voice supervisor are single loops per
+    process; each shard seeds them with its own guilds as soon as that shard is up.
+    """
+    try:
+        if shard_id in _started_shards:
+            # READY again means the session could not be resumed: reactions may have been
+            # missed, so the shard's giveaways are re-read from their messages.
+            stale = [
+                (gid, mid) for mid, gid in _giveaway_by_message.items()
+                if mid in _giveaway_reconciled and (gid >> 22) % (bot.shard_count or 1) == shard_id
+            ]
+            for gid, mid in stale:
+                _giveaway_reconciled.discard(mid)
+                _giveaway_spawn(_giveaway_reconcile_limited(gid, mid))
+            if stale:
+                logger.info(f"Shard {shard_id} re-identified; reconciling {len(stale)} giveaway(s)")
+            return
+        _started_shards.add(shard_id)
+        guilds = [g for g in bot.guilds if g.shard_id == shard_id]
+        _start_guild_work(guilds)
+        logger.info(f"Shard {shard_id} ready: {len(guilds)} guilds")
     except Exception as e:
-        logger.error(f"Ready event error: {e}")
+        logger.error(f"Shard {shard_id} ready error: {e}")
+
+
+def _start_guild_work(guilds):
+    """Seed the background loops with `guilds` (a shard at startup, or a guild just joined)."""
+    # Giveaway watcher: one heap for the process, seeded shard by shard.
+    global _giveaway_watcher_task, _voice247_task
+    _giveaway_load_guilds(guilds)
+    if _giveaway_watcher_task is None or _giveaway_watcher_task.done():
+        _giveaway_watcher_task = asyncio.create_task(_giveaway_watcher_loop())
+
+    # Restart enabled auto-clear jobs after reboot
+    for g in guilds:
+        try:
+            if get_autoclear_config(g.id).get("enabled"):
+                _autoclear_start_task(g.id)
+        except Exception:
+            pass
+
+    # Open-ticket index: import from topics once per guild, prune deleted channels.
+    for g in guilds:
+        try:
+            _ticket_index_sync_guild(g)
+        except Exception as e:
+            logger.error(f"Ticket index sync error for guild {g.id}: {e}")
+
+    # Voice 24/7 supervisor (waits for the whole bot to be ready before its first pass).
+    if _voice247_task is None or _voice247_task.done():
+        _voice247_task = asyncio.create_task(_voice247_loop())
+    _voice247_wake()
+
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    """A guild joined after startup gets the same background work as a shard's guilds."""
+    try:
+        if not _owns_guild(guild.id):
+            return
+        _start_guild_work([guild])
+        logger.info(f"Joined guild {guild.id}: background work started")
+    except Exception as e:
+        logger.error(f"Guild join error for {guild.id}: {e}")
+
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    """Stop the background work of a guild the bot left (its config is kept)."""
+    try:
+        gid = int(guild.id)
+        for mid in [m for m, g in _giveaway_by_message.items() if g == gid]:
+            # In-memory state only: the entrant rows stay for a possible re-join.
+            _giveaway_by_message.pop(mid, None)
+            _giveaway_emoji.pop(mid, None)
+            _giveaway_reconciled.discard(mid)
+            _giveaway_entrants.pop(mid, None)
+        _autoclear_stop_task(gid)
+        _voice247_clear_retry_state(gid)
+        _role_queue_pending.pop(gid, None)
+        _role_queue_members.pop(gid, None)
+        logger.info(f"Left guild {gid}: background work stopped")
+    except Exception as e:
+        logger.error(f"Guild remove error for {guild.id}: {e}")
+
+
+_cluster_ipc_task: asyncio.Task | None = None
+
+
+def _cluster_command(op: str) -> dict:
+    """Answer a cross-cluster command sent by cluster.py."""
+    if op == "stats":
+        return {
+            "shards": sorted(bot.shards),
+            "guilds": len(bot.guilds),
+            "latency_ms": round(bot.latency * 1000) if math.isfinite(bot.latency) else None,
+            "giveaways": len(_giveaway_by_message),
+            "autoclear_jobs": len(_autoclear_due),
+            "role_queue": _role_queue_depth(),
+        }
+    if op == "reload":
+        _config_force_reload()
+        return {"reloaded": True}
+    if op == "flush":
+        flush_config()
+        return {"flushed": True}
+    return {"error": f"unknown command: {op}"}
+
+
+async def _cluster_ipc_loop():
+    """Stay connected to the cluster launcher and answer its commands (JSON lines)."""
+    while not bot.is_closed():
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", CLUSTER_IPC_PORT)
+            hello = {"op": "hello", "cluster": CLUSTER_ID, "token": CLUSTER_IPC_TOKEN}
+            writer.write(json.dumps(hello).encode() + b"\n")
+            await writer.drain()
+            while line := await reader.readline():
+                request = json.loads(line)
+                if not hmac.compare_digest(str(request.get("token", "")), CLUSTER_IPC_TOKEN):
+                    logger.warning("Cluster IPC: ignored a command with a wrong token")
+                    continue
+                try:
+                    result = _cluster_command(str(request.get("op")))
+                except Exception as e:
+                    result = {"error": str(e)}
+                reply = {"id": request.get("id"), "cluster": CLUSTER_ID, "result": result}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Cluster IPC error: {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+        await asyncio.sleep(5)
 
 @bot.tree.command(name="set_channel", description="Set the channel for poems | اختر قناة الأشعار")
 @app_commands.describe(channel="The channel where poems will be posted | القناة التي ستُرسل فيها الأشعار")
@@ -3266,6 +4666,225 @@ async def on_error(event, *args, **kwargs):
 
 # ============= TICKET SYSTEM =============
 
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    _category_track(channel)
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    try:
+        _category_track(channel, removed=True)
+        _ticket_index_remove(channel.id)
+    except Exception as e:
+        logger.error(f"Ticket index delete error: {e}")
+
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    try:
+        if getattr(before, "category_id", None) != getattr(after, "category_id", None):
+            _category_track(after, before.category_id)
+        _ticket_index_update(after)
+    except Exception as e:
+        logger.error(f"Ticket index update error: {e}")
+
+
+# Ticket admission: per guild, at most TICKET_CREATE_CONCURRENCY tickets are created at
+# once (channel creation has a small per-guild rate limit); the rest wait in FIFO order
+# and are told their position, which is kept up to date as the queue moves. A member can
+# only have one creation in flight.
+TICKET_CREATE_CONCURRENCY = int(os.getenv("TICKET_CREATE_CONCURRENCY", "2"))
+# Position notices are refreshed at most this often per guild (one batch of edits).
+TICKET_QUEUE_REFRESH_SECONDS = 1.0
+
+# guild_id -> {"semaphore", "users", "waiting", "notices": {user_id: (message, position)}, "refresh"}
+_ticket_admission: dict[int, dict] = {}
+
+
+def _ticket_admission_state(guild_id: int) -> dict:
+    state = _ticket_admission.get(guild_id)
+    if state is None:
+        state = {
+            "semaphore": asyncio.Semaphore(max(1, TICKET_CREATE_CONCURRENCY)),
+            "users": set(),
+            "waiting": [],
+            "notices": {},
+            "refresh": None,
+        }
+        _ticket_admission[guild_id] = state
+    return state
+
+
+def _ticket_queue_text(position: int) -> str:
+    return f"⏳ Queue position | ترتيبك في الانتظار: #{position}"
+
+
+def _ticket_queue_moved(state: dict):
+    """Schedule one refresh of the waiting members' position notices."""
+    task = state["refresh"]
+    if task is None or task.done():
+        state["refresh"] = asyncio.create_task(_ticket_queue_refresh(state))
+
+
+async def _ticket_queue_refresh(state: dict):
+    await asyncio.sleep(TICKET_QUEUE_REFRESH_SECONDS)
+    for position, user_id in enumerate(list(state["waiting"]), 1):
+        entry = state["notices"].get(user_id)
+        if entry is None or entry[1] == position:
+            continue
+        state["notices"][user_id] = (entry[0], position)
+        try:
+            await entry[0].edit(content=_ticket_queue_text(position))
+        except Exception:
+            pass
+
+
+def _ticket_in_flight(guild_id: int, user_id: int) -> bool:
+    state = _ticket_admission.get(guild_id)
+    return state is not None and user_id in state["users"]
+
+
+async def _ticket_admit(interaction: discord.Interaction, create):
+    """Run `create(interaction)` once a creation slot is free (interaction already deferred)."""
+    guild_id, user_id = interaction.guild_id, interaction.user.id
+    state = _ticket_admission_state(guild_id)
+    if user_id in state["users"]:
+        await interaction.followup.send("⏳ Your ticket is already being created | تذكرتك قيد الإنشاء بالفعل", ephemeral=True)
+        return
+
+    state["users"].add(user_id)
+    notice = None
+    try:
+        if state["semaphore"].locked() or state["waiting"]:
+            state["waiting"].append(user_id)
+            position = len(state["waiting"])
+            try:
+                notice = await interaction.followup.send(_ticket_queue_text(position), ephemeral=True, wait=True)
+                state["notices"][user_id] = (notice, position)
+                # The queue may have moved while the notice was being sent.
+                if user_id in state["waiting"] and state["waiting"].index(user_id) + 1 != position:
+                    _ticket_queue_moved(state)
+            except Exception as e:
+                logger.error(f"Ticket queue notice error: {e}")
+        async with state["semaphore"]:
+            if user_id in state["waiting"]:
+                state["waiting"].remove(user_id)
+                _ticket_queue_moved(state)
+            state["notices"].pop(user_id, None)
+            if notice is not None:
+                notice, old = None, notice
+                try:
+                    await old.delete()
+                except Exception:
+                    pass
+            await create(interaction)
+    finally:
+        if user_id in state["waiting"]:
+            # Cancelled while waiting: the members behind move up.
+            state["waiting"].remove(user_id)
+            _ticket_queue_moved(state)
+        state["notices"].pop(user_id, None)
+        state["users"].discard(user_id)
+        if not state["users"]:
+            _ticket_admission.pop(guild_id, None)
+        if notice is not None:
+            try:
+                await notice.delete()
+            except Exception:
+                pass
+
+
+# Category spill-over: Discord allows 50 channels per category. Channel ids per category
+# are tracked in memory (seeded from the cache once, then kept by channel events) plus
+# in-flight reservations, so picking a category never fetches anything.
+TICKET_CATEGORY_CHANNEL_LIMIT = 50
+
+_category_channels: dict[int, set[int]] = {}
+_category_reserved: dict[int, int] = {}
+_ticket_category_locks: dict[int, asyncio.Lock] = {}
+
+
+def _category_channel_ids(category: discord.CategoryChannel) -> set[int]:
+    ids = _category_channels.get(category.id)
+    if ids is None:
+        ids = {c.id for c in category.channels}
+        _category_channels[category.id] = ids
+    return ids
+
+
+def _category_track(channel: discord.abc.GuildChannel, old_category_id: int | None = None, *, removed: bool = False):
+    """Keep the per-category channel sets current (channel create/delete/move events)."""
+    if isinstance(channel, discord.CategoryChannel):
+        if removed:
+            _category_channels.pop(channel.id, None)
+        return
+    if old_category_id is not None and old_category_id in _category_channels:
+        _category_channels[old_category_id].discard(channel.id)
+    if channel.category_id in _category_channels:
+        if removed:
+            _category_channels[channel.category_id].discard(channel.id)
+        else:
+            _category_channels[channel.category_id].add(channel.id)
+
+
+async def _ticket_reserve_category(guild: discord.Guild, tcfg: dict) -> discord.CategoryChannel | None:
+    """Pick the first ticket category with room (creating one if allowed) and reserve a slot.
+
+    Release the slot with _ticket_release_category() once the channel exists (or failed).
+    """
+    base_id = tcfg.get("category_id")
+    base = guild.get_channel(int(base_id)) if base_id else None
+    if not isinstance(base, discord.CategoryChannel):
+        return None
+
+    lock = _ticket_category_locks.setdefault(guild.id, asyncio.Lock())
+    async with lock:
+        candidates = [base]
+        for cid in tcfg.get("overflow_category_ids") or []:
+            category = guild.get_channel(int(cid))
+            if isinstance(category, discord.CategoryChannel):
+                candidates.append(category)
+
+        chosen = None
+        for category in candidates:
+            used = len(_category_channel_ids(category)) + _category_reserved.get(category.id, 0)
+            if used < TICKET_CATEGORY_CHANNEL_LIMIT:
+                chosen = category
+                break
+
+        if chosen is None:
+            if not tcfg.get("auto_create_categories", True):
+                # Let Discord reject it so the member sees the usual error.
+                chosen = candidates[-1]
+            else:
+                chosen = await guild.create_category(
+                    name=f"{base.name} {len(candidates) + 1}",
+                    overwrites=base.overwrites,
+                    reason="Ticket categories full",
+                )
+                _category_channels[chosen.id] = set()
+                # Drop ids of deleted overflow categories while we're rewriting the list.
+                tcfg["overflow_category_ids"] = [c.id for c in candidates[1:]] + [chosen.id]
+                update_guild_config(guild.id, {"tickets": tcfg})
+                logger.info(f"Created overflow ticket category {chosen.id} in guild {guild.id}")
+
+        _category_reserved[chosen.id] = _category_reserved.get(chosen.id, 0) + 1
+        return chosen
+
+
+def _ticket_release_category(category: discord.CategoryChannel | None, channel: discord.abc.GuildChannel | None = None):
+    if category is None:
+        return
+    left = _category_reserved.get(category.id, 0) - 1
+    if left > 0:
+        _category_reserved[category.id] = left
+    else:
+        _category_reserved.pop(category.id, None)
+    if channel is not None:
+        _category_channel_ids(category).add(channel.id)
+
+
 class TicketDropdown(discord.ui.Select):
     """Dropdown for ticket options"""
     def __init__(self, guild_id: int):
@@ -3292,6 +4911,9 @@ class TicketDropdown(discord.ui.Select):
     
     async def callback(self, interaction: discord.Interaction):
         """Handle ticket creation"""
+        if _ticket_in_flight(interaction.guild_id, interaction.user.id):
+            await interaction.response.send_message("⏳ Your ticket is already being created | تذكرتك قيد الإنشاء بالفعل", ephemeral=True)
+            return
         # Show modal for reason
         modal = TicketReasonModal(self.guild_id, self.values[0])
         await interaction.response.send_modal(modal)
@@ -3320,22 +4942,38 @@ class TicketReasonModal(discord.ui.Modal):
         self.add_item(self.reason)
     
     async def on_submit(self, interaction: discord.Interaction):
-        """Create ticket channel"""
+        """Queue the ticket creation"""
         try:
             # Defer response immediately to prevent timeout
             await interaction.response.defer(ephemeral=True)
+        except Exception as e:
+            logger.error(f"Error deferring ticket modal: {e}")
+            return
+        await _ticket_admit(interaction, self.create_ticket)
 
+    async def create_ticket(self, interaction: discord.Interaction):
+        """Create ticket channel"""
+        try:
             tcfg = get_ticket_config(interaction.guild_id)
+
+            limit = int(tcfg.get("max_open_per_user") or 0)
+            open_ids = _ticket_open_channels(interaction.guild_id, interaction.user.id)
+            if limit > 0 and len(open_ids) >= limit:
+                mentions = " ".join(f"<#{cid}>" for cid in sorted(open_ids))
+                await interaction.followup.send(
+                    f"❌ You already have an open ticket | لديك تذكرة مفتوحة بالفعل: {mentions}", ephemeral=True
+                )
+                return
             
-            # Increment ticket counter
-            tcfg["ticket_counter"] = int(tcfg.get("ticket_counter", 0)) + 1
-            ticket_num = tcfg["ticket_counter"]
-            update_guild_config(interaction.guild_id, {"tickets": tcfg})
+            # Allocate the ticket number from the ticket store (atomic, no config rewrite).
+            # The config counter is only mirrored in memory for the settings panels.
+            ticket_num = await asyncio.to_thread(
+                next_ticket_number, TICKET_DB_FILE, str(interaction.guild_id), int(tcfg.get("ticket_counter") or 0)
+            )
+            tcfg["ticket_counter"] = ticket_num
             
-            # Get category
-            category = None
-            if tcfg.get("category_id"):
-                category = bot.get_channel(int(tcfg.get("category_id")))
+            # Get category (spills over into extra categories when it is full)
+            category = await _ticket_reserve_category(interaction.guild, tcfg)
             
             # Create ticket channel with username
             guild = interaction.guild
@@ -3357,12 +4995,17 @@ class TicketReasonModal(discord.ui.Modal):
                 if role:
                     overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
             
-            ticket_channel = await guild.create_text_channel(
-                name=channel_name,
-                category=category,
-                overwrites=overwrites,
-                topic=f"ticket_owner:{interaction.user.id}",
-            )
+            ticket_channel = None
+            try:
+                ticket_channel = await guild.create_text_channel(
+                    name=channel_name,
+                    category=category,
+                    overwrites=overwrites,
+                    topic=f"ticket_owner:{interaction.user.id}",
+                )
+            finally:
+                _ticket_release_category(category, ticket_channel)
+            _ticket_index_add(ticket_channel, interaction.user.id)
             
             # Create mention string for ping roles
             ping_mentions = ""
@@ -3459,6 +5102,138 @@ class TicketReasonModal(discord.ui.Modal):
         except Exception as e:
             logger.error(f"Error logging ticket creation: {e}")
 
+# Ticket transcripts: on close the channel history is streamed page by page into
+# <TICKET_TRANSCRIPT_DIR>/<guild id>/<channel>-<id>.jsonl.gz and .html, posted to the
+# ticket log channel, and only then is the channel deleted (in the background).
+TICKET_TRANSCRIPT_DIR = os.getenv("TICKET_TRANSCRIPT_DIR", "transcripts")
+TICKET_TRANSCRIPT_CONCURRENCY = int(os.getenv("TICKET_TRANSCRIPT_CONCURRENCY", "2"))
+TICKET_TRANSCRIPT_PAGE_SIZE = 100
+
+_ticket_transcript_semaphore = asyncio.Semaphore(max(1, TICKET_TRANSCRIPT_CONCURRENCY))
+_ticket_close_tasks: set[asyncio.Task] = set()
+_ticket_closing: set[int] = set()  # channel ids with a close in progress
+
+_TRANSCRIPT_HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ background: #313338; color: #dbdee1; font-family: sans-serif; margin: 20px; }}
+.msg {{ padding: 6px 0; border-bottom: 1px solid #3f4147; }}
+.author {{ font-weight: bold; color: #f2f3f5; }}
+.time {{ color: #949ba4; font-size: 12px; margin-left: 6px; }}
+.content {{ white-space: pre-wrap; word-wrap: break-word; margin-top: 2px; }}
+a {{ color: #00a8fc; }}
+</style></head><body>
+<h2>{title}</h2>
+"""
+
+
+def _transcript_record(message: discord.Message) -> dict:
+    return {
+        "id": message.id,
+        "author_id": message.author.id,
+        "author": str(message.author),
+        "bot": message.author.bot,
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "content": message.content,
+        "attachments": [a.url for a in message.attachments],
+        "embeds": [e.to_dict() for e in message.embeds],
+    }
+
+
+def _transcript_html(record: dict) -> str:
+    parts = [
+        '<div class="msg">',
+        f'<span class="author">{html.escape(record["author"])}</span>',
+        f'<span class="time">{html.escape(record["created_at"][:19].replace("T", " "))}</span>',
+    ]
+    if record["content"]:
+        parts.append(f'<div class="content">{html.escape(record["content"])}</div>')
+    for embed in record["embeds"]:
+        text = "\n".join(str(embed.get(k)) for k in ("title", "description") if embed.get(k))
+        if text:
+            parts.append(f'<div class="content">[embed] {html.escape(text)}</div>')
+    for url in record["attachments"]:
+        parts.append(f'<div><a href="{html.escape(url)}">{html.escape(url.rsplit("/", 1)[-1].split("?", 1)[0])}</a></div>')
+    parts.append("</div>\n")
+    return "".join(parts)
+
+
+def _write_transcript_page(jsonl_file, html_file, records: list[dict]):
+    for record in records:
+        jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        html_file.write(_transcript_html(record))
+
+
+async def _archive_ticket_transcript(channel: discord.TextChannel) -> tuple[list[str], int]:
+    """Stream the channel history to disk. Returns (file paths, message count).
+
+    Only one page of messages is held in memory; file writes run off the event loop.
+    """
+    folder = os.path.join(TICKET_TRANSCRIPT_DIR, str(channel.guild.id))
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, f"{channel.name}-{channel.id}")
+    jsonl_path, html_path = f"{base}.jsonl.gz", f"{base}.html"
+
+    count = 0
+    with gzip.open(jsonl_path, "wt", encoding="utf-8") as jsonl_file, open(html_path, "w", encoding="utf-8") as html_file:
+        html_file.write(_TRANSCRIPT_HTML_HEAD.format(title=html.escape(f"#{channel.name} - {channel.guild.name}")))
+        page: list[dict] = []
+        async for message in channel.history(limit=None, oldest_first=True):
+            page.append(_transcript_record(message))
+            if len(page) >= TICKET_TRANSCRIPT_PAGE_SIZE:
+                await asyncio.to_thread(_write_transcript_page, jsonl_file, html_file, page)
+                count += len(page)
+                page = []
+        if page:
+            await asyncio.to_thread(_write_transcript_page, jsonl_file, html_file, page)
+            count += len(page)
+        html_file.write(f"<p>{count} messages</p></body></html>\n")
+    return [jsonl_path, html_path], count
+
+
+async def _post_ticket_transcript(channel: discord.TextChannel, paths: list[str], count: int, closed_by: discord.abc.User):
+    tcfg = get_ticket_config(channel.guild.id)
+    log_channel_id = tcfg.get("log_channel_id")
+    log_channel = bot.get_channel(int(log_channel_id)) if log_channel_id else None
+    if not log_channel:
+        return
+
+    # Attach what fits under the upload limit; the rest stays in the local archive.
+    limit = channel.guild.filesize_limit
+    files, total = [], 0
+    for path in paths:
+        size = os.path.getsize(path)
+        if total + size <= limit:
+            files.append(discord.File(path))
+            total += size
+    text = f"📄 Transcript | نسخة المحادثة: **#{channel.name}** ({count} messages | رسالة) — {closed_by.mention}"
+    if len(files) < len(paths):
+        text += "\n⚠️ Too large to attach; kept on the bot host | كبيرة جداً، محفوظة على الخادم"
+    await log_channel.send(text, files=files, allowed_mentions=discord.AllowedMentions.none())
+
+
+async def _close_ticket_channel(channel: discord.TextChannel, closed_by: discord.abc.User):
+    """Archive the transcript, post it to the log channel, then delete the ticket channel."""
+    started = time.monotonic()
+    try:
+        async with _ticket_transcript_semaphore:
+            paths, count = await _archive_ticket_transcript(channel)
+        logger.info(f"Ticket transcript for #{channel.name} ({channel.id}): {count} messages in {time.monotonic() - started:.1f}s")
+        await _post_ticket_transcript(channel, paths, count, closed_by)
+    except Exception as e:
+        logger.error(f"Ticket transcript error for {channel.id}: {e}")
+    try:
+        await channel.delete(reason=f"Ticket closed by {closed_by}")
+        _ticket_index_remove(channel.id)
+    except discord.NotFound:
+        _ticket_index_remove(channel.id)
+    except Exception as e:
+        logger.error(f"Error deleting ticket channel {channel.id}: {e}")
+    finally:
+        _ticket_closing.discard(channel.id)
+
+
 class TicketControlView(discord.ui.View):
     """Buttons for ticket control"""
     def __init__(self, guild_id: int, channel_id, owner_id):
@@ -3585,8 +5360,8 @@ class TicketControlView(discord.ui.View):
                 return
             
             # Get ticket owner
-            owner_id = self.owner_id or _get_ticket_owner_id_from_channel(interaction.channel)
-            owner = interaction.guild.get_member(owner_id) if owner_id else None
+            owner_id = self.owner_id or _ticket_owner_id(interaction.channel)
+            owner = await _get_member(interaction.guild, owner_id) if owner_id else None
             if owner:
                 # Get custom message
                 tcfg = get_ticket_config(interaction.guild_id)
@@ -3608,12 +5383,22 @@ class TicketControlView(discord.ui.View):
                 await interaction.response.send_message("❌ ليس لديك صلاحية", ephemeral=True)
                 return
             
+            if interaction.channel_id in _ticket_closing:
+                await interaction.response.send_message("🔒 Already closing | جاري الإغلاق بالفعل", ephemeral=True)
+                return
+            _ticket_closing.add(interaction.channel_id)
+
+            await interaction.response.send_message("🔒 جاري اغلاق التكيت...")
+
             # Log ticket closure
             await self.log_ticket_action(interaction, "closed")
-            
-            await interaction.response.send_message("🔒 جاري اغلاق التكيت...")
-            await interaction.channel.delete(reason=f"Ticket closed by {interaction.user}")
+
+            # Transcript + delete continue in the background; the button has already answered.
+            task = asyncio.create_task(_close_ticket_channel(interaction.channel, interaction.user))
+            _ticket_close_tasks.add(task)
+            task.add_done_callback(_ticket_close_tasks.discard)
         except Exception as e:
+            _ticket_closing.discard(interaction.channel_id)
             logger.error(f"Error closing ticket: {e}")
     
     async def claim_ticket(self, interaction: discord.Interaction):
@@ -3629,7 +5414,7 @@ class TicketControlView(discord.ui.View):
             guild = interaction.guild
             
             # Get ticket owner
-            owner = guild.get_member(self.owner_id)
+            owner = await _get_member(guild, self.owner_id) if self.owner_id else None
             
             # Reset permissions - only claimer and owner can see
             await channel.edit(sync_permissions=False)
@@ -3724,7 +5509,7 @@ class TicketMenuPersistentSelect(discord.ui.Select):
 
     async def callback(self, interaction: discord.Interaction):
         try:
-            owner_id = _get_ticket_owner_id_from_channel(interaction.channel) or interaction.user.id
+            owner_id = _ticket_owner_id(interaction.channel) or interaction.user.id
             control_view = TicketControlView(interaction.guild_id, interaction.channel_id, owner_id)
             if not control_view.has_permission(interaction):
                 await interaction.response.send_message("❌ No permission | ليس لديك صلاحية", ephemeral=True)
@@ -3771,7 +5556,7 @@ class TicketControlPersistentView(discord.ui.View):
         self.add_item(TicketMenuPersistentSelect())
 
     async def _control_view(self, interaction: discord.Interaction) -> TicketControlView:
-        owner_id = _get_ticket_owner_id_from_channel(interaction.channel) or 0
+        owner_id = _ticket_owner_id(interaction.channel) or 0
         return TicketControlView(interaction.guild_id, interaction.channel_id, owner_id)
 
     async def _close(self, interaction: discord.Interaction):
@@ -3835,7 +5620,7 @@ class TicketMenuDropdown(discord.ui.Select):
         """Handle menu selection (ADMIN ONLY)"""
         try:
             # Check if user has admin permission
-            owner_id = _get_ticket_owner_id_from_channel(interaction.channel) or interaction.user.id
+            owner_id = _ticket_owner_id(interaction.channel) or interaction.user.id
             control_view = TicketControlView(interaction.guild_id, interaction.channel_id, owner_id)
             if not control_view.has_permission(interaction):
                 await interaction.response.send_message("❌ No permission | ليس لديك صلاحية", ephemeral=True)
@@ -3909,7 +5694,7 @@ class AddUserModal(discord.ui.Modal):
             user_text = self.user_input.value.strip()
             user_id = int(''.join(filter(str.isdigit, user_text)))
             
-            member = interaction.guild.get_member(user_id)
+            member = await _get_member(interaction.guild, user_id)
             if not member:
                 await interaction.response.send_message("❌ Member not found | لم يتم العثور على العضو", ephemeral=True)
                 return
@@ -3940,7 +5725,7 @@ class RemoveUserModal(discord.ui.Modal):
             user_text = self.user_input.value.strip()
             user_id = int(''.join(filter(str.isdigit, user_text)))
             
-            member = interaction.guild.get_member(user_id)
+            member = await _get_member(interaction.guild, user_id)
             if not member:
                 await interaction.response.send_message("❌ Member not found | لم يتم العثور على العضو", ephemeral=True)
                 return
@@ -4032,10 +5817,62 @@ async def ticket_log_channel(interaction: discord.Interaction, channel: discord.
             f"✅ Log channel set | تم تعيين قناة السجلات إلى: {channel.mention}",
             ephemeral=True,
         )
-        logger.info(f"Ticket log channel set to {channel.id}")
-        
+        logger.info(f"Ticket log channel set to {channel.id}")
+        
+    except Exception as e:
+        logger.error(f"Error setting log channel: {e}")
+        await interaction.response.send_message("❌ Error | خطأ", ephemeral=True)
+
+@bot.tree.command(name="ticket_limit", description="Max open tickets per member | الحد الأقصى للتكيتات المفتوحة لكل عضو")
+@app_commands.describe(limit="0 = unlimited | 0 = بلا حد")
+async def ticket_limit(interaction: discord.Interaction, limit: app_commands.Range[int, 0, 25]):
+    """Set the per-member open ticket limit"""
+    try:
+        if not interaction.user.guild_permissions.manage_guild:
+            return await interaction.response.send_message("❌ Manage Server required | تحتاج إدارة السيرفر", ephemeral=True)
+        tcfg = get_ticket_config(interaction.guild_id)
+        tcfg["max_open_per_user"] = int(limit)
+        update_guild_config(interaction.guild_id, {"tickets": tcfg})
+        text = str(limit) if limit else "Unlimited | بلا حد"
+        await interaction.response.send_message(f"✅ Open ticket limit | حد التكيتات المفتوحة: {text}", ephemeral=True)
+    except Exception as e:
+        logger.error(f"Error setting ticket limit: {e}")
+        await interaction.response.send_message("❌ Error | خطأ", ephemeral=True)
+
+@bot.tree.command(name="ticket_open_list", description="List open tickets | قائمة التكيتات المفتوحة")
+@app_commands.describe(rebuild="Re-import from channel topics | إعادة البناء من مواضيع القنوات")
+async def ticket_open_list(interaction: discord.Interaction, rebuild: bool = False):
+    """List open tickets per category from the ticket index"""
+    try:
+        if not interaction.user.guild_permissions.manage_guild:
+            return await interaction.response.send_message("❌ Manage Server required | تحتاج إدارة السيرفر", ephemeral=True)
+        if rebuild:
+            _ticket_index_sync_guild(interaction.guild, rebuild=True)
+        rows = sorted(
+            ((cid, r) for cid, r in _open_tickets.items() if r["guild_id"] == interaction.guild_id),
+            key=lambda item: item[1]["opened_at"],
+        )
+
+        embed = discord.Embed(
+            title=f"🎫 Open Tickets | التكيتات المفتوحة ({len(rows)})",
+            color=parse_color(get_ticket_config(interaction.guild_id).get("embed_color", "#9B59B6")),
+        )
+        per_category: dict[int | None, int] = {}
+        for _, r in rows:
+            per_category[r["category_id"]] = per_category.get(r["category_id"], 0) + 1
+        if per_category:
+            embed.add_field(
+                name="📁 Categories | التصنيفات",
+                value="\n".join(f"{f'<#{cat}>' if cat else '—'}: {n}" for cat, n in per_category.items())[:1024],
+                inline=False,
+            )
+        lines = [f"<#{cid}> — <@{r['owner_id']}> — <t:{int(r['opened_at'])}:R>" for cid, r in rows[:20]]
+        if len(rows) > 20:
+            lines.append(f"… +{len(rows) - 20}")
+        embed.description = "\n".join(lines) or "None | لا يوجد"
+        await interaction.response.send_message(embed=embed, ephemeral=True)
     except Exception as e:
-        logger.error(f"Error setting log channel: {e}")
+        logger.error(f"Error listing tickets: {e}")
         await interaction.response.send_message("❌ Error | خطأ", ephemeral=True)
 
 @bot.tree.command(name="ticket_setup", description="Open ticket settings panel | فتح لوحة إعدادات التكيت")
@@ -4370,8 +6207,15 @@ class TicketSetupChannelsModal(discord.ui.Modal):
             required=False,
             max_length=25,
         )
+        self.overflow_ids = discord.ui.TextInput(
+            label="Overflow category IDs (opt) | تصنيفات إضافية",
+            default=" ".join(str(x) for x in tcfg.get("overflow_category_ids") or [])[:400],
+            required=False,
+            max_length=400,
+        )
         self.add_item(self.category_id)
         self.add_item(self.log_channel_id)
+        self.add_item(self.overflow_ids)
 
     async def on_submit(self, interaction: discord.Interaction):
         tcfg = get_ticket_config(self.guild_id)
@@ -4380,6 +6224,7 @@ class TicketSetupChannelsModal(discord.ui.Modal):
         log_ids = _extract_int_ids(self.log_channel_id.value)
         tcfg["category_id"] = cat_ids[0] if cat_ids else None
         tcfg["log_channel_id"] = log_ids[0] if log_ids else None
+        tcfg["overflow_category_ids"] = _extract_int_ids(self.overflow_ids.value)
 
         update_guild_config(self.guild_id, {"tickets": tcfg})
         await interaction.response.send_message("✅ Updated | تم تحديث القنوات", ephemeral=True)
@@ -5867,94 +7712,66 @@ class EditMenuOptionModal(discord.ui.Modal):
 # MODERATION SYSTEM
 # ============================================================
 
+_MOD_DEFAULTS = {
+    "enabled": True,
+    "mod_log_channel": None,
+    "dm_on_action": True,
+    "shortcuts": {},
+    "messages": {},
+    "allowed_role_id": None,
+    "embed_colors": {},
+}
+
+# Default templates (used as embed description; placeholders: {server} {reason} {duration} {moderator})
+_MOD_MESSAGE_DEFAULTS = {
+    "ban_dm": "تم حظرك من **{server}**.\nالسبب: {reason}\n\nYou have been banned from **{server}**.\nReason: {reason}",
+    "unban_dm": "تم فك الحظر عنك في **{server}**.\nالسبب: {reason}\n\nYou have been unbanned in **{server}**.\nReason: {reason}",
+    "kick_dm": "تم طردك من **{server}**.\nالسبب: {reason}\n\nYou have been kicked from **{server}**.\nReason: {reason}",
+    "warn_dm": "تم تحذيرك في **{server}**.\nالسبب: {reason}\n\nYou have been warned in **{server}**.\nReason: {reason}",
+    "timeout_dm": "تم إعطاؤك مهلة (Timeout) في **{server}**.\nالمدة: {duration}\nالسبب: {reason}\n\nYou have been timed out in **{server}**.\nDuration: {duration}\nReason: {reason}",
+    "untimeout_dm": "تم إزالة المهلة عنك في **{server}**.\nالسبب: {reason}\n\nYour timeout has been removed in **{server}**.\nReason: {reason}",
+    "ban_log": "🔨 **User Banned | تم الحظر**",
+    "unban_log": "**User Unbanned | تم فك الحظر**",
+    "kick_log": "👢 **User Kicked | تم الطرد**",
+    "warn_log": "⚠️ **User Warned | تم التحذير**",
+    "timeout_log": "⏱️ **User Timed Out | تم الإعطاء مهلة**",
+    "untimeout_log": "**Timeout Removed | تم إزالة المهلة**",
+    "channel_locked": "🔒 **Channel Locked | تم قفل القناة**",
+    "channel_unlocked": "🔓 **Channel Unlocked | تم فتح القناة**",
+}
+
+# Per-command DM embed colors
+_MOD_COLOR_DEFAULTS = {
+    "ban": "#ED4245",
+    "unban": "#57F287",
+    "kick": "#FEE75C",
+    "warn": "#F1C40F",
+    "timeout": "#5865F2",
+    "untimeout": "#57F287",
+    # messaging commands
+    "dm": "#57F287",
+    "say": "#57F287",
+}
+
+
 def get_mod_config(guild_id):
     """Get moderation config for guild"""
-    guild_cfg = get_guild_config(guild_id)
-
-    changed = False
-    if "moderation" not in guild_cfg:
-        guild_cfg["moderation"] = {}
-        changed = True
-
-    mod_cfg = guild_cfg["moderation"]
-
-    if "enabled" not in mod_cfg:
-        mod_cfg["enabled"] = True
-        changed = True
-    if "mod_log_channel" not in mod_cfg:
-        mod_cfg["mod_log_channel"] = None
-        changed = True
-    if "dm_on_action" not in mod_cfg:
-        mod_cfg["dm_on_action"] = True
-        changed = True
-    if "shortcuts" not in mod_cfg:
-        mod_cfg["shortcuts"] = {}
-        changed = True
-    if "messages" not in mod_cfg:
-        mod_cfg["messages"] = {}
-        changed = True
+    mod_cfg = _config_section(get_guild_config(guild_id), "moderation")
+    _apply_defaults(mod_cfg, _MOD_DEFAULTS)
 
     # Access role gate: support both old single role and new multi-role list
-    if "allowed_role_ids" not in mod_cfg or not isinstance(mod_cfg.get("allowed_role_ids"), list):
+    if not isinstance(mod_cfg.get("allowed_role_ids"), list):
         mod_cfg["allowed_role_ids"] = []
-        changed = True
-    if "allowed_role_id" not in mod_cfg:
-        mod_cfg["allowed_role_id"] = None
-        changed = True
 
     # Migrate old single role -> list
     if mod_cfg.get("allowed_role_id") and not mod_cfg.get("allowed_role_ids"):
         try:
             mod_cfg["allowed_role_ids"] = [int(mod_cfg.get("allowed_role_id"))]
-            changed = True
         except Exception:
             pass
 
-    # Default templates (used as embed description; placeholders: {server} {reason} {duration} {moderator})
-    default_messages = {
-        "ban_dm": "تم حظرك من **{server}**.\nالسبب: {reason}\n\nYou have been banned from **{server}**.\nReason: {reason}",
-        "unban_dm": "تم فك الحظر عنك في **{server}**.\nالسبب: {reason}\n\nYou have been unbanned in **{server}**.\nReason: {reason}",
-        "kick_dm": "تم طردك من **{server}**.\nالسبب: {reason}\n\nYou have been kicked from **{server}**.\nReason: {reason}",
-        "warn_dm": "تم تحذيرك في **{server}**.\nالسبب: {reason}\n\nYou have been warned in **{server}**.\nReason: {reason}",
-        "timeout_dm": "تم إعطاؤك مهلة (Timeout) في **{server}**.\nالمدة: {duration}\nالسبب: {reason}\n\nYou have been timed out in **{server}**.\nDuration: {duration}\nReason: {reason}",
-        "untimeout_dm": "تم إزالة المهلة عنك في **{server}**.\nالسبب: {reason}\n\nYour timeout has been removed in **{server}**.\nReason: {reason}",
-        "ban_log": "🔨 **User Banned | تم الحظر**",
-        "unban_log": "**User Unbanned | تم فك الحظر**",
-        "kick_log": "👢 **User Kicked | تم الطرد**",
-        "warn_log": "⚠️ **User Warned | تم التحذير**",
-        "timeout_log": "⏱️ **User Timed Out | تم الإعطاء مهلة**",
-        "untimeout_log": "**Timeout Removed | تم إزالة المهلة**",
-        "channel_locked": "🔒 **Channel Locked | تم قفل القناة**",
-        "channel_unlocked": "🔓 **Channel Unlocked | تم فتح القناة**",
-    }
-    for key, value in default_messages.items():
-        if key not in mod_cfg["messages"]:
-            mod_cfg["messages"][key] = value
-            changed = True
-
-    # Per-command DM embed colors
-    if "embed_colors" not in mod_cfg:
-        mod_cfg["embed_colors"] = {}
-        changed = True
-    default_colors = {
-        "ban": "#ED4245",
-        "unban": "#57F287",
-        "kick": "#FEE75C",
-        "warn": "#F1C40F",
-        "timeout": "#5865F2",
-        "untimeout": "#57F287",
-        # messaging commands
-        "dm": "#57F287",
-        "say": "#57F287",
-    }
-    for key, value in default_colors.items():
-        if key not in mod_cfg["embed_colors"]:
-            mod_cfg["embed_colors"][key] = value
-            changed = True
-
-    if changed and guild_id is not None:
-        update_guild_config(guild_id, guild_cfg)
-
+    _apply_defaults(mod_cfg["messages"], _MOD_MESSAGE_DEFAULTS)
+    _apply_defaults(mod_cfg["embed_colors"], _MOD_COLOR_DEFAULTS)
     return mod_cfg
 
 
@@ -6451,66 +8268,148 @@ async def clear_messages(interaction: discord.Interaction, amount: int | None =
         if amount <= 0:
             return await interaction.followup.send("❌ Invalid amount | رقم غير صحيح", ephemeral=True)
 
-        deleted = await interaction.channel.purge(limit=int(amount))
+        deleted = await _purge_messages(interaction.channel, limit=int(amount))
         await interaction.followup.send(
-            f"✅ تم حذف {len(deleted)} رسالة | Deleted {len(deleted)} messages",
+            f"✅ تم حذف {deleted} رسالة | Deleted {deleted} messages",
             ephemeral=True,
         )
     except Exception as e:
         await interaction.followup.send(f"❌ Error | خطأ: {str(e)}", ephemeral=True)
 
 
+# Purge engine shared by /clear, the clear shortcut and AutoClear. History pages are
+# fetched while the previous page is being deleted; pacing comes from discord.py's
+# rate-limit handling (it reads the bucket headers), not from fixed sleeps.
+PURGE_SINGLE_DELETE_CONCURRENCY = int(os.getenv("PURGE_SINGLE_DELETE_CONCURRENCY", "3"))
+PURGE_PROGRESS_SECONDS = 10.0
+# Bulk delete rejects the whole request if any message is 14+ days old; keep a margin.
+_BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+
+async def _purge_messages(
+    channel: discord.TextChannel,
+    *,
+    limit: int | None = None,
+    reason: str | None = None,
+    on_old=None,
+) -> int:
+    """Delete up to `limit` messages (newest first). Returns how many were deleted.
+
+    Messages newer than 14 days go through bulk delete (100 per request); older ones
+    must be deleted one by one and run a few at a time. `on_old` is awaited once,
+    right before the first 14d+ message is deleted.
+    """
+    pages: asyncio.Queue = asyncio.Queue(maxsize=2)
+
+    async def _fetch_pages():
+        try:
+            page: list[discord.Message] = []
+            async for m in channel.history(limit=limit):
+                page.append(m)
+                if len(page) >= 100:
+                    await pages.put(page)
+                    page = []
+            if page:
+                await pages.put(page)
+        finally:
+            await pages.put(None)
+
+    deleted = 0
+    semaphore = asyncio.Semaphore(max(1, PURGE_SINGLE_DELETE_CONCURRENCY))
+
+    async def _delete_one(m: discord.Message):
+        nonlocal deleted
+        async with semaphore:
+            try:
+                await m.delete()
+                deleted += 1
+            except Exception:
+                pass
+
+    started = last_report = time.monotonic()
+    old_seen = False
+    fetcher = asyncio.create_task(_fetch_pages())
+    try:
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+
+            cutoff = discord.utils.utcnow() - _BULK_DELETE_MAX_AGE
+            recent = [m for m in page if m.created_at > cutoff]
+            old = [m for m in page if m.created_at <= cutoff]
+
+            if recent:
+                try:
+                    await channel.delete_messages(recent, reason=reason)
+                    deleted += len(recent)
+                except discord.HTTPException:
+                    await asyncio.gather(*(_delete_one(m) for m in recent))
+
+            if old:
+                if not old_seen and on_old is not None:
+                    old_seen = True
+                    await on_old()
+                await asyncio.gather(*(_delete_one(m) for m in old))
+
+            now = time.monotonic()
+            if now - last_report >= PURGE_PROGRESS_SECONDS:
+                last_report = now
+                logger.info(f"[Purge #{channel.id}] {deleted} deleted ({deleted / (now - started):.1f}/s)")
+        await fetcher  # surface history errors (e.g. missing permissions)
+    finally:
+        if not fetcher.done():
+            fetcher.cancel()
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logger.info(f"[Purge #{channel.id}] done: {deleted} deleted in {elapsed:.1f}s ({deleted / elapsed:.1f}/s)")
+    return deleted
+
+
 async def _purge_channel_all(channel: discord.TextChannel, *, reason: str | None = None) -> int:
     """Best-effort clear: deletes as many messages as possible (Discord won't bulk-delete >14 days)."""
-    total_deleted = 0
     # Safety cap to avoid endless loops in weird edge cases
-    for _ in range(200):
-        batch = await channel.purge(limit=100, reason=reason)
-        if not batch:
-            break
-        total_deleted += len(batch)
-        # small delay to be kind to rate limits
-        await asyncio.sleep(1)
-    return total_deleted
+    return await _purge_messages(channel, limit=20000, reason=reason)
 
 
 # ============================================================
 # AUTO CLEAR (delete channel + send message)
 # ============================================================
 
-def get_autoclear_config(guild_id: int) -> dict:
-    """Get auto-clear config for a guild and ensure defaults exist."""
-    guild_cfg = get_guild_config(guild_id)
-    changed = False
-
-    if "auto_clear" not in guild_cfg or not isinstance(guild_cfg.get("auto_clear"), dict):
-        guild_cfg["auto_clear"] = {}
-        changed = True
-
-    acfg = guild_cfg["auto_clear"]
-
-    def _set_default(key: str, value):
-        nonlocal changed
-        if key not in acfg:
-            acfg[key] = value
-            changed = True
-
-    _set_default("enabled", False)
-    _set_default("channel_id", None)
-    _set_default("message", "✅ Cleared | ✅ تم الحذف")
-    _set_default("interval_seconds", 60)
+_AUTOCLEAR_DEFAULTS = {
+    "enabled": False,
+    "channel_id": None,
+    "message": "✅ Cleared | ✅ تم الحذف",
+    "interval_seconds": 60,
     # If there are old 14d+ messages, deletion can take time.
     # When send_early=True we send the message right after bulk-deleting newer messages,
     # then continue deleting older messages using history(before=sent_message) so it won't be deleted.
-    _set_default("send_early", True)
-
-    if changed:
-        update_guild_config(guild_id, guild_cfg)
-
-    return acfg
+    "send_early": True,
+    # "delete": delete messages (14d+ ones one by one). "recreate": clone the channel and
+    # delete the old one - a handful of API calls no matter how long the history is.
+    "mode": "delete",
+}
 
 
-_autoclear_tasks: dict[int, asyncio.Task] = {}
+def get_autoclear_config(guild_id: int) -> dict:
+    """Get auto-clear config for a guild with defaults filled in memory."""
+    acfg = _config_section(get_guild_config(guild_id), "auto_clear")
+    return _apply_defaults(acfg, _AUTOCLEAR_DEFAULTS)
+
+
+# One scheduler owns every AutoClear job: a heap of (due, guild_id) on the loop clock.
+# Runs get a little jitter so jobs due together don't hit the REST buckets at once,
+# and at most AUTOCLEAR_MAX_CONCURRENCY clears run at the same time.
+AUTOCLEAR_MAX_CONCURRENCY = int(os.getenv("AUTOCLEAR_MAX_CONCURRENCY", "3"))
+AUTOCLEAR_JITTER_SECONDS = float(os.getenv("AUTOCLEAR_JITTER_SECONDS", "5"))
+_autoclear_heap: list[tuple[float, int]] = []
+_autoclear_due: dict[int, float] = {}  # guild_id -> due time of its live heap entry
+_autoclear_running: dict[int, float] = {}  # guild_id -> start time
+_autoclear_waiting: set[int] = set()  # due, waiting for a concurrency slot
+_autoclear_scheduler_task: asyncio.Task | None = None
+_autoclear_wakeup: asyncio.Event | None = None
+_autoclear_semaphore: asyncio.Semaphore | None = None
+_autoclear_job_tasks: set[asyncio.Task] = set()  # strong refs to running scheduler jobs
 _autoclear_locks: dict[int, asyncio.Lock] = {}
 
 
@@ -6528,65 +8427,21 @@ async def _autoclear_delete_all_then_send(
     *,
     send_early: bool,
 ) -> tuple[int, bool]:
-    deleted_total = 0
     sent_message: discord.Message | None = None
-    before_cursor: discord.Message | None = None
-
-    while True:
-        history_kwargs = {"limit": 100}
-        if before_cursor is not None:
-            history_kwargs["before"] = before_cursor
-
-        messages = [m async for m in channel.history(**history_kwargs)]
-        if not messages:
-            break
-
-        now = discord.utils.utcnow()
-        can_delete: list[discord.Message] = []
-        too_old: list[discord.Message] = []
-        for m in messages:
-            if sent_message is not None and m.id == sent_message.id:
-                continue
-
-            age_seconds = (now - m.created_at).total_seconds()
-            if age_seconds >= 14 * 24 * 3600:
-                too_old.append(m)
-            else:
-                can_delete.append(m)
-
-        # Fast path: bulk delete for messages <14 days
-        if can_delete:
-            try:
-                await channel.delete_messages(can_delete)
-                deleted_total += len(can_delete)
-            except discord.HTTPException:
-                for m in can_delete:
-                    try:
-                        await m.delete()
-                        deleted_total += 1
-                        await asyncio.sleep(0.15)
-                    except Exception:
-                        pass
-
-        # If we reached the "old messages" zone, send immediately (so it feels instant)
-        # Do this as soon as we detect old messages (even if we also deleted newer messages in this batch).
-        if send_early and sent_message is None and message_to_send and too_old:
-            try:
-                sent_message = await channel.send(str(message_to_send))
-                before_cursor = sent_message
-            except Exception:
-                sent_message = None
 
-        # Old 14d+ messages must be deleted one-by-one (Discord limitation)
-        for m in too_old:
-            try:
-                await m.delete()
-                deleted_total += 1
-                await asyncio.sleep(0.15)
-            except Exception:
-                pass
+    # If we reached the "old messages" zone, send immediately (so it feels instant).
+    # The history walk started before this message existed, so it won't be deleted.
+    async def _send_early():
+        nonlocal sent_message
+        try:
+            sent_message = await channel.send(str(message_to_send))
+        except Exception:
+            sent_message = None
 
-        await asyncio.sleep(0.25)
+    deleted_total = await _purge_messages(
+        channel,
+        on_old=_send_early if (send_early and message_to_send) else None,
+    )
 
     if message_to_send and sent_message is None:
         try:
@@ -6597,6 +8452,74 @@ async def _autoclear_delete_all_then_send(
     return deleted_total, bool(sent_message)
 
 
+def _remap_channel_references(guild_id: int, old_id: int, new_id: int):
+    """Point every config entry that referenced `old_id` at `new_id` (after a channel recreate)."""
+    guild_cfg = get_guild_config(guild_id)
+    updates: dict = {}
+
+    def _same(value) -> bool:
+        try:
+            return int(value) == int(old_id)
+        except (TypeError, ValueError):
+            return False
+
+    if _same(guild_cfg.get("poem_channel")):
+        updates["poem_channel"] = int(new_id)
+
+    rules = guild_cfg.get("channel_auto")
+    if isinstance(rules, list) and any(isinstance(r, dict) and _same(r.get("channel_id")) for r in rules):
+        for r in rules:
+            if isinstance(r, dict) and _same(r.get("channel_id")):
+                r["channel_id"] = int(new_id)
+        updates["channel_auto"] = rules
+
+    for section, key in (
+        ("auto_clear", "channel_id"),
+        ("giveaway", "channel_id"),
+        ("competition", "channel_id"),
+        ("moderation", "mod_log_channel"),
+        ("tickets", "log_channel_id"),
+    ):
+        cfg = guild_cfg.get(section)
+        if isinstance(cfg, dict) and _same(cfg.get(key)):
+            cfg[key] = int(new_id)
+            updates[section] = cfg
+
+    if updates:
+        update_guild_config(guild_id, updates)
+
+
+async def _autoclear_recreate_channel(
+    guild_id: int,
+    channel: discord.TextChannel,
+    message_to_send: str,
+) -> tuple[discord.TextChannel, bool]:
+    """Replace `channel` with an empty clone (name, topic, overwrites, category, position)."""
+    new_channel = await channel.clone(reason="AutoClear recreate")
+    try:
+        if new_channel.position != channel.position:
+            await new_channel.edit(position=channel.position, reason="AutoClear recreate")
+        await channel.delete(reason="AutoClear recreate")
+    except Exception:
+        # Don't leave a duplicate behind if the swap failed half-way.
+        try:
+            await new_channel.delete(reason="AutoClear recreate failed")
+        except Exception:
+            pass
+        raise
+
+    _remap_channel_references(guild_id, channel.id, new_channel.id)
+
+    sent = False
+    if message_to_send:
+        try:
+            await new_channel.send(str(message_to_send))
+            sent = True
+        except Exception:
+            sent = False
+    return new_channel, sent
+
+
 async def _autoclear_run_once(guild_id: int) -> str:
     acfg = get_autoclear_config(guild_id)
 
@@ -6617,6 +8540,15 @@ async def _autoclear_run_once(guild_id: int) -> str:
         return "⏳ Already running | العملية شغالة حالياً"
 
     async with lock:
+        if str(acfg.get("mode") or "delete") == "recreate":
+            try:
+                new_channel, sent = await _autoclear_recreate_channel(guild_id, channel, message_to_send)
+                sent_txt = "✅ Sent | ✅ تم الإرسال" if sent else "⚠️ Not sent | لم يتم الإرسال"
+                return f"♻️ Recreated {new_channel.mention} | تم إعادة إنشاء الروم • {sent_txt} • every {interval}s | كل {interval} ثانية"
+            except Exception as e:
+                # e.g. missing Manage Channels: fall back to deleting messages.
+                logger.error(f"[AutoClear:{guild_id}] recreate failed, deleting messages instead: {e}")
+
         deleted_count, sent = await _autoclear_delete_all_then_send(
             channel,
             message_to_send,
@@ -6627,38 +8559,125 @@ async def _autoclear_run_once(guild_id: int) -> str:
     return f"✅ Cleared {deleted_count} | تم حذف {deleted_count} رسالة • {sent_txt} • every {interval}s | كل {interval} ثانية"
 
 
-async def _autoclear_worker(guild_id: int):
-    await bot.wait_until_ready()
-    while not bot.is_closed():
-        acfg = get_autoclear_config(guild_id)
-        if not acfg.get("enabled"):
-            break
+def _autoclear_interval(acfg: dict) -> int:
+    interval = int(acfg.get("interval_seconds") or 60)
+    return max(20, min(interval, 24 * 3600))
 
-        interval = int(acfg.get("interval_seconds") or 60)
-        interval = max(20, min(interval, 24 * 3600))
 
-        start_time = asyncio.get_event_loop().time()
-        try:
-            result = await _autoclear_run_once(guild_id)
-            logger.info(f"[AutoClear:{guild_id}] {result}")
-        except Exception as e:
-            logger.error(f"[AutoClear:{guild_id}] error: {e}")
+def _autoclear_schedule(guild_id: int, delay: float):
+    """(Re)schedule a guild's next run `delay` seconds from now, plus jitter."""
+    gid = int(guild_id)
+    due = asyncio.get_running_loop().time() + max(0.0, delay) + random.uniform(0.0, AUTOCLEAR_JITTER_SECONDS)
+    _autoclear_due[gid] = due
+    heapq.heappush(_autoclear_heap, (due, gid))
+    if _autoclear_wakeup is not None:
+        _autoclear_wakeup.set()
+
+
+def _autoclear_get_semaphore() -> asyncio.Semaphore:
+    """The global AutoClear slot limit, shared by scheduled runs and the slash commands."""
+    global _autoclear_semaphore
+    if _autoclear_semaphore is None:
+        _autoclear_semaphore = asyncio.Semaphore(max(1, AUTOCLEAR_MAX_CONCURRENCY))
+    return _autoclear_semaphore
 
-        elapsed = asyncio.get_event_loop().time() - start_time
-        await asyncio.sleep(max(0, interval - elapsed))
 
+async def _autoclear_run_limited(guild_id: int) -> str:
+    async with _autoclear_get_semaphore():
+        return await _autoclear_run_once(guild_id)
+
+
+async def _autoclear_job(guild_id: int):
+    _autoclear_waiting.add(guild_id)
+    try:
+        async with _autoclear_get_semaphore():
+            _autoclear_waiting.discard(guild_id)
+            acfg = get_autoclear_config(guild_id)
+            if not acfg.get("enabled") or guild_id not in _autoclear_due:
+                _autoclear_due.pop(guild_id, None)
+                return
+
+            start_time = asyncio.get_running_loop().time()
+            _autoclear_running[guild_id] = start_time
+            try:
+                result = await _autoclear_run_once(guild_id)
+                logger.info(f"[AutoClear:{guild_id}] {result}")
+            except Exception as e:
+                logger.error(f"[AutoClear:{guild_id}] error: {e}")
+            finally:
+                _autoclear_running.pop(guild_id, None)
+
+            # Stopped while running?
+            if guild_id not in _autoclear_due:
+                return
+            elapsed = asyncio.get_running_loop().time() - start_time
+            _autoclear_schedule(guild_id, _autoclear_interval(get_autoclear_config(guild_id)) - elapsed)
+    finally:
+        _autoclear_waiting.discard(guild_id)
+
+
+async def _autoclear_scheduler():
+    # Started from on_shard_ready: jobs only exist for guilds whose shard is up.
+    global _autoclear_wakeup
+    _autoclear_wakeup = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    while not bot.is_closed():
+        _autoclear_wakeup.clear()
+        if not _autoclear_heap:
+            await _autoclear_wakeup.wait()
+            continue
+
+        delay = _autoclear_heap[0][0] - loop.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(_autoclear_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
 
-def _autoclear_start_task(guild_id: int):
-    existing = _autoclear_tasks.get(int(guild_id))
-    if existing and not existing.done():
+        due, gid = heapq.heappop(_autoclear_heap)
+        if _autoclear_due.get(gid) != due:
+            continue  # stopped or rescheduled since
+        if gid in _autoclear_running or gid in _autoclear_waiting:
+            continue  # the running job reschedules itself
+        task = asyncio.create_task(_autoclear_job(gid))
+        _autoclear_job_tasks.add(task)
+        task.add_done_callback(_autoclear_job_tasks.discard)
+
+
+def _autoclear_start_task(guild_id: int, delay: float = 0.0):
+    """Add a guild to the AutoClear scheduler (first run after `delay` seconds)."""
+    global _autoclear_scheduler_task
+    if _autoclear_scheduler_task is None or _autoclear_scheduler_task.done():
+        _autoclear_scheduler_task = asyncio.create_task(_autoclear_scheduler())
+    gid = int(guild_id)
+    if gid in _autoclear_due:
         return
-    _autoclear_tasks[int(guild_id)] = asyncio.create_task(_autoclear_worker(int(guild_id)))
+    _autoclear_schedule(gid, delay)
 
 
 def _autoclear_stop_task(guild_id: int):
-    task = _autoclear_tasks.pop(int(guild_id), None)
-    if task and not task.done():
-        task.cancel()
+    # Heap entries for this guild become stale and are skipped when popped.
+    _autoclear_due.pop(int(guild_id), None)
+
+
+def _autoclear_queue_text(guild_id: int) -> str:
+    gid = int(guild_id)
+    now = asyncio.get_running_loop().time()
+    if gid in _autoclear_running:
+        mine = f"running for {now - _autoclear_running[gid]:.0f}s | شغالة"
+    elif gid in _autoclear_waiting:
+        mine = "waiting for a slot | بانتظار دورها"
+    elif gid in _autoclear_due:
+        mine = f"next run in {max(0.0, _autoclear_due[gid] - now):.0f}s | التشغيل القادم"
+    else:
+        mine = "not scheduled | غير مجدولة"
+    return (
+        f"{mine}\n"
+        f"🌐 Scheduler | المجدول: {len(_autoclear_due)} jobs, {len(_autoclear_running)}/{max(1, AUTOCLEAR_MAX_CONCURRENCY)} running, "
+        f"{len(_autoclear_waiting)} waiting"
+    )
 
 
 @bot.tree.command(name="autoclear_setchannel", description="AutoClear: set channel | تحديد روم الحذف")
@@ -6780,6 +8799,44 @@ async def autoclear_fast(interaction: discord.Interaction, enabled: bool):
         await interaction.response.send_message(f"❌ Error | خطأ: {str(e)}", ephemeral=True)
 
 
+@bot.tree.command(name="autoclear_mode", description="AutoClear: clear mode | طريقة الحذف")
+@app_commands.describe(mode="delete = delete messages, recreate = clone channel | حذف الرسائل أو إعادة إنشاء الروم")
+@app_commands.choices(
+    mode=[
+        app_commands.Choice(name="delete messages | حذف الرسائل", value="delete"),
+        app_commands.Choice(name="recreate channel | إعادة إنشاء الروم", value="recreate"),
+    ]
+)
+async def autoclear_mode(interaction: discord.Interaction, mode: app_commands.Choice[str]):
+    try:
+        if not interaction.user.guild_permissions.manage_channels:
+            return await interaction.response.send_message(
+                "❌ Manage Channels required | تحتاج صلاحية إدارة القنوات",
+                ephemeral=True,
+            )
+
+        mod_cfg = get_mod_config(interaction.guild_id)
+        if not is_mod_authorized(interaction.user, mod_cfg, action="clear"):
+            return await interaction.response.send_message(
+                "❌ Not allowed | غير مسموح لك",
+                ephemeral=True,
+            )
+
+        acfg = get_autoclear_config(interaction.guild_id)
+        acfg["mode"] = mode.value
+        update_guild_config(interaction.guild_id, {"auto_clear": acfg})
+        await interaction.response.send_message(
+            (
+                "♻️ Recreate mode: the channel is cloned and the old one deleted | سيتم نسخ الروم وحذف القديمة"
+                if mode.value == "recreate"
+                else "🗑️ Delete mode: messages are deleted | سيتم حذف الرسائل"
+            ),
+            ephemeral=True,
+        )
+    except Exception as e:
+        await interaction.response.send_message(f"❌ Error | خطأ: {str(e)}", ephemeral=True)
+
+
 @bot.tree.command(name="autoclear_start", description="AutoClear: start | تشغيل الحذف التلقائي")
 async def autoclear_start(interaction: discord.Interaction):
     try:
@@ -6807,9 +8864,9 @@ async def autoclear_start(interaction: discord.Interaction):
         update_guild_config(interaction.guild_id, {"auto_clear": acfg})
 
         await interaction.response.defer(ephemeral=True)
-        # Run once immediately, then loop
-        result = await _autoclear_run_once(interaction.guild_id)
-        _autoclear_start_task(interaction.guild_id)
+        # Run once immediately, then let the scheduler repeat it
+        result = await _autoclear_run_limited(interaction.guild_id)
+        _autoclear_start_task(interaction.guild_id, delay=_autoclear_interval(acfg))
 
         await interaction.followup.send(
             "🚀 Started | تم التشغيل\n" + result,
@@ -6855,6 +8912,7 @@ async def autoclear_status(interaction: discord.Interaction):
         enabled = "✅ ON | شغال" if acfg.get("enabled") else "⛔ OFF | متوقف"
         interval = int(acfg.get("interval_seconds") or 60)
         send_early = "✅" if acfg.get("send_early", True) else "❌"
+        mode = "♻️ recreate" if acfg.get("mode") == "recreate" else "🗑️ delete"
         msg = str(acfg.get("message") or "").strip() or "(empty)"
 
         await interaction.response.send_message(
@@ -6862,7 +8920,9 @@ async def autoclear_status(interaction: discord.Interaction):
             f"📍 Channel | الروم: {ch}\n"
             f"⏱️ Interval | المدة: {interval}s\n"
             f"⚡ Send early | إرسال سريع: {send_early}\n"
-            f"📝 Message | الرسالة: {msg}",
+            f"🧹 Mode | الطريقة: {mode}\n"
+            f"📝 Message | الرسالة: {msg}\n"
+            f"🗓️ Queue | الجدول: {_autoclear_queue_text(interaction.guild_id)}",
             ephemeral=True,
         )
     except Exception as e:
@@ -6886,7 +8946,7 @@ async def autoclear_now(interaction: discord.Interaction):
             )
 
         await interaction.response.defer(ephemeral=True)
-        result = await _autoclear_run_once(interaction.guild_id)
+        result = await _autoclear_run_limited(interaction.guild_id)
         await interaction.followup.send(result, ephemeral=True)
     except Exception as e:
         try:
@@ -6894,6 +8954,28 @@ async def autoclear_now(interaction: discord.Interaction):
         except Exception:
             await interaction.response.send_message(f"❌ Error | خطأ: {str(e)}", ephemeral=True)
 
+
+async def _add_reactions(message: discord.Message, emojis):
+    """Add reactions in order, ignoring failures.
+
+    Reactions on one message share a single rate-limit bucket, so firing them
+    concurrently would not finish sooner and would only scramble their order.
+    """
+    for emoji in emojis:
+        try:
+            await message.add_reaction(emoji)
+        except Exception:
+            pass
+
+
+async def _run_concurrently(label: str, *aws):
+    """Await independent API calls (different rate-limit routes) together and log failures."""
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"{label} error: {result}")
+
+
 # Shortcut command handler
 @bot.event
 async def on_message(message):
@@ -6903,12 +8985,15 @@ async def on_message(message):
     if not message.guild:
         return await bot.process_commands(message)
 
+    index = _get_message_index(message.guild.id)
+    if not index["all_channels"] and message.channel.id not in index["channels"]:
+        return await bot.process_commands(message)
+
     guild_cfg = get_guild_config(message.guild.id)
 
     # ----- Poem channel processing (per server) -----
     try:
-        poem_channel_id = guild_cfg.get("poem_channel")
-        if poem_channel_id and int(poem_channel_id) == message.channel.id:
+        if index["poem_channel"] == message.channel.id:
             embed = discord.Embed(
                 title="𝐓𝐑 • 𝐏𝐨𝐞𝐦𝐬",
                 description=f"\n\n**{message.content}**\n\n",
@@ -6925,23 +9010,14 @@ async def on_message(message):
 
             embed_message = await message.channel.send(embed=embed)
 
+            # Reactions, the image and the delete hit different routes: run them together.
+            tasks = [message.delete()]
             if guild_cfg.get("auto_react") and guild_cfg.get("react_emojis"):
-                for emoji in guild_cfg.get("react_emojis", []):
-                    try:
-                        await embed_message.add_reaction(str(emoji).strip())
-                    except Exception:
-                        pass
-
+                emojis = [str(emoji).strip() for emoji in guild_cfg.get("react_emojis", [])]
+                tasks.append(_add_reactions(embed_message, emojis))
             if guild_cfg.get("show_image") and guild_cfg.get("image_url"):
-                try:
-                    await message.channel.send(str(guild_cfg.get("image_url")).strip())
-                except Exception:
-                    pass
-
-            try:
-                await message.delete()
-            except Exception:
-                pass
+                tasks.append(message.channel.send(str(guild_cfg.get("image_url")).strip()))
+            await _run_concurrently("Poem follow-up", *tasks)
 
             return
     except Exception as e:
@@ -6949,32 +9025,19 @@ async def on_message(message):
 
     # ----- Auto replies -----
     try:
-        for rule in (guild_cfg.get("auto_replies") or []):
-            if not rule or not rule.get("enabled", True):
-                continue
-
-            allowed_roles = rule.get("allowed_role_ids")
-            if isinstance(allowed_roles, list) and allowed_roles:
-                if isinstance(message.author, discord.Member) and not _member_has_any_role(message.author, allowed_roles):
-                    continue
-
-            trigger = str(rule.get("trigger", "")).strip()
-            reply = str(rule.get("reply", "")).strip()
-            if not trigger or not reply:
-                continue
+        rules = guild_cfg.get("auto_replies")
+        if rules and index["auto_replies"]:
+            for rule in _get_auto_reply_matcher(message.guild.id, rules).matches(message.content):
+                allowed_roles = rule["allowed_role_ids"]
+                if allowed_roles:
+                    if isinstance(message.author, discord.Member) and not _member_has_any_role(message.author, allowed_roles):
+                        continue
 
-            if _matches_trigger(
-                message.content.strip(),
-                trigger,
-                match_type=_normalize_match_type(rule.get("match")),
-                case_sensitive=bool(rule.get("case_sensitive", False)),
-            ):
-                mention = bool(rule.get("mention", False))
-                mode = _normalize_reply_mode(rule.get("mode"))
-                content = f"{message.author.mention} {reply}" if mention else reply
+                mention = rule["mention"]
+                content = f"{message.author.mention} {rule['reply']}" if mention else rule["reply"]
                 allowed = discord.AllowedMentions(users=mention, roles=False, everyone=False, replied_user=False)
 
-                if mode == "reply":
+                if rule["mode"] == "reply":
                     await message.reply(content, mention_author=False, allowed_mentions=allowed)
                 else:
                     await message.channel.send(content, allowed_mentions=allowed)
@@ -6984,32 +9047,28 @@ async def on_message(message):
 
     # ----- Channel auto reply/react rules -----
     try:
-        for rule in (guild_cfg.get("channel_auto") or []):
-            if not rule or not rule.get("enabled", True):
-                continue
-            if int(rule.get("channel_id", 0) or 0) != message.channel.id:
-                continue
-
-            reply = str(rule.get("reply", "")).strip()
-            if reply:
-                content = f"{message.author.mention} {reply}" if rule.get("mention", False) else reply
-                await message.channel.send(content, allowed_mentions=discord.AllowedMentions(users=bool(rule.get("mention", False))))
-
-            for emoji in (rule.get("reactions") or []):
-                try:
-                    await message.add_reaction(str(emoji).strip())
-                except Exception:
-                    pass
+        rules = index["channel_auto"].get(message.channel.id, ())
+
+        async def _send_replies():
+            # Same channel route: keep replies in rule order.
+            for rule in rules:
+                reply = rule["reply"]
+                if reply:
+                    content = f"{message.author.mention} {reply}" if rule["mention"] else reply
+                    await message.channel.send(content, allowed_mentions=discord.AllowedMentions(users=rule["mention"]))
+
+        if rules:
+            emojis = [emoji for rule in rules for emoji in rule["reactions"]]
+            await _run_concurrently("Channel auto", _send_replies(), _add_reactions(message, emojis))
     except Exception as e:
         logger.error(f"Channel auto error: {e}")
 
     # ----- Giveaway custom shortcut word -----
     try:
-        gw = get_giveaway_config(message.guild.id)
-        word = str(gw.get("shortcut_word") or "").strip()
+        word = index["shortcut_word"]
         if word:
             content = str(message.content or "").strip()
-            if content.lower() == word.lower():
+            if content.lower() == word:
                 # Post an interaction button (modals require interactions)
                 await message.channel.send(
                     "🎁 Click to open the giveaway form | اضغط لفتح نموذج السحب",
@@ -7020,7 +9079,7 @@ async def on_message(message):
         pass
     
     # Check for shortcuts
-    if message.guild:
+    if index["mod_shortcuts"]:
         mod_cfg = get_mod_config(message.guild.id)
         shortcuts = mod_cfg.get("shortcuts", {})
         
@@ -7067,9 +9126,9 @@ async def on_message(message):
                             await message.delete()
                         except Exception:
                             pass
-                        deleted = await message.channel.purge(limit=amount)
+                        deleted = await _purge_messages(message.channel, limit=amount)
                         
-                        notify = await message.channel.send(f"✅ Deleted {len(deleted)} messages")
+                        notify = await message.channel.send(f"✅ Deleted {deleted} messages")
                         await discord.utils.sleep_until(discord.utils.utcnow() + timedelta(seconds=3))
                         await notify.delete()
 
@@ -7449,6 +9508,125 @@ async def on_message(message):
     await bot.process_commands(message)
 
 
+# Reaction-role changes are queued per guild and applied by one worker per guild, so
+# react/unreact spam for a member collapses into its final state and requests don't
+# race each other for the guild's member-role rate-limit bucket. The worker spaces its
+# role requests ROLE_QUEUE_MIN_INTERVAL_SECONDS apart so a burst drains at a steady rate
+# instead of running into 429s; /role_queue and the cluster stats show the backlog.
+ROLE_QUEUE_MIN_INTERVAL_SECONDS = float(os.getenv("ROLE_QUEUE_MIN_INTERVAL_SECONDS", "0.5"))
+ROLE_QUEUE_REPORT_DEPTH = 25
+# guild_id -> {member_id: {role_id: wanted}} (dicts keep first-queued order)
+_role_queue_pending: dict[int, dict[int, dict[int, bool]]] = {}
+# guild_id -> {member_id: member from the latest reaction event}: its roles are current,
+# unlike a fetched-member LRU entry.
+_role_queue_members: dict[int, dict[int, discord.Member]] = {}
+_role_queue_tasks: dict[int, asyncio.Task] = {}
+
+
+def _role_queue_depth(guild_id: int | None = None) -> int:
+    """Members with pending role changes (one guild, or all guilds)."""
+    if guild_id is not None:
+        return len(_role_queue_pending.get(int(guild_id)) or {})
+    return sum(len(p) for p in _role_queue_pending.values())
+
+
+def _role_queue_eta_seconds(guild_id: int) -> float:
+    """Rough time to drain a guild's backlog at the queue's pace."""
+    requests = sum(len(c) for c in (_role_queue_pending.get(int(guild_id)) or {}).values())
+    return requests * ROLE_QUEUE_MIN_INTERVAL_SECONDS
+
+
+def _role_queue_put(
+    guild_id: int, member_id: int, role_ids: list[int], add: bool, member: discord.Member | None = None
+):
+    guild_id = int(guild_id)
+    pending = _role_queue_pending.setdefault(guild_id, {})
+    changes = pending.setdefault(int(member_id), {})
+    for role_id in role_ids:
+        changes[int(role_id)] = add
+    members = _role_queue_members.setdefault(guild_id, {})
+    if member is not None:
+        members[int(member_id)] = member
+    else:
+        members.pop(int(member_id), None)
+
+    depth = len(pending)
+    if depth and depth % ROLE_QUEUE_REPORT_DEPTH == 0:
+        logger.info(f"Role queue backlog for guild {guild_id}: {depth} members")
+
+    task = _role_queue_tasks.get(guild_id)
+    if task is None or task.done():
+        _role_queue_tasks[guild_id] = asyncio.create_task(_role_queue_worker(guild_id))
+
+
+async def _role_queue_worker(guild_id: int):
+    pending = _role_queue_pending.get(guild_id) or {}
+    members = _role_queue_members.setdefault(guild_id, {})
+    try:
+        while pending:
+            member_id = next(iter(pending))
+            changes = pending.pop(member_id)
+            member = members.pop(member_id, None)
+
+            guild = bot.get_guild(guild_id)
+            if not guild:
+                pending.clear()
+                break
+
+            # Event member or gateway cache: roles are current, so unchanged ones are skipped.
+            # A member from the LRU/API may be minutes old, so every change is sent (the role
+            # endpoints are idempotent).
+            member = member or guild.get_member(member_id)
+            fresh = member is not None
+            if member is None:
+                try:
+                    member = await _get_member(guild, member_id)
+                except Exception:
+                    continue
+            if not member or member.bot:
+                continue
+
+            # Only the final wanted state counts.
+            have = {r.id for r in member.roles}
+            adds, removes = [], []
+            for role_id, want in changes.items():
+                role = guild.get_role(role_id)
+                if role is None or (fresh and want == (role_id in have)):
+                    continue
+                (adds if want else removes).append(role)
+            try:
+                if adds:
+                    await member.add_roles(*adds, reason="Competition reaction role")
+                if removes:
+                    await member.remove_roles(*removes, reason="Competition reaction role removed")
+            except Exception as e:
+                logger.error(f"Reaction role update failed for {member_id} in guild {guild_id}: {e}")
+            if adds or removes:
+                _member_lru_forget(guild_id, member_id)
+
+            if (adds or removes) and ROLE_QUEUE_MIN_INTERVAL_SECONDS > 0:
+                # One request per role changed.
+                await asyncio.sleep(ROLE_QUEUE_MIN_INTERVAL_SECONDS * (len(adds) + len(removes)))
+    finally:
+        if not pending:
+            _role_queue_pending.pop(guild_id, None)
+            _role_queue_members.pop(guild_id, None)
+        _role_queue_tasks.pop(guild_id, None)
+
+
+@bot.tree.command(name="role_queue", description="Reaction-role queue status | حالة طابور رتب التفاعل")
+async def role_queue_status(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.manage_roles:
+        return await interaction.response.send_message("❌ Manage Roles required | تحتاج إدارة الرتب", ephemeral=True)
+    depth = _role_queue_depth(interaction.guild_id)
+    eta = _role_queue_eta_seconds(interaction.guild_id)
+    await interaction.response.send_message(
+        f"🧾 Pending members | أعضاء بالانتظار: {depth}\n"
+        f"⏱️ Estimated time | الوقت المتوقع: ~{int(eta)}s",
+        ephemeral=True,
+    )
+
+
 @bot.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     try:
@@ -7456,33 +9634,16 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
             return
         if not payload.guild_id:
             return
+        _giveaway_track_reaction(payload, added=True)
 
-        comp = get_competition_config(payload.guild_id)
-        if not comp.get("message_id") or not comp.get("role_id"):
-            return
-        if int(payload.message_id) != int(comp.get("message_id")):
-            return
-        if not _competition_emoji_matches(comp.get("reaction_emoji"), payload.emoji):
-            return
-
-        guild = bot.get_guild(payload.guild_id)
-        if not guild:
-            return
-
-        role = guild.get_role(int(comp.get("role_id")))
-        if not role:
+        role_ids = _reaction_role_lookup(payload.guild_id, payload.message_id, payload.emoji)
+        if not role_ids:
             return
 
-        member = guild.get_member(payload.user_id)
-        if not member:
-            try:
-                member = await guild.fetch_member(payload.user_id)
-            except Exception:
-                return
-        if not member or member.bot:
+        if payload.member is not None and payload.member.bot:
             return
 
-        await member.add_roles(role, reason="Competition reaction role")
+        _role_queue_put(payload.guild_id, payload.user_id, role_ids, add=True, member=payload.member)
     except Exception:
         pass
 
@@ -7494,33 +9655,13 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
             return
         if not payload.guild_id:
             return
+        _giveaway_track_reaction(payload, added=False)
 
-        comp = get_competition_config(payload.guild_id)
-        if not comp.get("message_id") or not comp.get("role_id"):
-            return
-        if int(payload.message_id) != int(comp.get("message_id")):
-            return
-        if not _competition_emoji_matches(comp.get("reaction_emoji"), payload.emoji):
-            return
-
-        guild = bot.get_guild(payload.guild_id)
-        if not guild:
-            return
-
-        role = guild.get_role(int(comp.get("role_id")))
-        if not role:
-            return
-
-        member = guild.get_member(payload.user_id)
-        if not member:
-            try:
-                member = await guild.fetch_member(payload.user_id)
-            except Exception:
-                return
-        if not member or member.bot:
+        role_ids = _reaction_role_lookup(payload.guild_id, payload.message_id, payload.emoji)
+        if not role_ids:
             return
 
-        await member.remove_roles(role, reason="Competition reaction role removed")
+        _role_queue_put(payload.guild_id, payload.user_id, role_ids, add=False)
     except Exception:
         pass
 
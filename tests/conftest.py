@@ -0,0 +1,75 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_main():
+    # main.py runs the bot at import time; with an empty token it only logs and returns.
+    saved = os.environ.get("DISCORD_BOT_TOKEN")
+    os.environ["DISCORD_BOT_TOKEN"] = ""
+    try:
+        return importlib.import_module("main")
+    finally:
+        if saved is None:
+            os.environ.pop("DISCORD_BOT_TOKEN", None)
+        else:
+            os.environ["DISCORD_BOT_TOKEN"] = saved
+
+
+def _drain_writer(main):
+    main._config_executor.submit(lambda: None).result()
+
+
+def _reset_state(main):
+    main._config_cache = None
+    main._config_mtime = None
+    main._config_own_mtime = None
+    main._config_last_stat_at = 0.0
+    main._config_dirty_guilds.clear()
+    main._config_dirty_all = False
+    main._config_first_dirty_at = None
+    main._config_flush_handle = None
+    main._config_fragments.clear()
+    main._config_inflight_guilds.clear()
+    main._config_inflight_all = 0
+    main._config_reload_pending = False
+    main._giveaway_heap.clear()
+    main._giveaway_wakeup = None
+    main._giveaway_end_semaphore = None
+    main._giveaway_guild_locks.clear()
+    main._giveaway_end_attempts.clear()
+    main._giveaway_by_message.clear()
+    main._giveaway_emoji.clear()
+    main._giveaway_reconciled.clear()
+    main._giveaway_reconcile_events.clear()
+    main._giveaway_entrants.clear()
+    main._giveaway_entrant_changes.clear()
+    main._giveaway_entrant_flush_handle = None
+    main._role_queue_pending.clear()
+    main._role_queue_members.clear()
+    main._role_queue_tasks.clear()
+    main._open_tickets.clear()
+    main._open_tickets_by_owner.clear()
+    main._open_tickets_indexed.clear()
+    main._open_tickets_loaded = False
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """The bot module with its config, ticket and giveaway files under tmp_path."""
+    module = _import_main()
+    _reset_state(module)
+    monkeypatch.setattr(module, "CONFIG_BACKEND", "json")
+    monkeypatch.setattr(module, "CONFIG_FILE", str(tmp_path / "poem_config.json"))
+    monkeypatch.setattr(module, "CONFIG_DB_FILE", str(tmp_path / "poem_config.db"))
+    monkeypatch.setattr(module, "TICKET_DB_FILE", str(tmp_path / "tickets.db"))
+    monkeypatch.setattr(module, "GIVEAWAY_DB_FILE", str(tmp_path / "giveaways.db"))
+    yield module
+    _drain_writer(module)
+    # Nothing may be left for the atexit flushes to write outside tmp_path.
+    _reset_state(module)
+
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+
+import config_storage
+
+
+def _write(path, cfg, mtime=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_load_config_is_served_from_memory(main):
+    _write(main.CONFIG_FILE, {"servers": {"1": {"a": 1}}})
+    first = main.load_config()
+    _write(main.CONFIG_FILE, {"servers": {"1": {"a": 2}}})
+    # Within CONFIG_RELOAD_CHECK_SECONDS the file isn't even stat'ed again.
+    assert main.load_config() is first
+    assert first["servers"]["1"] == {"a": 1}
+
+
+def test_change_without_loop_writes_through(main):
+    _write(main.CONFIG_FILE, {"servers": {}})
+    main.update_guild_config(1, {"poem_channel": 5})
+    assert _read(main.CONFIG_FILE)["servers"]["1"]["poem_channel"] == 5
+    assert not main._config_dirty_guilds
+
+
+def test_debounced_flush_coalesces_changes(main, monkeypatch):
+    _write(main.CONFIG_FILE, {"servers": {}})
+    main.load_config()
+    monkeypatch.setattr(main, "CONFIG_FLUSH_DELAY_SECONDS", 0.05)
+    writes = []
+    real_write = main.write_config_text
+
+    def counting_write(path, text, **kwargs):
+        writes.append(path)
+        real_write(path, text, **kwargs)
+
+    monkeypatch.setattr(main, "write_config_text", counting_write)
+
+    async def scenario():
+        main.update_guild_config(1, {"poem_channel": 5})
+        main.update_guild_config(2, {"poem_channel": 6})
+        main.update_guild_config(1, {"auto_react": True})
+        assert writes == []
+        assert main._config_dirty_guilds == {"1", "2"}
+        await asyncio.sleep(0.2)
+        await asyncio.get_running_loop().run_in_executor(main._config_executor, lambda: None)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert len(writes) == 1
+    servers = _read(main.CONFIG_FILE)["servers"]
+    assert servers["1"]["poem_channel"] == 5 and servers["1"]["auto_react"] is True
+    assert servers["2"]["poem_channel"] == 6
+    assert not main._config_inflight_guilds
+    assert main._config_mtime == os.stat(main.CONFIG_FILE).st_mtime
+
+
+def test_max_delay_caps_debounce(main, monkeypatch):
+    _write(main.CONFIG_FILE, {"servers": {}})
+    main.load_config()
+    monkeypatch.setattr(main, "CONFIG_FLUSH_DELAY_SECONDS", 10.0)
+    monkeypatch.setattr(main, "CONFIG_FLUSH_MAX_DELAY_SECONDS", 0.1)
+
+    async def scenario():
+        for i in range(10):
+            main.update_guild_config(1, {"poem_channel": i})
+            await asyncio.sleep(0.03)
+        await asyncio.get_running_loop().run_in_executor(main._config_executor, lambda: None)
+
+    asyncio.run(scenario())
+    # Steady changes never go quiet for 10s, yet some of them reached the disk.
+    assert "1" in _read(main.CONFIG_FILE)["servers"]
+
+
+def test_serialized_fragments_match_memory(main):
+    _write(main.CONFIG_FILE, {"flag": True, "servers": {"1": {"a": 1}, "2": {"b": [1, 2]}}})
+    cfg = main.load_config()
+    main._serialize_config(True, set())
+    cfg["servers"]["2"]["b"].append(3)
+    cfg["servers"]["3"] = {"c": "ق"}
+    del cfg["servers"]["1"]
+    text = main._serialize_config(False, {"1", "2", "3"})
+    assert json.loads(text) == cfg
+    assert set(main._config_fragments) == {"2", "3"}
+
+
+def test_flush_merges_external_edit_of_other_guilds(main):
+    _write(main.CONFIG_FILE, {"servers": {"1": {"a": 1}, "2": {"b": 1}}}, mtime=1000)
+    main.load_config()
+    # The dashboard saves guild 2 after the bot loaded the file.
+    config_storage.modify_config(main.CONFIG_FILE, lambda cfg: cfg["servers"]["2"].update(b=2))
+    main.update_guild_config(1, {"a": 9})
+    servers = _read(main.CONFIG_FILE)["servers"]
+    assert servers["1"]["a"] == 9
+    assert servers["2"]["b"] == 2
+    # Memory lacks the dashboard edit, so the next check must reload.
+    assert main._config_mtime != os.stat(main.CONFIG_FILE).st_mtime
+
+
+def test_reload_keeps_unflushed_guilds(main):
+    _write(main.CONFIG_FILE, {"servers": {"1": {"a": 1}, "2": {"b": 1}}}, mtime=1000)
+    cfg = main.load_config()
+    cfg["servers"]["1"]["a"] = 9
+    main._config_dirty_guilds.add("1")
+    main._config_apply_reload(2000.0, {"servers": {"1": {"a": 1}, "2": {"b": 2}}})
+    assert cfg["servers"] == {"1": {"a": 9}, "2": {"b": 2}}
+    assert main._config_mtime == 2000.0
+
+
+def test_reload_ignores_own_write(main):
+    _write(main.CONFIG_FILE, {"servers": {"1": {"a": 1}}}, mtime=1000)
+    cfg = main.load_config()
+    main._config_apply_reload(main._config_mtime, {"servers": {}})
+    assert cfg["servers"] == {"1": {"a": 1}}
@@ -0,0 +1,321 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import config_storage
+
+
+@pytest.fixture
+def cfg_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_storage, "CONFIG_SNAPSHOT_COUNT", 3)
+    monkeypatch.setattr(config_storage, "CONFIG_SNAPSHOT_INTERVAL_SECONDS", 0)
+    return str(tmp_path / "poem_config.json")
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------------- Atomic writes / snapshots ----------------
+
+def test_write_config_replaces_file_and_leaves_no_temp(cfg_path, tmp_path):
+    config_storage.write_config(cfg_path, {"servers": {"1": {"name": "قناة"}}})
+    assert _read(cfg_path) == {"servers": {"1": {"name": "قناة"}}}
+    assert [p.name for p in tmp_path.iterdir() if ".tmp." in p.name] == []
+
+
+def test_failed_write_keeps_previous_file(cfg_path, tmp_path, monkeypatch):
+    config_storage.write_config(cfg_path, {"v": 1})
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(config_storage.os, "replace", broken_replace)
+        with pytest.raises(OSError):
+            config_storage.write_config(cfg_path, {"v": 2})
+    assert _read(cfg_path) == {"v": 1}
+    assert [p.name for p in tmp_path.iterdir() if ".tmp." in p.name] == []
+
+
+def test_snapshots_rotate_newest_first(cfg_path):
+    for v in range(1, 6):
+        config_storage.write_config(cfg_path, {"v": v})
+    assert _read(cfg_path) == {"v": 5}
+    assert [_read(config_storage.snapshot_path(cfg_path, i))["v"] for i in (1, 2, 3)] == [4, 3, 2]
+    assert not os.path.exists(config_storage.snapshot_path(cfg_path, 4))
+
+
+def test_snapshot_interval_limits_rotation(cfg_path, monkeypatch):
+    monkeypatch.setattr(config_storage, "CONFIG_SNAPSHOT_INTERVAL_SECONDS", 3600)
+    for v in range(1, 4):
+        config_storage.write_config(cfg_path, {"v": v})
+    # Only the first overwrite took a snapshot; the burst after it didn't rotate it out.
+    assert _read(config_storage.snapshot_path(cfg_path, 1)) == {"v": 1}
+    assert not os.path.exists(config_storage.snapshot_path(cfg_path, 2))
+
+
+def test_read_config_falls_back_to_newest_good_snapshot(cfg_path):
+    config_storage.write_config(cfg_path, {"v": 1})
+    config_storage.write_config(cfg_path, {"v": 2})
+    config_storage.write_config(cfg_path, {"v": 3})
+    with open(cfg_path, "w", encoding="utf-8") as f:
+        f.write('{"v": ')
+    with open(config_storage.snapshot_path(cfg_path, 1), "w", encoding="utf-8") as f:
+        f.write("[]")
+    assert config_storage.read_config(cfg_path) == {"v": 1}
+
+
+def test_read_config_missing_returns_none(cfg_path):
+    assert config_storage.read_config(cfg_path) is None
+
+
+def test_modify_config_uses_default_and_latest_file(cfg_path):
+    cfg = config_storage.modify_config(cfg_path, lambda c: c["servers"].setdefault("1", {}), {"servers": {}})
+    assert cfg == {"servers": {"1": {}}}
+    config_storage.modify_config(cfg_path, lambda c: c["servers"].setdefault("2", {}), {"servers": {}})
+    assert _read(cfg_path) == {"servers": {"1": {}, "2": {}}}
+
+
+def test_concurrent_modify_config_loses_no_update(cfg_path):
+    config_storage.write_config(cfg_path, {"n": 0})
+
+    def bump():
+        for _ in range(20):
+            config_storage.modify_config(cfg_path, lambda c: c.update(n=c["n"] + 1))
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert _read(cfg_path) == {"n": 80}
+
+
+def test_config_lock_times_out(cfg_path):
+    held = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with config_storage.config_lock(cfg_path):
+            held.set()
+            release.wait(5)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    held.wait(5)
+    try:
+        # flock is per process, so the competing writer has to be another process.
+        code = (
+            "import sys, config_storage\n"
+            "try:\n"
+            "    with config_storage.config_lock(sys.argv[1], timeout=0.2):\n"
+            "        sys.exit(1)\n"
+            "except TimeoutError:\n"
+            "    sys.exit(0)\n"
+        )
+        root = os.path.dirname(os.path.abspath(config_storage.__file__))
+        result = subprocess.run([sys.executable, "-c", code, cfg_path], cwd=root, timeout=30)
+        assert result.returncode == 0
+    finally:
+        release.set()
+        t.join()
+
+
+# ---------------- SQLite backend ----------------
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "poem_config.db")
+
+
+def _guild_rows(db_path):
+    conn = config_storage._sqlite_connect(db_path)
+    try:
+        return {gid: (json.loads(data), ts) for gid, data, ts in conn.execute("SELECT guild_id, data, updated_at FROM guilds")}
+    finally:
+        conn.close()
+
+
+def test_sqlite_round_trip(db_path):
+    cfg = {"flag": True, "servers": {"1": {"a": 1}, "2": {"b": "ب"}}}
+    config_storage.write_sqlite_config(db_path, cfg)
+    assert config_storage.read_sqlite_config(db_path) == cfg
+
+
+def test_sqlite_empty_multi_server_config_keeps_its_shape(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {}})
+    assert config_storage.read_sqlite_config(db_path) == {"servers": {}}
+    assert config_storage.read_sqlite_config(str(db_path) + ".other") is None
+
+
+def test_sqlite_upsert_touches_only_given_rows(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {"1": {"a": 1}, "2": {"b": 1}, "3": {"c": 1}}})
+    before = _guild_rows(db_path)
+    config_storage.write_sqlite_guilds(db_path, {"2": json.dumps({"b": 2}), "3": None})
+    after = _guild_rows(db_path)
+    assert set(after) == {"1", "2"}
+    assert after["1"] == before["1"]
+    assert after["2"][0] == {"b": 2} and after["2"][1] >= before["2"][1]
+
+
+def test_sqlite_replace_removes_unlisted_rows(db_path):
+    config_storage.write_sqlite_config(db_path, {"old": 1, "servers": {"1": {"a": 1}, "2": {"b": 1}}})
+    config_storage.write_sqlite_config(db_path, {"servers": {"2": {"b": 2}}})
+    assert config_storage.read_sqlite_config(db_path) == {"servers": {"2": {"b": 2}}}
+
+
+def test_sqlite_guilds_since(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {"1": {"a": 1}}})
+    (_, (_, seen)), = _guild_rows(db_path).items()
+    assert config_storage.read_sqlite_guilds_since(db_path, seen) == []
+    config_storage.write_sqlite_guilds(db_path, {"2": "{}"})
+    assert [row[0] for row in config_storage.read_sqlite_guilds_since(db_path, seen)] == ["2"]
+
+
+def test_modify_sqlite_config_writes_only_changed_rows(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {"1": {"a": 1}, "2": {"b": 1}}})
+    before = _guild_rows(db_path)
+
+    def change(cfg):
+        cfg["servers"]["2"]["b"] = 2
+        cfg["flag"] = True
+
+    config_storage.modify_sqlite_config(db_path, change)
+    after = _guild_rows(db_path)
+    assert after["1"] == before["1"]
+    assert after["2"][0] == {"b": 2}
+    assert config_storage.read_sqlite_config(db_path)["flag"] is True
+
+
+def test_modify_sqlite_config_keeps_rows_written_meanwhile(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {"1": {"a": 1}}})
+    worker = threading.Thread(target=config_storage.write_sqlite_guilds, args=(db_path, {"9": json.dumps({"w": 1})}))
+
+    def change(cfg):
+        # A bot worker saves its own guild while the dashboard edits guild 1: it waits
+        # for the dashboard's transaction, and the dashboard's save doesn't remove it.
+        worker.start()
+        worker.join(0.2)
+        assert worker.is_alive()
+        cfg["servers"]["1"]["a"] = 2
+
+    config_storage.modify_sqlite_config(db_path, change)
+    worker.join()
+    assert config_storage.read_sqlite_config(db_path)["servers"] == {"1": {"a": 2}, "9": {"w": 1}}
+
+
+def test_modify_sqlite_config_deletes_removed_guild(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {"1": {"a": 1}, "2": {"b": 1}}})
+    config_storage.modify_sqlite_config(db_path, lambda cfg: cfg["servers"].pop("1"))
+    assert config_storage.read_sqlite_config(db_path) == {"servers": {"2": {"b": 1}}}
+
+
+def test_modify_sqlite_config_rolls_back_on_error(db_path):
+    config_storage.write_sqlite_config(db_path, {"servers": {"1": {"a": 1}}})
+
+    def change(cfg):
+        cfg["servers"]["1"]["a"] = 2
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        config_storage.modify_sqlite_config(db_path, change)
+    assert config_storage.read_sqlite_config(db_path) == {"servers": {"1": {"a": 1}}}
+
+
+def test_migrate_json_to_sqlite_runs_once(cfg_path, db_path):
+    config_storage.write_config(cfg_path, {"servers": {"1": {"a": 1}, "2": {}}})
+    assert config_storage.migrate_json_to_sqlite(cfg_path, db_path) == 2
+    config_storage.write_config(cfg_path, {"servers": {"3": {}}})
+    assert config_storage.migrate_json_to_sqlite(cfg_path, db_path) == 0
+    assert config_storage.read_sqlite_config(db_path) == {"servers": {"1": {"a": 1}, "2": {}}}
+
+
+# ---------------- Giveaway entrants ----------------
+
+def test_giveaway_entrant_changes(tmp_path):
+    db = str(tmp_path / "giveaways.db")
+    assert config_storage.load_giveaway_entrants(db, [10]) == {10: set()}
+    config_storage.apply_giveaway_entrant_changes(db, {10: {1: True, 2: True}, 11: {3: True}})
+    config_storage.apply_giveaway_entrant_changes(db, {10: {1: False, 2: True, 4: False}})
+    assert config_storage.load_giveaway_entrants(db, [10, 11, 12]) == {10: {2}, 11: {3}, 12: set()}
+
+
+def test_replace_giveaway_entrants(tmp_path):
+    db = str(tmp_path / "giveaways.db")
+    config_storage.apply_giveaway_entrant_changes(db, {10: {1: True, 2: True}, 11: {3: True}})
+    config_storage.replace_giveaway_entrants(db, 10, [2, 5])
+    assert config_storage.load_giveaway_entrants(db, [10, 11]) == {10: {2, 5}, 11: {3}}
+    config_storage.replace_giveaway_entrants(db, 10, [])
+    assert config_storage.load_giveaway_entrants(db, [10, 11]) == {10: set(), 11: {3}}
+
+
+# ---------------- Ticket store ----------------
+
+@pytest.fixture
+def ticket_db(tmp_path):
+    return str(tmp_path / "tickets.db")
+
+
+def test_ticket_numbers_are_sequential_per_guild(ticket_db):
+    assert [config_storage.next_ticket_number(ticket_db, "1") for _ in range(3)] == [1, 2, 3]
+    assert config_storage.next_ticket_number(ticket_db, "2") == 1
+    assert config_storage.next_ticket_number(ticket_db, "1") == 4
+
+
+def test_ticket_number_respects_floor(ticket_db):
+    # The old config counter already handed out 41: continue after it, and never go back.
+    assert config_storage.next_ticket_number(ticket_db, "1", floor=41) == 42
+    assert config_storage.next_ticket_number(ticket_db, "1", floor=41) == 43
+    assert config_storage.next_ticket_number(ticket_db, "1", floor=2) == 44
+    assert config_storage.next_ticket_number(ticket_db, "1", floor=100) == 101
+
+
+def test_ticket_numbers_are_unique_across_threads(ticket_db):
+    numbers = []
+    lock = threading.Lock()
+
+    def allocate():
+        for _ in range(10):
+            n = config_storage.next_ticket_number(ticket_db, "1")
+            with lock:
+                numbers.append(n)
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(numbers) == list(range(1, 41))
+
+
+def _ticket_row(channel_id, guild_id=1, owner_id=5):
+    return (channel_id, guild_id, owner_id, 300, f"ticket-{channel_id}", 1000.0)
+
+
+def test_open_ticket_rows_round_trip(ticket_db):
+    config_storage.save_open_ticket(ticket_db, _ticket_row(10))
+    config_storage.save_open_ticket(ticket_db, _ticket_row(11, owner_id=6))
+    config_storage.save_open_ticket(ticket_db, (10, 1, 5, 301, "renamed", 1000.0))
+    config_storage.delete_open_tickets(ticket_db, [11, 99])
+    rows, indexed = config_storage.load_open_tickets(ticket_db)
+    assert rows == [(10, 1, 5, 301, "renamed", 1000.0)]
+    assert indexed == set()
+
+
+def test_replace_open_tickets_only_touches_one_guild(ticket_db):
+    config_storage.save_open_ticket(ticket_db, _ticket_row(10))
+    config_storage.save_open_ticket(ticket_db, _ticket_row(20, guild_id=2))
+    config_storage.replace_open_tickets(ticket_db, 1, [_ticket_row(12), _ticket_row(13, owner_id=7)])
+    rows, indexed = config_storage.load_open_tickets(ticket_db)
+    assert sorted(r[0] for r in rows) == [12, 13, 20]
+    assert indexed == {1}
+    config_storage.replace_open_tickets(ticket_db, 1, [])
+    rows, indexed = config_storage.load_open_tickets(ticket_db)
+    assert [r[0] for r in rows] == [20]
+    assert indexed == {1}
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+BOT_ID = 999
+
+
+@pytest.fixture
+def giveaway_guild(main, monkeypatch):
+    """Guild 1 with one active giveaway (message 10) whose entrants are known."""
+    monkeypatch.setattr(main.bot._connection, "user", SimpleNamespace(id=BOT_ID))
+    record = {
+        "message_id": 10, "channel_id": 5, "end_ts": int(time.time()), "prize": "Nitro",
+        "winners": 1, "host_id": 7, "reaction_emoji": "🎉",
+    }
+    with open(main.CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump({"servers": {"1": {"giveaway": {"active": [record]}}}}, f)
+    main.load_config()
+    main._giveaway_schedule(1, main.get_giveaway_config(1)["active"][0])
+    return main.get_giveaway_config(1)["active"][0]
+
+
+class FakeChannel:
+    def __init__(self, guild):
+        self.sent = []
+        self.failing_sends = 0
+        self.message = SimpleNamespace(id=10, guild=guild, reactions=[], edit=self._edit)
+
+    async def _edit(self, **kwargs):
+        pass
+
+    async def fetch_message(self, message_id):
+        return self.message
+
+    async def send(self, text):
+        # The message lands, but the caller never learns it did (timeout / reset).
+        self.sent.append(SimpleNamespace(author=SimpleNamespace(id=BOT_ID), content=text))
+        if self.failing_sends:
+            self.failing_sends -= 1
+            raise ConnectionResetError("connection reset")
+
+    async def history(self, limit, after):
+        for message in self.sent[-limit:]:
+            yield message
+
+
+def _ended_channel(main, monkeypatch):
+    guild = SimpleNamespace(id=1, name="Guild", me=None, get_member=lambda member_id: None)
+    channel = FakeChannel(guild)
+    monkeypatch.setattr(main.bot, "get_channel", lambda channel_id: channel)
+    monkeypatch.setattr(main, "build_giveaway_embed", lambda **kwargs: None)
+    return channel
+
+
+def test_watcher_skips_stale_heap_entries(main, monkeypatch):
+    main._giveaway_schedule(1, {"message_id": 10, "end_ts": 100})
+    main._giveaway_schedule(1, {"message_id": 11, "end_ts": 50})
+    main._giveaway_schedule(2, {"message_id": 12, "end_ts": 10**10})
+    main._giveaway_forget(11)
+    spawned = []
+    monkeypatch.setattr(main, "_giveaway_end_task", lambda guild_id, message_id: (guild_id, message_id))
+    monkeypatch.setattr(main, "_giveaway_spawn", spawned.append)
+    closed = iter([False, True])
+    monkeypatch.setattr(main.bot, "is_closed", lambda: next(closed))
+
+    asyncio.run(main._giveaway_watcher_loop())
+    assert spawned == [(1, 10)]
+    assert main._giveaway_heap == [(10**10, 2, 12)]
+
+
+def test_end_runs_bounded_and_one_per_guild(main, monkeypatch):
+    monkeypatch.setattr(main, "GIVEAWAY_END_CONCURRENCY", 2)
+    running = []
+    peak = {"all": 0, "guild 1": 0}
+
+    async def fake_end_due(guild_id, message_id):
+        running.append(guild_id)
+        peak["all"] = max(peak["all"], len(running))
+        peak["guild 1"] = max(peak["guild 1"], running.count(1))
+        await asyncio.sleep(0.02)
+        running.remove(guild_id)
+
+    monkeypatch.setattr(main, "_giveaway_end_due", fake_end_due)
+
+    async def scenario():
+        main._giveaway_ensure_runtime()
+        await asyncio.gather(*(main._giveaway_end_task(g, m) for g, m in [(1, 10), (1, 11), (2, 12), (3, 13)]))
+
+    asyncio.run(scenario())
+    assert peak == {"all": 2, "guild 1": 1}
+
+
+def test_end_retry_does_not_announce_twice(main, giveaway_guild, monkeypatch):
+    channel = _ended_channel(main, monkeypatch)
+    main._giveaway_reconciled.add(10)
+    main._giveaway_entrants[10] = {100, 101, 102}
+    channel.failing_sends = 1
+
+    async def scenario():
+        with pytest.raises(ConnectionResetError):
+            await main._giveaway_end_one(1, giveaway_guild)
+        claim = dict(giveaway_guild["announcement"])
+        await main._giveaway_end_one(1, giveaway_guild)
+        return claim
+
+    claim = asyncio.run(scenario())
+    assert [m.content for m in channel.sent] == [claim["text"]]
+    assert giveaway_guild["announcement"] == claim and len(claim["winners"]) == 1
+    assert claim["winners"][0] in {100, 101, 102}
+    assert giveaway_guild["announced"] is True
+
+
+def test_end_failure_is_retried_then_dropped(main, giveaway_guild, monkeypatch):
+    monkeypatch.setattr(main, "GIVEAWAY_END_MAX_ATTEMPTS", 2)
+
+    async def failing_end_one(guild_id, record):
+        raise RuntimeError("channel gone")
+
+    monkeypatch.setattr(main, "_giveaway_end_one", failing_end_one)
+
+    async def scenario():
+        main._giveaway_ensure_runtime()
+        await main._giveaway_end_task(1, 10)
+        assert main._giveaway_end_attempts == {10: 1}
+        assert main.get_giveaway_config(1)["active"] == [giveaway_guild]
+        assert max(entry[0] for entry in main._giveaway_heap) > time.time() + 30
+        await main._giveaway_end_task(1, 10)
+
+    asyncio.run(scenario())
+    assert main.get_giveaway_config(1)["active"] == []
+    assert 10 not in main._giveaway_by_message
+    assert main._giveaway_end_attempts == {}
+
+
+def _reaction(user_id, emoji="🎉", message_id=10, bot=False):
+    return SimpleNamespace(message_id=message_id, user_id=user_id, emoji=emoji, member=SimpleNamespace(bot=bot))
+
+
+async def _drain(main):
+    await asyncio.get_running_loop().run_in_executor(main._config_executor, lambda: None)
+
+
+def test_reactions_update_entrants_and_share_a_write(main, giveaway_guild, monkeypatch):
+    monkeypatch.setattr(main, "CONFIG_FLUSH_DELAY_SECONDS", 0.02)
+    writes = []
+    real_apply = main.apply_giveaway_entrant_changes
+
+    def counting_apply(db_path, changes):
+        writes.append(changes)
+        real_apply(db_path, changes)
+
+    monkeypatch.setattr(main, "apply_giveaway_entrant_changes", counting_apply)
+
+    async def scenario():
+        main._giveaway_track_reaction(_reaction(100), added=True)
+        main._giveaway_track_reaction(_reaction(101), added=True)
+        main._giveaway_track_reaction(_reaction(100), added=False)
+        main._giveaway_track_reaction(_reaction(102, bot=True), added=True)
+        main._giveaway_track_reaction(_reaction(103, emoji="👍"), added=True)
+        main._giveaway_track_reaction(_reaction(104, message_id=99), added=True)
+        main._giveaway_track_reaction(_reaction(BOT_ID), added=True)
+        await asyncio.sleep(0.1)
+        await _drain(main)
+
+    asyncio.run(scenario())
+    assert main._giveaway_entrants[10] == {101}
+    assert writes == [{10: {100: False, 101: True}}]
+    assert main.load_giveaway_entrants(main.GIVEAWAY_DB_FILE, [10]) == {10: {101}}
+
+
+def test_reconcile_replays_reactions_seen_while_paging(main, giveaway_guild, monkeypatch):
+    _ended_channel(main, monkeypatch)
+    main.apply_giveaway_entrant_changes(main.GIVEAWAY_DB_FILE, {10: {100: True}})
+
+    async def fetch_entrants(message, emoji):
+        # The REST list is paged while members keep reacting.
+        main._giveaway_track_reaction(_reaction(100), added=False)
+        main._giveaway_track_reaction(_reaction(103), added=True)
+        return [100, 101]
+
+    monkeypatch.setattr(main, "_giveaway_fetch_entrants", fetch_entrants)
+
+    async def scenario():
+        await main._giveaway_reconcile(1, 10)
+        await _drain(main)
+
+    asyncio.run(scenario())
+    assert main._giveaway_entrants[10] == {101, 103}
+    assert 10 in main._giveaway_reconciled
+    assert 10 not in main._giveaway_reconcile_events
+    assert main.load_giveaway_entrants(main.GIVEAWAY_DB_FILE, [10]) == {10: {101, 103}}
+
+
+def test_legacy_entrant_list_moves_to_the_store(main):
+    record = {"message_id": 20, "end_ts": 10**10, "entrants": ["5", 6]}
+    main._giveaway_schedule(1, record)
+    main._config_executor.submit(lambda: None).result()
+    assert "entrants" not in record
+    assert main._giveaway_entrants[20] == {5, 6}
+    assert main.load_giveaway_entrants(main.GIVEAWAY_DB_FILE, [20]) == {20: {5, 6}}
@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+
+
+class FakeMember:
+    def __init__(self, member_id, role_ids=(), bot=False, log=None):
+        self.id = member_id
+        self.bot = bot
+        self.roles = [SimpleNamespace(id=r) for r in role_ids]
+        self.calls = []
+        self.log = log if log is not None else []
+
+    async def add_roles(self, *roles, reason=None):
+        self.calls.append(("add", sorted(r.id for r in roles)))
+        self.log.append(self.id)
+
+    async def remove_roles(self, *roles, reason=None):
+        self.calls.append(("remove", sorted(r.id for r in roles)))
+        self.log.append(self.id)
+
+
+def _guild(main, monkeypatch, cached=(), role_ids=(1, 2, 3)):
+    members = {m.id: m for m in cached}
+    guild = SimpleNamespace(
+        id=1,
+        get_member=members.get,
+        get_role=lambda role_id: SimpleNamespace(id=role_id) if role_id in role_ids else None,
+    )
+    monkeypatch.setattr(main.bot, "get_guild", lambda guild_id: guild if guild_id == 1 else None)
+    monkeypatch.setattr(main, "ROLE_QUEUE_MIN_INTERVAL_SECONDS", 0)
+    return guild
+
+
+async def _drain_queue(main, guild_id=1):
+    task = main._role_queue_tasks.get(guild_id)
+    if task is not None:
+        await task
+
+
+def test_spam_collapses_into_final_state(main, monkeypatch):
+    member = FakeMember(5, role_ids=[2])
+    _guild(main, monkeypatch)
+
+    async def scenario():
+        main._role_queue_put(1, 5, [1, 2], True, member)
+        main._role_queue_put(1, 5, [1], False, member)
+        main._role_queue_put(1, 5, [1], True, member)
+        main._role_queue_put(1, 5, [3], False, member)
+        assert main._role_queue_depth(1) == 1
+        await _drain_queue(main)
+
+    asyncio.run(scenario())
+    # Role 2 is already held and role 3 isn't: the event member is current, so both are skipped.
+    assert member.calls == [("add", [1])]
+    assert main._role_queue_pending == {} and main._role_queue_tasks == {}
+
+
+def test_members_are_served_in_first_queued_order(main, monkeypatch):
+    order = []
+    first, second = FakeMember(5, log=order), FakeMember(6, log=order)
+    _guild(main, monkeypatch, cached=[first, second])
+
+    async def scenario():
+        main._role_queue_put(1, 5, [1], True)
+        main._role_queue_put(1, 6, [1], True)
+        main._role_queue_put(1, 5, [2], True)
+        await _drain_queue(main)
+
+    asyncio.run(scenario())
+    assert order == [5, 6]
+    assert first.calls == [("add", [1, 2])]
+
+
+def test_stale_member_gets_every_change(main, monkeypatch):
+    _guild(main, monkeypatch)
+    # A fetched/LRU member may predate a role change made elsewhere, so nothing is skipped.
+    stale = FakeMember(5, role_ids=[1])
+
+    async def get_member(guild, member_id):
+        return stale
+
+    monkeypatch.setattr(main, "_get_member", get_member)
+
+    async def scenario():
+        main._role_queue_put(1, 5, [1], True)
+        main._role_queue_put(1, 5, [2], False)
+        await _drain_queue(main)
+
+    asyncio.run(scenario())
+    assert stale.calls == [("add", [1]), ("remove", [2])]
+
+
+def test_bots_and_unknown_roles_are_ignored(main, monkeypatch):
+    bot_member = FakeMember(5, bot=True)
+    member = FakeMember(6)
+    _guild(main, monkeypatch, cached=[bot_member, member])
+
+    async def scenario():
+        main._role_queue_put(1, 5, [1], True)
+        main._role_queue_put(1, 6, [9], True)
+        await _drain_queue(main)
+
+    asyncio.run(scenario())
+    assert bot_member.calls == [] and member.calls == []
+
+
+def test_queue_is_paced_and_reports_its_backlog(main, monkeypatch):
+    members = [FakeMember(5), FakeMember(6), FakeMember(7)]
+    _guild(main, monkeypatch, cached=members)
+    monkeypatch.setattr(main, "ROLE_QUEUE_MIN_INTERVAL_SECONDS", 0.05)
+
+    async def scenario():
+        main._role_queue_put(1, 5, [1, 2], True)
+        main._role_queue_put(1, 6, [1], True)
+        main._role_queue_put(1, 7, [1], False)
+        assert main._role_queue_depth(1) == 3
+        assert main._role_queue_depth() == 3
+        assert abs(main._role_queue_eta_seconds(1) - 0.2) < 1e-9
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await _drain_queue(main)
+        return loop.time() - started
+
+    elapsed = asyncio.run(scenario())
+    # Three role requests; member 7 doesn't hold role 1, so nothing is sent for it.
+    assert elapsed >= 0.15
+    assert main._role_queue_depth(1) == 0
+
+
+def test_left_guild_drops_its_backlog(main, monkeypatch):
+    monkeypatch.setattr(main.bot, "get_guild", lambda guild_id: None)
+
+    async def scenario():
+        main._role_queue_put(1, 5, [1], True)
+        main._role_queue_put(1, 6, [1], True)
+        await _drain_queue(main)
+
+    asyncio.run(scenario())
+    assert main._role_queue_pending == {} and main._role_queue_members == {}
@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+def _channel(channel_id, guild, owner_id=None, name=None, category_id=300):
+    return SimpleNamespace(
+        id=channel_id,
+        guild=guild,
+        name=name or f"ticket-{channel_id}",
+        category_id=category_id,
+        topic=f"ticket_owner:{owner_id}" if owner_id else "",
+        created_at=datetime(2026, 1, 1, tzinfo=timezone.utc),
+    )
+
+
+def _guild(guild_id=1):
+    guild = SimpleNamespace(id=guild_id, text_channels=[])
+    guild.get_channel = lambda channel_id: next((c for c in guild.text_channels if c.id == channel_id), None)
+    return guild
+
+
+def _stored(main):
+    main._config_executor.submit(lambda: None).result()
+    rows, indexed = main.load_open_tickets(main.TICKET_DB_FILE)
+    return {r[0]: r for r in rows}, indexed
+
+
+def test_add_update_remove(main):
+    guild = _guild()
+    channel = _channel(10, guild)
+    main._ticket_index_add(channel, 5, opened_at=1000.0)
+    assert main._ticket_open_channels(1, 5) == {10}
+    assert main._ticket_owner_id(channel) == 5
+
+    channel.name, channel.category_id = "closed-10", 301
+    main._ticket_index_update(channel)
+    assert _stored(main)[0][10] == (10, 1, 5, 301, "closed-10", 1000.0)
+
+    main._ticket_index_remove(10)
+    assert main._ticket_open_channels(1, 5) == set()
+    assert _stored(main)[0] == {}
+
+
+def test_owner_falls_back_to_topic(main):
+    guild = _guild()
+    assert main._ticket_owner_id(_channel(10, guild, owner_id=7)) == 7
+    assert main._ticket_owner_id(_channel(11, guild)) is None
+
+
+def test_guild_is_imported_from_topics_once(main):
+    guild = _guild()
+    guild.text_channels = [_channel(10, guild, owner_id=5), _channel(11, guild, owner_id=6), _channel(12, guild)]
+    assert main._ticket_index_sync_guild(guild) == 2
+    assert main._ticket_open_channels(1, 6) == {11}
+    stored, indexed = _stored(main)
+    assert set(stored) == {10, 11} and indexed == {1}
+
+    # A later start loads the index from the store and only drops vanished channels.
+    main._open_tickets.clear()
+    main._open_tickets_by_owner.clear()
+    main._open_tickets_indexed.clear()
+    main._open_tickets_loaded = False
+    guild.text_channels = [guild.text_channels[0], _channel(13, guild, owner_id=8)]
+    assert main._ticket_index_sync_guild(guild) == 1
+    assert main._ticket_open_channels(1, 8) == set()
+    assert set(_stored(main)[0]) == {10}
+
+
+def test_rebuild_replaces_the_guild(main):
+    guild = _guild()
+    other = _guild(2)
+    main._ticket_index_add(_channel(20, other), 9)
+    main._ticket_index_add(_channel(10, guild), 5)
+    guild.text_channels = [_channel(11, guild, owner_id=5)]
+    assert main._ticket_index_sync_guild(guild, rebuild=True) == 1
+    assert main._ticket_open_channels(1, 5) == {11}
+    assert main._ticket_open_channels(2, 9) == {20}
+    assert set(_stored(main)[0]) == {11, 20}
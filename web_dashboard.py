@@ -1,11 +1,12 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-import json
 import os
 import requests
 from functools import wraps
 from dotenv import load_dotenv
 import logging
 
+from config_storage import load_full_config, modify_full_config
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,66 +28,66 @@ DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 
 def load_config():
     """Load multi-server configuration"""
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading config: {e}")
+    cfg = load_full_config(CONFIG_FILE)
+    if cfg is not None:
+        return cfg
     
     return {
         "servers": {}  # Format: {"server_id": {...settings...}}
     }
 
-def save_config(config):
-    """Save multi-server configuration"""
+def modify_config(change):
+    """Apply change(config) to the latest saved config and save it (bot flushes in between are kept)"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
+        modify_full_config(CONFIG_FILE, change, {"servers": {}})
         return True
     except Exception as e:
         print(f"Error saving config: {e}")
         return False
 
+def _default_server_config():
+    return {
+        "poem_channel": None,
+        "embed_color": "#9B59B6",
+        "show_image": True,
+        "image_url": "",
+        "auto_react": False,
+        "react_emojis": ["❤️", "🔥"],
+        "tickets": {},
+        "giveaway": _default_giveaway_config()
+    }
+
+def _default_giveaway_config():
+    return {
+        "channel_id": None,
+        "duration": "1h",
+        "winners": 1,
+        "emoji": "🎉",
+        "color": "#5865F2",
+        "image_url": ""
+    }
+
 def get_server_config(server_id):
     """Get config for specific server"""
     config = load_config()
-    if "servers" not in config:
-        config["servers"] = {}
-    
-    if server_id not in config["servers"]:
-        config["servers"][server_id] = {
-            "poem_channel": None,
-            "embed_color": "#9B59B6",
-            "show_image": True,
-            "image_url": "",
-            "auto_react": False,
-            "react_emojis": ["❤️", "🔥"],
-            "tickets": {},
-            "giveaway": {
-                "channel_id": None,
-                "duration": "1h",
-                "winners": 1,
-                "emoji": "🎉",
-                "color": "#5865F2",
-                "image_url": ""
-            }
-        }
-        save_config(config)
+    server_cfg = (config.get("servers") or {}).get(server_id)
+    if server_cfg is not None and "giveaway" in server_cfg:
+        return server_cfg
 
-    server_cfg = config["servers"][server_id]
-    if "giveaway" not in server_cfg:
-        server_cfg["giveaway"] = {
-            "channel_id": None,
-            "duration": "1h",
-            "winners": 1,
-            "emoji": "🎉",
-            "color": "#5865F2",
-            "image_url": ""
-        }
-        save_config(config)
+    def change(config):
+        # Only fill in what is still missing in the latest saved config.
+        servers = config.setdefault("servers", {})
+        if server_id not in servers:
+            servers[server_id] = _default_server_config()
+        servers[server_id].setdefault("giveaway", _default_giveaway_config())
+        saved.update(servers[server_id])
 
-    return server_cfg
+    saved = {}
+    if modify_config(change):
+        return saved
+    if server_cfg is None:
+        return _default_server_config()
+    return {**server_cfg, "giveaway": _default_giveaway_config()}
 
 def login_required(f):
     @wraps(f)
@@ -224,19 +225,19 @@ def update_server_config(server_id):
     """Update server configuration"""
     try:
         data = request.json
-        config = load_config()
-        
-        if "servers" not in config:
-            config["servers"] = {}
-        
-        if server_id not in config["servers"]:
-            config["servers"][server_id] = {}
         
-        # Update specific settings
-        for key, value in data.items():
-            config["servers"][server_id][key] = value
+        def change(config):
+            if "servers" not in config:
+                config["servers"] = {}
+            
+            if server_id not in config["servers"]:
+                config["servers"][server_id] = {}
+            
+            # Update specific settings
+            for key, value in data.items():
+                config["servers"][server_id][key] = value
         
-        if save_config(config):
+        if modify_config(change):
             return jsonify({"success": True, "message": "Settings updated!"})
         return jsonify({"success": False, "message": "Failed to save"}), 500
     except Exception as e: